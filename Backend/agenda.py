@@ -0,0 +1,102 @@
+"""Disponibilidad por intervalos según la duración de cada servicio.
+
+Las horas se manejan como minutos desde la medianoche. Un día es una
+lista ordenada de intervalos libres sin traslapes (la jornada del
+estilista menos sus citas activas); saber si una cita cabe es una
+búsqueda binaria y listar los inicios posibles es un solo recorrido.
+"""
+import os
+from bisect import bisect_right
+
+# Cada cuántos minutos se ofrece un inicio de cita
+AGENDA_PASO_MINUTOS = int(os.environ.get('AGENDA_PASO_MINUTOS', 30))
+# Duración de un servicio que no está en el catálogo
+DURACION_DEFAULT = 60
+
+
+def a_minutos(hora):
+    """time o 'HH:MM' a minutos desde la medianoche"""
+    if isinstance(hora, str):
+        horas, minutos = hora.split(":")[:2]
+        return int(horas) * 60 + int(minutos)
+    return hora.hour * 60 + hora.minute
+
+
+def a_hora(minutos):
+    """Minutos desde la medianoche a 'HH:MM'"""
+    return f"{minutos // 60:02d}:{minutos % 60:02d}"
+
+
+def _parsear_jornada(texto):
+    intervalos = []
+    for parte in texto.split(","):
+        inicio, _, fin = parte.strip().partition("-")
+        intervalos.append((a_minutos(inicio), a_minutos(fin)))
+    return tuple(intervalos)
+
+
+# Horario de atención de los estilistas que no tienen uno propio
+JORNADA = _parsear_jornada(os.environ.get('JORNADA', "09:00-19:00"))
+
+
+def fusionar(intervalos):
+    """Ordena y une los intervalos que se traslapan o se tocan"""
+    fusionados = []
+    for inicio, fin in sorted(intervalos):
+        if fusionados and inicio <= fusionados[-1][1]:
+            if fin > fusionados[-1][1]:
+                fusionados[-1] = (fusionados[-1][0], fin)
+        else:
+            fusionados.append((inicio, fin))
+    return fusionados
+
+
+def restar(base, quitar):
+    """base menos quitar; ambos ordenados y sin traslapes (ver fusionar)"""
+    resultado = []
+    j = 0
+    for inicio, fin in base:
+        while j < len(quitar) and quitar[j][1] <= inicio:
+            j += 1
+        k = j
+        while k < len(quitar) and quitar[k][0] < fin:
+            if quitar[k][0] > inicio:
+                resultado.append((inicio, quitar[k][0]))
+            inicio = max(inicio, quitar[k][1])
+            k += 1
+        if inicio < fin:
+            resultado.append((inicio, fin))
+    return resultado
+
+
+def inicios(intervalos, duracion, paso=None):
+    """Inicios alineados a paso en los que cabe una cita de duracion minutos"""
+    paso = paso or AGENDA_PASO_MINUTOS
+    for inicio, fin in intervalos:
+        minuto = -(-inicio // paso) * paso
+        while minuto + duracion <= fin:
+            yield minuto
+            minuto += paso
+
+
+class DiaAgenda:
+    """Intervalos libres de un estilista en un día"""
+
+    def __init__(self, jornada, citas, bloqueado=False):
+        self.jornada = fusionar(jornada)
+        self.libres = [] if bloqueado else restar(self.jornada, fusionar(citas))
+        self._inicios_libres = [inicio for inicio, _ in self.libres]
+
+    def en_jornada(self, inicio, duracion):
+        return any(a <= inicio and inicio + duracion <= b for a, b in self.jornada)
+
+    def cabe(self, inicio, duracion):
+        i = bisect_right(self._inicios_libres, inicio) - 1
+        return i >= 0 and inicio + duracion <= self.libres[i][1]
+
+    def horarios(self, duracion):
+        """Todos los inicios que ofrece la jornada, ocupados o no"""
+        return inicios(self.jornada, duracion)
+
+    def disponibles(self, duracion, desde=0):
+        return (m for m in inicios(self.libres, duracion) if m >= desde)
@@ -0,0 +1,166 @@
+"""Mantenimiento de las particiones mensuales de citas.
+
+Uso:
+    python archivar.py            crea las particiones que faltan y archiva los meses cerrados
+    python archivar.py --estado   muestra cada partición y si está archivada
+
+Pensado para correr una vez al día (un cron job de Render o similar).
+Crea la partición de cada mes hasta PARTICIONES_ADELANTE meses adelante,
+sacando de citas_sin_mes las citas que ya tuvieran.
+
+Un mes se archiva cuando quedaron atrás más de ARCHIVO_MESES meses
+completos y todas sus citas están cerradas (Confirmada o Cancelada). Su
+partición se mueve al tablespace ARCHIVO_TABLESPACE si está definido (un
+disco más barato) y se congela con VACUUM FREEZE, así el autovacuum ya no
+la vuelve a recorrer. Las consultas por fecha de los meses recientes no
+la tocan. Las cifras históricas salen de resumen_mensual, que mantiene un
+trigger y no depende de las filas archivadas.
+"""
+import os
+import re
+import sys
+from datetime import date
+
+from psycopg2 import sql
+
+from db import conectar
+
+# Meses completos, antes del actual, que se quedan sin archivar
+ARCHIVO_MESES = int(os.environ.get('ARCHIVO_MESES', 6))
+# Meses futuros que se dejan con su partición creada
+PARTICIONES_ADELANTE = int(os.environ.get('PARTICIONES_ADELANTE', 3))
+# Tablespace para las particiones archivadas (vacío: se quedan donde están)
+ARCHIVO_TABLESPACE = os.environ.get('ARCHIVO_TABLESPACE') or None
+# Identificador arbitrario del candado advisory (el de migrar.py es 4242001)
+CANDADO_ARCHIVO = 4242002
+
+ESTADOS_CERRADOS = ("Confirmada", "Cancelada")
+
+
+def sumar_meses(mes, n):
+    """Primer día del mes que está n meses después (o antes) del de mes"""
+    indice = mes.year * 12 + mes.month - 1 + n
+    return date(indice // 12, indice % 12 + 1, 1)
+
+
+def particiones(cur):
+    """[(mes, nombre, filas estimadas, tablespace, archivada)] de cada mes con partición"""
+    cur.execute("""
+        SELECT c.relname, c.reltuples, t.spcname, a.mes IS NOT NULL
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        LEFT JOIN pg_tablespace t ON t.oid = c.reltablespace
+        LEFT JOIN citas_meses_archivados a
+            ON a.mes = to_date(substring(c.relname FROM '^citas_(\\d{4}_\\d{2})$'), 'YYYY_MM')
+        WHERE i.inhparent = 'citas'::regclass
+        ORDER BY c.relname
+    """)
+    resultado = []
+    for nombre, filas, tablespace, archivada in cur.fetchall():
+        coincidencia = re.match(r"^citas_(\d{4})_(\d{2})$", nombre)
+        mes = date(int(coincidencia.group(1)), int(coincidencia.group(2)), 1) if coincidencia else None
+        resultado.append((mes, nombre, max(int(filas), 0), tablespace, archivada))
+    return resultado
+
+
+def crear_particiones(cur, hoy, salida=print):
+    """Crea las particiones hasta PARTICIONES_ADELANTE y las de meses que ya tengan citas sin partición"""
+    mes_actual = hoy.replace(day=1)
+    hasta = sumar_meses(mes_actual, PARTICIONES_ADELANTE + 1)
+    cur.execute("""
+        SELECT mes, crear_particion_citas(mes)
+        FROM (
+            SELECT generate_series(%(desde)s::date, %(hasta)s::date - 1, INTERVAL '1 month')::date AS mes
+            UNION
+            SELECT date_trunc('month', fecha)::date FROM citas_sin_mes WHERE fecha < %(hasta)s
+        ) AS meses
+        ORDER BY mes
+    """, {"desde": mes_actual, "hasta": hasta})
+    creadas = [mes for mes, creada in cur.fetchall() if creada]
+    for mes in creadas:
+        salida(f"Partición creada: citas_{mes:%Y_%m}")
+    return creadas
+
+
+def archivar_mes(cur, mes, nombre, salida=print):
+    """Archiva la partición de un mes si todas sus citas están cerradas; devuelve si lo hizo"""
+    tabla = sql.Identifier(nombre)
+    cur.execute(sql.SQL("""
+        SELECT COUNT(*), COUNT(*) FILTER (WHERE estado IS NULL OR estado NOT IN %s)
+        FROM {}
+    """).format(tabla), (ESTADOS_CERRADOS,))
+    filas, abiertas = cur.fetchone()
+    if abiertas:
+        salida(f"{mes:%Y-%m}: {abiertas} citas siguen abiertas, no se archiva")
+        return False
+
+    if ARCHIVO_TABLESPACE:
+        espacio = sql.Identifier(ARCHIVO_TABLESPACE)
+        cur.execute(sql.SQL("ALTER TABLE {} SET TABLESPACE {}").format(tabla, espacio))
+        cur.execute("SELECT indexrelid::regclass::text FROM pg_index WHERE indrelid = %s::regclass", (nombre,))
+        for (indice,) in cur.fetchall():
+            cur.execute(sql.SQL("ALTER INDEX {} SET TABLESPACE {}").format(sql.Identifier(indice), espacio))
+
+    cur.execute("INSERT INTO citas_meses_archivados (mes, filas) VALUES (%s, %s)", (mes, filas))
+    salida(f"{mes:%Y-%m}: {filas} citas archivadas")
+    return True
+
+
+def mantener(hoy=None, salida=print):
+    """Crea particiones y archiva los meses cerrados; devuelve los meses archivados"""
+    hoy = hoy or date.today()
+    limite = sumar_meses(hoy.replace(day=1), -ARCHIVO_MESES)
+
+    conn = conectar()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (CANDADO_ARCHIVO,))
+            if not cur.fetchone()[0]:
+                salida("Otro proceso está archivando; no se hace nada")
+                return []
+
+            crear_particiones(cur, hoy, salida)
+            conn.commit()
+
+            archivados = []
+            for mes, nombre, _, _, archivada in particiones(cur):
+                if mes is None or archivada or mes >= limite:
+                    continue
+                # Cada mes en su propia transacción
+                if archivar_mes(cur, mes, nombre, salida):
+                    archivados.append(nombre)
+                conn.commit()
+
+            cur.execute("SELECT pg_advisory_unlock(%s)", (CANDADO_ARCHIVO,))
+            conn.commit()
+
+        # VACUUM no corre dentro de una transacción
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            for nombre in archivados:
+                cur.execute(sql.SQL("VACUUM (FREEZE, ANALYZE) {}").format(sql.Identifier(nombre)))
+        return archivados
+    except Exception:
+        if not conn.autocommit:
+            conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def estado(salida=print):
+    conn = conectar()
+    try:
+        with conn.cursor() as cur:
+            for _, nombre, filas, tablespace, archivada in particiones(cur):
+                marca = "archivada" if archivada else "activa"
+                salida(f"{nombre}: ~{filas} filas, {marca}, tablespace {tablespace or 'por defecto'}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    if "--estado" in sys.argv:
+        estado()
+    else:
+        mantener()
@@ -0,0 +1,47 @@
+"""Configuración de gunicorn para servir la app en modo asíncrono (gevent).
+
+Uso:
+    gunicorn -c asincrono.py back:app
+
+Es la misma app, con las mismas rutas y respuestas: el worker de gevent
+atiende cada petición en un greenlet y psycogreen hace que psycopg2 ceda
+el control mientras espera a Postgres, así que un solo proceso puede
+tener cientos de peticiones en vuelo sin un hilo por cada una. Los locks,
+colas y semáforos de la app (pool de conexiones, cachés, eventos, cola
+de bcrypt) quedan parcheados por gevent al arrancar el worker.
+
+Como las peticiones ya no están limitadas por --threads, el pool de
+conexiones y los streams de /eventos se agrandan por defecto; se pueden
+ajustar con las mismas variables de siempre.
+
+Solo conviene si cada consulta tarda en ir y volver de la base (una base
+en otra región o proveedor). Con la base cerca los hilos del Procfile
+rinden más. Medido con benchmark.py correr --latencia-db en un núcleo,
+2 workers, 64 clientes, contra hilos con --threads 8:
+
+    ida y vuelta    hilos req/s    gevent req/s    p95 hilos / gevent
+    0 ms            380            180             210 / 950 ms
+    5 ms            264            208             343 / 1328 ms
+    10 ms           204            233             428 / 1170 ms
+    20 ms           122            251             740 / 1112 ms
+
+Aun cuando gana en peticiones por segundo, el p95 de gevent es peor:
+reparte el núcleo entre muchas más peticiones a la vez.
+"""
+import os
+
+from psycogreen.gevent import patch_psycopg
+
+worker_class = "gevent"
+# Peticiones simultáneas por worker
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 1000))
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+
+# La app lee estas variables al importarse, dentro de cada worker
+os.environ.setdefault('DB_POOL_MAX', '20')
+os.environ.setdefault('EVENTOS_MAX_CLIENTES', '200')
+
+
+def post_worker_init(worker):
+    # Después del monkey patch de gevent y antes de la primera conexión
+    patch_psycopg()
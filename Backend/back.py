@@ -1,37 +1,76 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, has_request_context, request, jsonify, stream_with_context
 from flask_cors import CORS
-import psycopg2
+import psycopg2.errors
 import psycopg2.extras
-import bcrypt
-from datetime import date, datetime
+from datetime import date, datetime, timedelta, timezone
+import base64
+import csv
+import hashlib
+import heapq
+import io
+import itertools
+import json
 import os
 import re
 
+from db import get_db, observar_escrituras
+import agenda
+import compresion
+import contrasenas
+import metricas
+from idempotencia import ENCABEZADO, ENCABEZADO_REPETIDA, idempotente
+from contrasenas import ServidorOcupado, hashear_contrasena, verificar_contrasena
+from sesiones import emitir_token, requiere_sesion, usuario_sesion
+from cache import CACHE_NOTIFY, CacheLRU, notificar
+from eventos import CANAL_EVENTOS, difusor, evento, notificar_evento, notificar_eventos
+from ocupacion import (
+    CANAL, indice_ocupacion, notificar_ocupacion, notificar_ocupacion_dias,
+    notificar_ocupaciones, payload_ocupacion
+)
+
 app = Flask(__name__)
+metricas.instalar(app)
+# Después de metricas: sus hooks corren antes, así metricas ve el 304
+compresion.instalar(app)
 
 CORS(app, resources={
     r"/*": {
         "origins": ["*"],
         "methods": ["GET", "POST", "PUT", "DELETE"],
-        "allow_headers": ["Content-Type"]
+        "allow_headers": ["Content-Type", "Authorization", ENCABEZADO],
+        "expose_headers": ["X-Siguiente-Cursor", ENCABEZADO_REPETIDA, "X-Posicion-Escritura"],
+        # Las rutas con Authorization piden preflight; que el navegador lo recuerde
+        "max_age": 86400
     }
 })
 
-DATABASE_URL = os.environ.get('DATABASE_URL')
+# Lectura de lo propio con réplica: toda escritura exitosa responde la
+# posición del WAL en X-Posicion-Escritura y el cliente la manda de vuelta
+# en ?posicion= al leer
+ENCABEZADO_POSICION = "X-Posicion-Escritura"
 
-if DATABASE_URL and DATABASE_URL.startswith('postgres://'):
-    DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
 
-def get_db():
-    if DATABASE_URL:
-        return psycopg2.connect(DATABASE_URL, sslmode='require')
-    else:
-        return psycopg2.connect(
-            host="localhost",
-            database="beautyweb",
-            user="postgres",
-            password="1234"
-        )
+def recordar_posicion(posicion):
+    """La toma get_db de la conexión que escribió, al devolverla al pool"""
+    if has_request_context():
+        g.posicion_escritura = posicion
+
+
+observar_escrituras(recordar_posicion)
+
+
+@app.after_request
+def agregar_posicion_escritura(resp):
+    posicion = g.get("posicion_escritura")
+    if posicion and request.method in ("POST", "PUT", "DELETE") and resp.status_code < 400:
+        resp.headers[ENCABEZADO_POSICION] = posicion
+    return resp
+
+
+def posicion_lectura():
+    """Posición de escritura que manda el cliente, o None"""
+    return request.args.get("posicion") or None
+
 
 # Validaciones
 def validar_telefono(telefono):
@@ -46,10 +85,174 @@ def validar_contrasena(contrasena):
     """Valida que la contraseña tenga al menos 6 caracteres"""
     return len(contrasena) >= 6
 
+def parsear_fecha(valor):
+    """Convierte 'YYYY-MM-DD' a date, o None si no es válida"""
+    try:
+        return datetime.strptime(valor, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return None
+
+def parsear_hora(valor):
+    """Convierte 'HH:MM' (24h) o 'hh:MM AM/PM' a time, o None si no es válida"""
+    for formato in ("%H:%M", "%H:%M:%S", "%I:%M %p"):
+        try:
+            return datetime.strptime(valor.strip(), formato).time()
+        except (AttributeError, ValueError):
+            continue
+    return None
+
+# Máximo de días que se pueden consultar de una vez en /disponibilidad
+MAX_DIAS_DISPONIBILIDAD = 62
+
+# Máximo de días que se pueden bloquear en una sola petición a /bloquear
+MAX_DIAS_BLOQUEO = 366
+
+# Paginación por cursor de los listados de citas
+LIMITE_PAGINA = 50
+LIMITE_PAGINA_MAX = 200
+
+def leer_paginacion():
+    """Lee limite, cursor, desde, hasta y estilista de la query string.
+
+    Lanza ValueError con el mensaje para el cliente si algo no es válido.
+    """
+    try:
+        limite = int(request.args.get("limite", LIMITE_PAGINA))
+    except ValueError:
+        raise ValueError("El límite debe ser un número")
+    if limite < 1:
+        raise ValueError("El límite debe ser mayor que cero")
+
+    pagina = {
+        "limite": min(limite, LIMITE_PAGINA_MAX),
+        "cursor": None,
+        "desde": None,
+        "hasta": None,
+        "estilista": None
+    }
+
+    cursor = request.args.get("cursor")
+    if cursor:
+        try:
+            fecha, hora, cita_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+            pagina["cursor"] = (parsear_fecha(fecha), parsear_hora(hora), int(cita_id))
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError("Cursor inválido")
+        if None in pagina["cursor"]:
+            raise ValueError("Cursor inválido")
+
+    for campo in ("desde", "hasta"):
+        if request.args.get(campo):
+            pagina[campo] = parsear_fecha(request.args[campo])
+            if not pagina[campo]:
+                raise ValueError("Fecha inválida")
+
+    if request.args.get("estilista"):
+        try:
+            pagina["estilista"] = int(request.args["estilista"])
+        except ValueError:
+            raise ValueError("Estilista inválido")
+
+    return pagina
+
+def filtros_paginacion(pagina, descendente=False):
+    """Condiciones SQL extra (con sus parámetros) para los filtros y el cursor"""
+    condiciones = []
+    params = {"limite": pagina["limite"] + 1}
+
+    if pagina["desde"]:
+        condiciones.append("c.fecha >= %(desde)s")
+        params["desde"] = pagina["desde"]
+    if pagina["hasta"]:
+        condiciones.append("c.fecha <= %(hasta)s")
+        params["hasta"] = pagina["hasta"]
+    if pagina["estilista"]:
+        condiciones.append("c.estilista = %(estilista)s")
+        params["estilista"] = pagina["estilista"]
+    if pagina["cursor"]:
+        operador = "<" if descendente else ">"
+        condiciones.append(f"(c.fecha, c.hora, c.id) {operador} (%(c_fecha)s, %(c_hora)s, %(c_id)s)")
+        params["c_fecha"], params["c_hora"], params["c_id"] = pagina["cursor"]
+
+    sql = "".join(f" AND {c}" for c in condiciones)
+    return sql, params
+
+def consulta_pagina_json(filas, objeto):
+    """Envuelve un listado paginado para que Postgres arme la respuesta JSON.
+
+    filas es un SELECT con columnas id, fecha, hora y n (row_number en el
+    orden del listado) que trae %(limite)s filas, una más de las que se
+    muestran; objeto es la expresión json_build_object de cada fila. La
+    consulta devuelve (json de la página, hay_mas, fecha, hora, id de la
+    última fila mostrada).
+    """
+    return f"""
+        WITH filas AS ({filas})
+        SELECT COALESCE(json_agg({objeto} ORDER BY n) FILTER (WHERE n < %(limite)s), '[]')::text,
+               COALESCE(bool_or(n = %(limite)s), false),
+               MAX(fecha) FILTER (WHERE n = %(limite)s - 1),
+               MAX(hora) FILTER (WHERE n = %(limite)s - 1),
+               MAX(id) FILTER (WHERE n = %(limite)s - 1)
+        FROM filas
+    """
+
+def respuesta_json(cuerpo):
+    """Responde un JSON ya armado (por Postgres) sin volver a serializarlo"""
+    return app.response_class(cuerpo, mimetype="application/json")
+
+def respuesta_paginada(fila):
+    """Devuelve la página y el cursor siguiente en X-Siguiente-Cursor.
+
+    fila es el resultado de una consulta armada con consulta_pagina_json.
+    """
+    cuerpo, hay_mas, fecha, hora, cita_id = fila
+    resp = respuesta_json(cuerpo)
+    if hay_mas:
+        valor = f"{fecha.isoformat()}|{hora.isoformat()}|{cita_id}"
+        resp.headers["X-Siguiente-Cursor"] = base64.urlsafe_b64encode(valor.encode()).decode()
+    return resp
+
+# Catálogo (servicios y estilistas): solo cambia desde el panel de admin
+CANAL_CATALOGO = "catalogo"
+CATALOGO_MAX_AGE = int(os.environ.get('CATALOGO_MAX_AGE', 60))
+cache_catalogo = CacheLRU(canal=CANAL_CATALOGO, max_entradas=500, ttl=3600)
+
+def respuesta_catalogo(clave, consultar):
+    """Responde una lista del catálogo desde memoria, con ETag y Last-Modified.
+
+    consultar() devuelve el JSON de la lista y solo se llama si no está en caché.
+    Si nada cambió desde If-None-Match / If-Modified-Since responde 304 sin tocar la base.
+    """
+    entrada = cache_catalogo.obtener(clave)
+    if entrada is None:
+        generacion = cache_catalogo.generacion()
+        cuerpo = consultar().encode("utf-8")
+        entrada = {
+            "cuerpo": cuerpo,
+            "etag": hashlib.sha1(cuerpo).hexdigest(),
+            "modificado": datetime.now(timezone.utc).replace(microsecond=0)
+        }
+        cache_catalogo.guardar(clave, entrada, generacion)
+
+    resp = app.response_class(entrada["cuerpo"], mimetype="application/json")
+    resp.set_etag(entrada["etag"])
+    resp.last_modified = entrada["modificado"]
+    resp.cache_control.public = True
+    resp.cache_control.max_age = CATALOGO_MAX_AGE
+    return resp.make_conditional(request)
+
+def respuesta_ocupado():
+    """503 cuando la cola de bcrypt o los streams de eventos están llenos"""
+    resp = jsonify({"error": "El servidor está ocupado, intenta de nuevo en unos segundos"})
+    resp.status_code = 503
+    resp.headers["Retry-After"] = "2"
+    return resp
+
 # ==================================================
 #   REGISTRO DE USUARIO
 # ==================================================
 @app.route("/registro", methods=["POST"])
+@idempotente
 def registro():
     data = request.json
     nombre = data.get("nombre", "").strip()
@@ -67,26 +270,31 @@ def registro():
         return jsonify({"error": "La contraseña debe tener al menos 6 caracteres"}), 400
 
     try:
-        conn = get_db()
-        cur = conn.cursor()
+        with get_db() as conn, conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM usuarios WHERE telefono = %s", (telefono,))
+            if cur.fetchone():
+                return jsonify({"error": "Este número ya está registrado"}), 400
 
-        cur.execute("SELECT * FROM usuarios WHERE telefono = %s", (telefono,))
-        if cur.fetchone():
-            return jsonify({"error": "Este número ya está registrado"}), 400
+        # El hash se calcula sin tener una conexión prestada
+        hashed = hashear_contrasena(contrasena)
 
-        hashed = bcrypt.hashpw(contrasena.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
-        
-        cur.execute("""
-            INSERT INTO usuarios (nombre, telefono, contrasena)
-            VALUES (%s, %s, %s)
-        """, (nombre, telefono, hashed))
+        with get_db() as conn, conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO usuarios (nombre, telefono, contrasena)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (telefono) DO NOTHING
+                RETURNING id
+            """, (nombre, telefono, hashed))
 
-        conn.commit()
-        cur.close()
-        conn.close()
+            if not cur.fetchone():
+                return jsonify({"error": "Este número ya está registrado"}), 400
+            conn.commit()
 
         return jsonify({"mensaje": "Usuario registrado correctamente"})
 
+    except ServidorOcupado:
+        return respuesta_ocupado()
+
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -103,78 +311,107 @@ def login():
     if not validar_telefono(telefono):
         return jsonify({"error": "El teléfono debe tener exactamente 10 dígitos"}), 400
 
-    conn = get_db()
-    cursor = conn.cursor()
+    with get_db() as conn, conn.cursor() as cursor:
+        cursor.ejecutar_preparada("""
+            SELECT id, nombre, telefono, contrasena
+            FROM usuarios
+            WHERE telefono = %s
+        """, (telefono,))
 
-    cursor.execute("""
-        SELECT id, nombre, telefono, contrasena
-        FROM usuarios
-        WHERE telefono = %s
-    """, (telefono,))
-
-    usuario = cursor.fetchone()
-    conn.close()
+        usuario = cursor.fetchone()
 
     if not usuario:
         return jsonify({"error": "Número no registrado"}), 400
 
     user_id, nombre, telefono_db, hashed_password = usuario
 
-    if isinstance(hashed_password, memoryview):
-        hashed_password = bytes(hashed_password)
-
-    if not bcrypt.checkpw(contrasena.encode("utf-8"), hashed_password):
-        return jsonify({"error": "Contraseña incorrecta"}), 400
+    try:
+        if not verificar_contrasena(contrasena, hashed_password):
+            return jsonify({"error": "Contraseña incorrecta"}), 400
+    except ServidorOcupado:
+        return respuesta_ocupado()
 
     return jsonify({
         "id": user_id,
         "nombre": nombre,
-        "telefono": telefono_db
+        "telefono": telefono_db,
+        "token": emitir_token(user_id, nombre, telefono_db)
     })
 
 # ================================
-#   OBTENER CITAS POR TELÉFONO (CON DATOS DEL CLIENTE)
+#   HISTORIAL DE CITAS DE UN CLIENTE
 # ================================
-@app.route('/citas_usuario/<telefono>', methods=['GET'])
-def citas_usuario(telefono):
-    conn = get_db()
-    cur = conn.cursor()
+def historial_citas(cliente):
+    """Página del historial de un cliente, en el formato de /citas_usuario.
 
-    query = """
-        SELECT c.id, c.servicio, e.nombre as estilista, c.fecha, c.hora, 
-               c.estado, c.notas, u.nombre as cliente, u.telefono as cliente_telefono
-        FROM citas c
-        JOIN usuarios u ON c.usuario_id = u.id
-        LEFT JOIN estilistas e ON c.estilista = e.id
-        WHERE u.telefono = %s
-        ORDER BY c.fecha DESC, c.hora DESC;
+    cliente trae "telefono" (se busca al usuario en usuarios) o "usuario",
+    "nombre" y "telefono" de un token de sesión (no hace falta el join).
     """
+    try:
+        pagina = leer_paginacion()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    filtros, params = filtros_paginacion(pagina, descendente=True)
+    if "usuario" in cliente:
+        datos_cliente = "%(nombre)s::text as cliente, %(telefono)s::text as cliente_telefono"
+        origen = "citas c"
+        condicion = "c.usuario_id = %(usuario)s"
+    else:
+        datos_cliente = "u.nombre as cliente, u.telefono as cliente_telefono"
+        origen = "citas c JOIN usuarios u ON c.usuario_id = u.id"
+        condicion = "u.telefono = %(telefono)s"
+    params.update(cliente)
+
+    query = consulta_pagina_json(f"""
+        SELECT c.id, c.servicio, e.nombre as estilista, c.fecha, c.hora,
+               c.estado, c.notas, {datos_cliente},
+               row_number() OVER (ORDER BY c.fecha DESC, c.hora DESC, c.id DESC) AS n
+        FROM {origen}
+        LEFT JOIN estilistas e ON c.estilista = e.id
+        WHERE {condicion}{filtros}
+        ORDER BY c.fecha DESC, c.hora DESC, c.id DESC
+        LIMIT %(limite)s
+    """, """
+        jsonb_build_object(
+            'id', id,
+            'servicio', servicio,
+            'estilista', COALESCE(estilista, 'Sin asignar'),
+            'fecha', fecha,
+            'hora', to_char(hora, 'HH24:MI'),
+            'estado', estado,
+            'cliente', cliente,
+            'telefono', cliente_telefono
+        ) || CASE
+            WHEN estado = 'Cancelada' AND notas <> '' THEN jsonb_build_object('motivo_rechazo', notas)
+            ELSE '{}'::jsonb
+        END
+    """)
 
-    cur.execute(query, (telefono,))
-    rows = cur.fetchall()
-
-    citas = []
-    for r in rows:
-        cita_data = {
-            "id": r[0],
-            "servicio": r[1],
-            "estilista": r[2] if r[2] else "Sin asignar",
-            "fecha": r[3].strftime("%Y-%m-%d"),
-            "hora": r[4].strftime("%H:%M"),
-            "estado": r[5],
-            "cliente": r[7],
-            "telefono": r[8]
-        }
-        
-        if r[5] == "Cancelada" and r[6]:
-            cita_data["motivo_rechazo"] = r[6]
-            
-        citas.append(cita_data)
+    with get_db(lectura=True, posicion=posicion_lectura()) as conn, conn.cursor() as cur:
+        cur.ejecutar_preparada(query, params)
+        return respuesta_paginada(cur.fetchone())
+
+@app.route('/citas_usuario/<telefono>', methods=['GET'])
+def citas_usuario(telefono):
+    return historial_citas({"telefono": telefono})
 
-    cur.close()
-    conn.close()
+@app.route('/mis_citas', methods=['GET'])
+@requiere_sesion
+def mis_citas():
+    """Historial del usuario del token de sesión"""
+    sesion = usuario_sesion()
+    return historial_citas({"usuario": sesion["id"], "nombre": sesion["nombre"], "telefono": sesion["telefono"]})
 
-    return jsonify(citas)
+# ================================
+#   SESIÓN ACTUAL
+# ================================
+@app.route('/sesion', methods=['GET'])
+@requiere_sesion
+def sesion_actual():
+    """Datos del usuario del token, para retomar la sesión sin volver a hacer login"""
+    sesion = usuario_sesion()
+    return jsonify({"id": sesion["id"], "nombre": sesion["nombre"], "telefono": sesion["telefono"]})
 
 
 # ================================
@@ -182,23 +419,25 @@ def citas_usuario(telefono):
 # ================================
 @app.route("/estilistas", methods=["GET"])
 def obtener_estilistas():
-    conn = get_db()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-
-    cur.execute("""
-        SELECT e.id, e.nombre, 
-               COALESCE(array_agg(es.servicio_id) FILTER (WHERE es.servicio_id IS NOT NULL), ARRAY[]::integer[]) as servicios
-        FROM estilistas e
-        LEFT JOIN estilista_servicios es ON e.id = es.estilista_id
-        GROUP BY e.id, e.nombre
-        ORDER BY e.nombre
-    """)
-    data = cur.fetchall()
-
-    cur.close()
-    conn.close()
-
-    return jsonify([dict(row) for row in data])
+    def consultar():
+        with get_db() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT COALESCE(json_agg(json_build_object(
+                           'id', s.id,
+                           'nombre', s.nombre,
+                           'servicios', s.servicios
+                       ) ORDER BY s.nombre), '[]')::text
+                FROM (
+                    SELECT e.id, e.nombre,
+                           COALESCE(array_agg(es.servicio_id) FILTER (WHERE es.servicio_id IS NOT NULL), ARRAY[]::integer[]) as servicios
+                    FROM estilistas e
+                    LEFT JOIN estilista_servicios es ON e.id = es.estilista_id
+                    GROUP BY e.id, e.nombre
+                ) s
+            """)
+            return cur.fetchone()[0]
+
+    return respuesta_catalogo("estilistas", consultar)
 
 
 # ================================
@@ -206,23 +445,24 @@ def obtener_estilistas():
 # ================================
 @app.route("/estilistas/por-servicio/<servicio_nombre>", methods=["GET"])
 def obtener_estilistas_por_servicio(servicio_nombre):
-    conn = get_db()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-
-    cur.execute("""
-        SELECT DISTINCT e.id, e.nombre
-        FROM estilistas e
-        JOIN estilista_servicios es ON e.id = es.estilista_id
-        JOIN servicios s ON es.servicio_id = s.id
-        WHERE s.nombre = %s
-        ORDER BY e.nombre
-    """, (servicio_nombre,))
-    
-    data = cur.fetchall()
-    cur.close()
-    conn.close()
-
-    return jsonify([dict(row) for row in data])
+    def consultar():
+        with get_db() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT COALESCE(json_agg(json_build_object(
+                           'id', s.id,
+                           'nombre', s.nombre
+                       ) ORDER BY s.nombre), '[]')::text
+                FROM (
+                    SELECT DISTINCT e.id, e.nombre
+                    FROM estilistas e
+                    JOIN estilista_servicios es ON e.id = es.estilista_id
+                    JOIN servicios s ON es.servicio_id = s.id
+                    WHERE s.nombre = %s
+                ) s
+            """, (servicio_nombre,))
+            return cur.fetchone()[0]
+
+    return respuesta_catalogo(("por-servicio", servicio_nombre), consultar)
 
 
 # =================================
@@ -230,16 +470,21 @@ def obtener_estilistas_por_servicio(servicio_nombre):
 # =================================
 @app.route("/servicios", methods=["GET"])
 def obtener_servicios():
-    conn = get_db()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-
-    cur.execute("SELECT * FROM servicios ORDER BY nombre")
-    data = cur.fetchall()
-
-    cur.close()
-    conn.close()
+    def consultar():
+        with get_db() as conn, conn.cursor() as cur:
+            # precio como texto, igual que lo serializaba Flask desde Decimal
+            cur.execute("""
+                SELECT COALESCE(json_agg(json_build_object(
+                           'id', id,
+                           'nombre', nombre,
+                           'precio', precio::text,
+                           'duracion_minutos', duracion_minutos
+                       ) ORDER BY nombre), '[]')::text
+                FROM servicios
+            """)
+            return cur.fetchone()[0]
 
-    return jsonify([dict(row) for row in data])
+    return respuesta_catalogo("servicios", consultar)
 
 
 # ================================
@@ -247,19 +492,11 @@ def obtener_servicios():
 # ================================
 @app.route("/horarios_bloqueados/<int:id_estilista>/<fecha>", methods=["GET"])
 def obtener_bloqueados(id_estilista, fecha):
-    conn = get_db()
-    cur = conn.cursor()
-
-    cur.execute("""
-        SELECT hora 
-        FROM horarios_bloqueados
-        WHERE id_estilista = %s AND fecha = %s
-    """, (id_estilista, fecha))
-
-    bloqueados = [str(r[0]) for r in cur.fetchall()]
+    dia = parsear_fecha(fecha)
+    if not dia:
+        return jsonify({"error": "Fecha inválida"}), 400
 
-    cur.close()
-    conn.close()
+    bloqueados = ocupacion_rango(id_estilista, dia, dia)[dia]["bloqueos"]
 
     return jsonify(bloqueados)
 
@@ -269,19 +506,15 @@ def obtener_bloqueados(id_estilista, fecha):
 # ================================
 @app.route("/bloqueos/<int:id_estilista>", methods=["GET"])
 def listar_bloqueos(id_estilista):
-    conn = get_db()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-
-    cur.execute("""
-        SELECT id, fecha, motivo
-        FROM horarios_bloqueados
-        WHERE id_estilista = %s
-        ORDER BY fecha DESC
-    """, (id_estilista,))
+    with get_db(lectura=True, posicion=posicion_lectura()) as conn, conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+        cur.execute("""
+            SELECT id, fecha, motivo
+            FROM horarios_bloqueados
+            WHERE id_estilista = %s
+            ORDER BY fecha DESC
+        """, (id_estilista,))
 
-    bloqueos = cur.fetchall()
-    cur.close()
-    conn.close()
+        bloqueos = cur.fetchall()
 
     return jsonify([dict(row) for row in bloqueos])
 
@@ -292,13 +525,20 @@ def listar_bloqueos(id_estilista):
 @app.route("/bloqueos/<int:bloqueo_id>", methods=["DELETE"])
 def eliminar_bloqueo(bloqueo_id):
     try:
-        conn = get_db()
-        cur = conn.cursor()
+        with get_db() as conn, conn.cursor() as cur:
+            cur.execute("""
+                DELETE FROM horarios_bloqueados WHERE id = %s
+                RETURNING id_estilista, fecha
+            """, (bloqueo_id,))
+            borrado = cur.fetchone()
 
-        cur.execute("DELETE FROM horarios_bloqueados WHERE id = %s", (bloqueo_id,))
-        conn.commit()
-        cur.close()
-        conn.close()
+            if borrado:
+                notificar_ocupacion(cur, *borrado)
+                notificar_evento(cur, "bloqueo_eliminado", borrado[0], [borrado[1]], id=bloqueo_id)
+            conn.commit()
+
+        if borrado:
+            indice_ocupacion.invalidar(*borrado)
 
         return jsonify({"mensaje": "Bloqueo eliminado correctamente"})
     except Exception as e:
@@ -309,87 +549,191 @@ def eliminar_bloqueo(bloqueo_id):
 #   CREAR CITA CON VALIDACIONES
 # ================================
 @app.route("/agendar", methods=["POST"])
+@idempotente
 def agendar():
     data = request.get_json()
 
-    usuario_id = data.get("usuario_id")
+    # Con sesión el usuario sale del token; sin ella, del cuerpo
+    sesion = usuario_sesion()
+    usuario_id = sesion["id"] if sesion else data.get("usuario_id")
     servicio = data.get("servicio")
     estilista_id = data.get("estilista")
     fecha = data.get("fecha")
     hora = data.get("hora")
     notas = data.get("notas")
 
-    conn = get_db()
-    cur = conn.cursor()
-
     try:
         fecha_cita = datetime.strptime(fecha, "%Y-%m-%d").date()
         if fecha_cita < date.today():
             return jsonify({"error": "No puedes agendar citas en fechas pasadas"}), 400
 
-        # Verificar bloqueos
-        cur.execute("""
-            SELECT id FROM horarios_bloqueados
-            WHERE id_estilista = %s AND fecha = %s
-        """, (estilista_id, fecha))
-        
-        if cur.fetchone():
-            return jsonify({"error": "El estilista no está disponible en esta fecha"}), 400
-
-        # Verificar disponibilidad
-        cur.execute("""
-            SELECT id FROM citas
-            WHERE estilista = %s 
-            AND fecha = %s 
-            AND hora = %s 
-            AND estado IN ('Pendiente', 'Confirmada')
-        """, (estilista_id, fecha, hora))
-        
-        if cur.fetchone():
-            return jsonify({"error": "Este horario ya está ocupado"}), 400
+        hora_cita = parsear_hora(hora)
+        if not hora_cita:
+            return jsonify({"error": "Hora inválida"}), 400
+
+        try:
+            estilista_id = int(estilista_id)
+        except (TypeError, ValueError):
+            return jsonify({"error": "Estilista inválido"}), 400
+
+        duracion = duracion_servicio(servicio)
+        inicio = agenda.a_minutos(hora_cita)
+
+        # Rechazo rápido solo si el índice en memoria ya tiene el día; si no,
+        # decide la sentencia de abajo sin una consulta extra antes
+        ocupacion = indice_ocupacion.obtener(estilista_id, fecha_cita)
+        if ocupacion is not None:
+            dia = dia_agenda(ocupacion)
+            if ocupacion["bloqueos"]:
+                return jsonify({"error": "El estilista no está disponible en esta fecha"}), 400
+            if not dia.en_jornada(inicio, duracion):
+                return jsonify({"error": "El horario está fuera del horario de atención"}), 400
+            if not dia.cabe(inicio, duracion):
+                return jsonify({"error": "Este horario ya está ocupado"}), 400
+
+        # Bloqueo, jornada, disponibilidad e inserción en una sola sentencia.
+        # La restricción citas_sin_traslape (y el índice único
+        # citas_horario_activo_uniq) garantiza que dos reservas simultáneas
+        # que se traslapan no puedan entrar las dos. La jornada es la del
+        # estilista si tiene turnos (unidos con range_agg, como fusionar) o
+        # la general, que se revisa en memoria.
+        with get_db() as conn, conn.cursor() as cur:
+            cur.ejecutar_preparada("""
+                WITH bloqueo AS (
+                    SELECT EXISTS (
+                        SELECT 1 FROM horarios_bloqueados
+                        WHERE id_estilista = %(estilista)s AND fecha = %(fecha)s
+                    ) AS bloqueado,
+                    CASE WHEN EXISTS (SELECT 1 FROM horarios_estilista WHERE estilista_id = %(estilista)s)
+                    THEN COALESCE((
+                        SELECT range_agg(int4range(
+                                   EXTRACT(EPOCH FROM h.inicio)::int / 60,
+                                   EXTRACT(EPOCH FROM h.fin)::int / 60
+                               )) @> int4range(%(inicio)s::int, %(inicio)s::int + %(duracion)s::int)
+                        FROM horarios_estilista h
+                        WHERE h.estilista_id = %(estilista)s
+                        AND h.dia_semana = EXTRACT(ISODOW FROM %(fecha)s::date)
+                    ), FALSE)
+                    ELSE %(en_jornada_general)s END AS en_jornada
+                ),
+                nueva AS (
+                    INSERT INTO citas (usuario_id, servicio, estilista, fecha, hora, duracion_minutos, notas)
+                    SELECT %(usuario)s, %(servicio)s, %(estilista)s, %(fecha)s, %(hora)s, %(duracion)s, %(notas)s
+                    FROM bloqueo
+                    WHERE NOT bloqueo.bloqueado AND bloqueo.en_jornada
+                    ON CONFLICT DO NOTHING
+                    RETURNING id
+                )
+                SELECT bloqueo.bloqueado,
+                       bloqueo.en_jornada,
+                       nueva.id,
+                       CASE WHEN nueva.id IS NOT NULL AND %(notificar)s
+                            THEN pg_notify(%(canal)s, %(payload)s) END,
+                       CASE WHEN nueva.id IS NOT NULL AND %(notificar)s
+                            THEN pg_notify(%(canal_eventos)s, (
+                                %(evento)s::jsonb || jsonb_build_object('id', nueva.id)
+                            )::text) END
+                FROM bloqueo
+                LEFT JOIN nueva ON TRUE;
+            """, {
+                "usuario": usuario_id,
+                "servicio": servicio,
+                "estilista": estilista_id,
+                "fecha": fecha_cita,
+                "hora": hora_cita,
+                "duracion": duracion,
+                "inicio": inicio,
+                "en_jornada_general": agenda.DiaAgenda(agenda.JORNADA, ()).en_jornada(inicio, duracion),
+                "notas": notas,
+                "notificar": CACHE_NOTIFY,
+                "canal": CANAL,
+                "payload": payload_ocupacion(estilista_id, fecha_cita),
+                "canal_eventos": CANAL_EVENTOS,
+                "evento": json.dumps(evento(
+                    "cita_creada", estilista_id, [fecha_cita],
+                    hora=hora_cita.strftime("%H:%M"), duracion=duracion
+                ))
+            })
 
-        cur.execute("""
-            INSERT INTO citas (usuario_id, servicio, estilista, fecha, hora, notas)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            RETURNING id;
-        """, (usuario_id, servicio, estilista_id, fecha, hora, notas))
+            bloqueado, en_jornada, new_id, _, _ = cur.fetchone()
+            if bloqueado:
+                return jsonify({"error": "El estilista no está disponible en esta fecha"}), 400
+            if not en_jornada:
+                return jsonify({"error": "El horario está fuera del horario de atención"}), 400
+            if new_id is None:
+                return jsonify({"error": "Este horario ya está ocupado"}), 400
+
+            conn.commit()
+
+        indice_ocupacion.invalidar(estilista_id, fecha_cita)
 
-        new_id = cur.fetchone()[0]
-        conn.commit()
         return jsonify({"mensaje": "Cita agendada", "id": new_id})
 
     except Exception as e:
-        conn.rollback()
         return jsonify({"error": str(e)}), 500
-    finally:
-        cur.close()
-        conn.close()
 
 
 # ================================
 #   BLOQUEAR HORARIO
 # ================================
 @app.route("/bloquear", methods=["POST"])
+@idempotente
 def bloquear_horario():
+    """Bloquea un día ("fecha"), una lista ("fechas") y/o un rango ("desde"/"hasta")"""
     try:
         data = request.json
-        fecha = data.get("fecha")
         estilista = int(data.get("id_estilista"))
         motivo = data.get("motivo")
 
-        conn = get_db()
-        cur = conn.cursor()
-
-        cur.execute("""
-            INSERT INTO horarios_bloqueados (fecha, id_estilista, motivo)
-            VALUES (%s, %s, %s)
-        """, (fecha, estilista, motivo))
-
-        conn.commit()
-        cur.close()
-        conn.close()
-
-        return jsonify({"mensaje": "Horario bloqueado"}), 201
+        fechas = set()
+        for valor in ([data["fecha"]] if data.get("fecha") else []) + list(data.get("fechas") or []):
+            dia = parsear_fecha(valor)
+            if not dia:
+                return jsonify({"error": f"Fecha inválida: {valor}"}), 400
+            fechas.add(dia)
+
+        if data.get("desde") or data.get("hasta"):
+            desde = parsear_fecha(data.get("desde"))
+            hasta = parsear_fecha(data.get("hasta"))
+            if not desde or not hasta or hasta < desde:
+                return jsonify({"error": "Rango de fechas inválido"}), 400
+            if (hasta - desde).days >= MAX_DIAS_BLOQUEO:
+                return jsonify({"error": f"No se pueden bloquear más de {MAX_DIAS_BLOQUEO} días"}), 400
+            fechas.update(desde + timedelta(days=n) for n in range((hasta - desde).days + 1))
+
+        if not fechas:
+            return jsonify({"error": "Selecciona un día o rango válido"}), 400
+        if len(fechas) > MAX_DIAS_BLOQUEO:
+            return jsonify({"error": f"No se pueden bloquear más de {MAX_DIAS_BLOQUEO} días"}), 400
+
+        with get_db() as conn, conn.cursor() as cur:
+            # Un solo INSERT multi-fila; los días que ya estaban bloqueados se
+            # omiten (horarios_bloqueados_dia_uniq, también entre peticiones
+            # simultáneas)
+            cur.execute("""
+                INSERT INTO horarios_bloqueados (fecha, id_estilista, motivo)
+                SELECT d, %(estilista)s, %(motivo)s
+                FROM unnest(%(fechas)s::date[]) AS d
+                ORDER BY d
+                ON CONFLICT (id_estilista, fecha) WHERE hora IS NULL DO NOTHING
+                RETURNING id, fecha
+            """, {"estilista": estilista, "motivo": motivo, "fechas": sorted(fechas)})
+
+            creados = sorted(cur.fetchall(), key=lambda c: c[1])
+            notificar_ocupacion_dias(cur, estilista, [f for _, f in creados])
+            if creados:
+                notificar_evento(cur, "bloqueo_creado", estilista, [f for _, f in creados],
+                                 ids=[i for i, _ in creados])
+            conn.commit()
+
+        for _, fecha_bloqueo in creados:
+            indice_ocupacion.invalidar(estilista, fecha_bloqueo)
+
+        return jsonify({
+            "mensaje": "Horario bloqueado",
+            "ids": [i for i, _ in creados],
+            "fechas": [f.strftime("%Y-%m-%d") for _, f in creados]
+        }), 201
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -400,16 +744,23 @@ def bloquear_horario():
 # ================================
 @app.route("/citas/<int:id>", methods=["DELETE"])
 def eliminar_cita(id):
-    conn = get_db()
-    cur = conn.cursor()
+    try:
+        with get_db() as conn, conn.cursor() as cur:
+            cur.ejecutar_preparada("DELETE FROM citas WHERE id = %s RETURNING estilista, fecha, hora", (id,))
+            borrada = cur.fetchone()
 
-    cur.execute("DELETE FROM citas WHERE id = %s", (id,))
-    conn.commit()
+            if borrada:
+                estilista, fecha, hora = borrada
+                notificar_ocupacion(cur, estilista, fecha)
+                notificar_evento(cur, "cita_eliminada", estilista, [fecha], id=id, hora=hora.strftime("%H:%M"))
+            conn.commit()
 
-    cur.close()
-    conn.close()
+        if borrada:
+            indice_ocupacion.invalidar(estilista, fecha)
 
-    return jsonify({"mensaje": "Cita eliminada correctamente"})
+        return jsonify({"mensaje": "Cita eliminada correctamente"})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
 
 @app.route("/admin/staff", methods=["GET"])
@@ -418,30 +769,25 @@ def obtener_staff():
         today = date.today()
 
         query = """
-            SELECT e.id,
-                   e.nombre,
-                   COUNT(c.id) AS citas_hoy
-            FROM estilistas e
-            LEFT JOIN citas c
-                ON c.estilista = e.id
-               AND c.fecha = %s
-            GROUP BY e.id
-            ORDER BY e.nombre;
+            SELECT COALESCE(json_agg(json_build_object(
+                       'id_estilista', s.id,
+                       'nombre', s.nombre,
+                       'citas_hoy', s.citas_hoy
+                   ) ORDER BY s.nombre), '[]')::text
+            FROM (
+                SELECT e.id,
+                       e.nombre,
+                       COALESCE(SUM(r.total), 0) AS citas_hoy
+                FROM estilistas e
+                LEFT JOIN resumen_citas r
+                    ON r.estilista = e.id
+                   AND r.fecha = %s
+                GROUP BY e.id
+            ) s;
         """
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute(query, (today,))
-        rows = cursor.fetchall()
-
-        staff = []
-        for row in rows:
-            staff.append({
-                "id_estilista": row[0],
-                "nombre": row[1],
-                "citas_hoy": row[2]
-            })
-
-        return jsonify(staff)
+        with get_db(lectura=True, posicion=posicion_lectura()) as conn, conn.cursor() as cursor:
+            cursor.execute(query, (today,))
+            return respuesta_json(cursor.fetchone()[0])
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -456,27 +802,25 @@ def add_stylist():
     if not nombre:
         return jsonify({"error": "Nombre requerido"}), 400
 
-    conn = get_db()
-    cur = conn.cursor()
-
     try:
-        cur.execute("INSERT INTO estilistas (nombre) VALUES (%s) RETURNING id", (nombre,))
-        new_id = cur.fetchone()[0]
+        with get_db() as conn, conn.cursor() as cur:
+            cur.execute("INSERT INTO estilistas (nombre) VALUES (%s) RETURNING id", (nombre,))
+            new_id = cur.fetchone()[0]
 
-        # Insertar servicios
-        for servicio_id in servicios:
-            cur.execute("""
-                INSERT INTO estilista_servicios (estilista_id, servicio_id)
-                VALUES (%s, %s)
-            """, (new_id, servicio_id))
+            # Insertar servicios
+            for servicio_id in servicios:
+                cur.execute("""
+                    INSERT INTO estilista_servicios (estilista_id, servicio_id)
+                    VALUES (%s, %s)
+                """, (new_id, servicio_id))
 
-        conn.commit()
-        cur.close()
-        conn.close()
+            notificar(cur, CANAL_CATALOGO)
+            conn.commit()
+
+        cache_catalogo.limpiar()
 
         return jsonify({"message": "Estilista agregado", "id": new_id})
     except Exception as e:
-        conn.rollback()
         return jsonify({"error": str(e)}), 500
 
 @app.route("/admin/stylists/delete", methods=["POST"])
@@ -487,79 +831,247 @@ def delete_stylist():
     if not estilista_id:
         return jsonify({"error": "ID requerido"}), 400
 
-    conn = get_db()
-    cur = conn.cursor()
-
-    # Primero eliminar relaciones
-    cur.execute("DELETE FROM estilista_servicios WHERE estilista_id = %s", (estilista_id,))
-    cur.execute("DELETE FROM estilistas WHERE id = %s", (estilista_id,))
-    conn.commit()
+    with get_db() as conn, conn.cursor() as cur:
+        # Primero eliminar relaciones
+        cur.execute("DELETE FROM estilista_servicios WHERE estilista_id = %s", (estilista_id,))
+        cur.execute("DELETE FROM estilistas WHERE id = %s", (estilista_id,))
+        notificar_ocupacion(cur, estilista_id)
+        notificar(cur, CANAL_CATALOGO)
+        conn.commit()
 
-    cur.close()
-    conn.close()
+    indice_ocupacion.invalidar(estilista_id)
+    cache_catalogo.limpiar()
 
     return jsonify({"message": "Estilista eliminado"})
 
 
+@app.route("/admin/stylists/<int:id_estilista>/horario", methods=["GET"])
+def horario_estilista(id_estilista):
+    """Jornada de cada día de la semana (1 = lunes); vacío si usa la general"""
+    with get_db(lectura=True, posicion=posicion_lectura()) as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT dia_semana, inicio, fin
+            FROM horarios_estilista
+            WHERE estilista_id = %s
+            ORDER BY dia_semana, inicio
+        """, (id_estilista,))
+        rows = cur.fetchall()
+
+    return jsonify([
+        {"dia_semana": dia, "inicio": inicio.strftime("%H:%M"), "fin": fin.strftime("%H:%M")}
+        for dia, inicio, fin in rows
+    ])
+
+
+@app.route("/admin/stylists/<int:id_estilista>/horario", methods=["PUT"])
+def guardar_horario_estilista(id_estilista):
+    """Reemplaza la jornada del estilista; una lista vacía vuelve a la general"""
+    data = request.get_json()
+    if not isinstance(data, list):
+        return jsonify({"error": "Se esperaba una lista de {dia_semana, inicio, fin}"}), 400
+
+    filas = []
+    for tramo in data:
+        try:
+            dia = int(tramo.get("dia_semana"))
+        except (AttributeError, TypeError, ValueError):
+            return jsonify({"error": "dia_semana inválido"}), 400
+        inicio = parsear_hora(tramo.get("inicio"))
+        fin = parsear_hora(tramo.get("fin"))
+        if not 1 <= dia <= 7:
+            return jsonify({"error": "dia_semana debe estar entre 1 (lunes) y 7 (domingo)"}), 400
+        if not inicio or not fin or fin <= inicio:
+            return jsonify({"error": "Horario inválido"}), 400
+        filas.append((id_estilista, dia, inicio, fin))
+
+    try:
+        with get_db() as conn, conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM estilistas WHERE id = %s", (id_estilista,))
+            if not cur.fetchone():
+                return jsonify({"error": "Estilista no encontrado"}), 404
+
+            cur.execute("DELETE FROM horarios_estilista WHERE estilista_id = %s", (id_estilista,))
+            psycopg2.extras.execute_values(cur, """
+                INSERT INTO horarios_estilista (estilista_id, dia_semana, inicio, fin)
+                VALUES %s
+            """, filas)
+            notificar_ocupacion(cur, id_estilista)
+            conn.commit()
+
+        indice_ocupacion.invalidar(id_estilista)
+
+        return jsonify({"mensaje": "Horario actualizado"})
+
+    except psycopg2.errors.UniqueViolation:
+        return jsonify({"error": "Hay dos tramos que empiezan a la misma hora"}), 400
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 # ================================
 #   OBTENER CITAS PENDIENTES Y CONFIRMADAS
 # ================================
 @app.route('/citas/pendientes', methods=['GET'])
 def citas_pendientes():
-    conn = get_db()
-    cursor = conn.cursor()
+    try:
+        pagina = leer_paginacion()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    cursor.execute("""
+    filtros, params = filtros_paginacion(pagina)
+
+    query = consulta_pagina_json(f"""
         SELECT c.id, c.servicio, e.nombre as estilista, c.fecha, c.hora, c.estado,
-               u.nombre AS cliente, u.telefono AS telefono
+               u.nombre AS cliente, u.telefono AS telefono,
+               row_number() OVER (ORDER BY c.fecha ASC, c.hora ASC, c.id ASC) AS n
         FROM citas c
         JOIN usuarios u ON c.usuario_id = u.id
         LEFT JOIN estilistas e ON c.estilista = e.id
-        WHERE c.estado IN ('Pendiente', 'Confirmada')
-        ORDER BY c.fecha ASC, c.hora ASC;
+        WHERE c.estado IN ('Pendiente', 'Confirmada'){filtros}
+        ORDER BY c.fecha ASC, c.hora ASC, c.id ASC
+        LIMIT %(limite)s
+    """, """
+        json_build_object(
+            'id', id,
+            'servicio', servicio,
+            'estilista', COALESCE(estilista, 'Sin asignar'),
+            'fecha', fecha,
+            'hora', to_char(hora, 'HH24:MI'),
+            'estado', estado,
+            'cliente', cliente,
+            'telefono', telefono
+        )
     """)
 
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
-
-    citas = []
-    for row in rows:
-        citas.append({
-            "id": row[0],
-            "servicio": row[1],
-            "estilista": row[2] if row[2] else "Sin asignar",
-            "fecha": str(row[3]),
-            "hora": row[4].strftime("%H:%M"),
-            "estado": row[5],
-            "cliente": row[6],
-            "telefono": row[7]
-        })
-
-    return jsonify(citas)
+    with get_db(lectura=True, posicion=posicion_lectura()) as conn, conn.cursor() as cursor:
+        cursor.execute(query, params)
+        return respuesta_paginada(cursor.fetchone())
     
 
+# ================================
+#   EXPORTAR CITAS (NDJSON O CSV EN STREAMING)
+# ================================
+ESTADOS_CITA = ("Pendiente", "Confirmada", "Cancelada")
+COLUMNAS_EXPORTACION = [
+    "id", "fecha", "hora", "servicio", "estado", "notas",
+    "estilista_id", "estilista", "usuario_id", "cliente", "telefono"
+]
+# Filas que trae cada viaje del cursor del servidor
+FILAS_POR_LOTE = 2000
+
+@app.route("/citas/exportar", methods=["GET"])
+def exportar_citas():
+    """Exporta citas con un cursor del lado del servidor, sin cargarlas en memoria.
+
+    Filtros: desde, hasta, estado (separados por coma) y despues_de (id de
+    la última cita recibida, para retomar una exportación cortada).
+    """
+    formato = request.args.get("formato", "ndjson")
+    if formato not in ("ndjson", "csv"):
+        return jsonify({"error": "Formato inválido (ndjson o csv)"}), 400
+
+    condiciones = []
+    params = {}
+
+    for campo, operador in (("desde", ">="), ("hasta", "<=")):
+        if request.args.get(campo):
+            params[campo] = parsear_fecha(request.args[campo])
+            if not params[campo]:
+                return jsonify({"error": "Fecha inválida"}), 400
+            condiciones.append(f"c.fecha {operador} %({campo})s")
+
+    if request.args.get("estado"):
+        estados = [e.strip() for e in request.args["estado"].split(",") if e.strip()]
+        if any(e not in ESTADOS_CITA for e in estados):
+            return jsonify({"error": "Estado inválido"}), 400
+        condiciones.append("c.estado = ANY(%(estados)s)")
+        params["estados"] = estados
+
+    if request.args.get("despues_de"):
+        try:
+            params["despues_de"] = int(request.args["despues_de"])
+        except ValueError:
+            return jsonify({"error": "despues_de debe ser un id"}), 400
+        condiciones.append("c.id > %(despues_de)s")
+
+    where = ("WHERE " + " AND ".join(condiciones)) if condiciones else ""
+    query = f"""
+        SELECT c.id, c.fecha, c.hora, c.servicio, c.estado, c.notas,
+               c.estilista, e.nombre, c.usuario_id, u.nombre, u.telefono
+        FROM citas c
+        LEFT JOIN usuarios u ON c.usuario_id = u.id
+        LEFT JOIN estilistas e ON c.estilista = e.id
+        {where}
+        ORDER BY c.id
+    """
+
+    def filas():
+        # La conexión queda prestada mientras dura la descarga y se devuelve
+        # al pool aunque el cliente corte a la mitad
+        with get_db(lectura=True, posicion=posicion_lectura()) as conn, conn.cursor(name="exportar_citas") as cur:
+            cur.itersize = FILAS_POR_LOTE
+            cur.execute(query, params)
+            for row in cur:
+                fila = dict(zip(COLUMNAS_EXPORTACION, row))
+                fila["fecha"] = fila["fecha"].isoformat()
+                fila["hora"] = fila["hora"].strftime("%H:%M")
+                yield fila
+
+    def ndjson():
+        for fila in filas():
+            yield json.dumps(fila, ensure_ascii=False) + "\n"
+
+    def csv_():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=COLUMNAS_EXPORTACION)
+        writer.writeheader()
+        for n, fila in enumerate(filas(), 1):
+            writer.writerow(fila)
+            if n % 500 == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    if formato == "csv":
+        resp = Response(stream_with_context(csv_()), mimetype="text/csv")
+    else:
+        resp = Response(stream_with_context(ndjson()), mimetype="application/x-ndjson")
+    resp.headers["Content-Disposition"] = f"attachment; filename=citas.{formato}"
+    return resp
+
+
 # ================================
 #   CONFIRMAR CITA
 # ================================
 @app.route("/citas/confirmar/<int:id>", methods=["PUT"])
 def confirmar_cita(id):
     try:
-        conn = get_db()
-        cur = conn.cursor()
-
-        cur.execute("""
-            UPDATE citas
-            SET estado = 'Confirmada'
-            WHERE id = %s
-        """, (id,))
-
-        conn.commit()
-        cur.close()
-        conn.close()
+        with get_db() as conn, conn.cursor() as cur:
+            cur.ejecutar_preparada("""
+                UPDATE citas
+                SET estado = 'Confirmada'
+                WHERE id = %s
+                RETURNING estilista, fecha, hora
+            """, (id,))
+            actualizada = cur.fetchone()
+
+            if actualizada:
+                estilista, fecha, hora = actualizada
+                notificar_ocupacion(cur, estilista, fecha)
+                notificar_evento(cur, "cita_confirmada", estilista, [fecha], id=id, hora=hora.strftime("%H:%M"))
+            conn.commit()
+
+        if actualizada:
+            indice_ocupacion.invalidar(estilista, fecha)
 
         return jsonify({"mensaje": "Cita confirmada"})
 
+    except (psycopg2.errors.UniqueViolation, psycopg2.errors.ExclusionViolation):
+        # Una cita cancelada no se puede reactivar si alguien más ya tomó el horario
+        return jsonify({"error": "Este horario ya está ocupado"}), 400
+
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -572,21 +1084,157 @@ def rechazar_cita(id):
         data = request.get_json()
         razon = data.get("razon", "Sin especificar")
 
-        conn = get_db()
-        cur = conn.cursor()
+        with get_db() as conn, conn.cursor() as cur:
+            cur.ejecutar_preparada("""
+                UPDATE citas
+                SET estado = 'Cancelada',
+                    notas = %s
+                WHERE id = %s
+                RETURNING estilista, fecha, hora
+            """, (razon, id))
+            actualizada = cur.fetchone()
+
+            if actualizada:
+                estilista, fecha, hora = actualizada
+                notificar_ocupacion(cur, estilista, fecha)
+                notificar_evento(cur, "cita_cancelada", estilista, [fecha], id=id, hora=hora.strftime("%H:%M"))
+            conn.commit()
+
+        if actualizada:
+            indice_ocupacion.invalidar(estilista, fecha)
 
-        cur.execute("""
-            UPDATE citas
-            SET estado = 'Cancelada',
-                notas = %s
-            WHERE id = %s
-        """, (razon, id))
+        return jsonify({"mensaje": "Cita cancelada"})
 
-        conn.commit()
-        cur.close()
-        conn.close()
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        return jsonify({"mensaje": "Cita cancelada"})
+
+# ================================
+#   CONFIRMAR, RECHAZAR Y ELIMINAR EN LOTE
+# ================================
+# Acciones que se aceptan como máximo en una petición
+LOTE_MAX = 200
+EVENTOS_LOTE = {
+    "confirmar": "cita_confirmada",
+    "rechazar": "cita_cancelada",
+    "eliminar": "cita_eliminada"
+}
+
+@app.route("/citas/lote", methods=["POST"])
+@idempotente
+def citas_lote():
+    """Aplica varias acciones sobre citas en una sola transacción.
+
+    Cuerpo: {"acciones": [{"id": 1, "accion": "confirmar"},
+    {"id": 2, "accion": "rechazar", "razon": "..."}, {"id": 3, "accion": "eliminar"}]}.
+    Primero se eliminan, luego se rechazan y al final se confirman, cada
+    grupo con una sola sentencia, así que confirmar puede reactivar un
+    horario que otra acción del lote liberó. Responde el resultado de
+    cada id en el orden recibido.
+    """
+    data = request.get_json(silent=True) or {}
+    acciones = data.get("acciones")
+    if not isinstance(acciones, list) or not acciones:
+        return jsonify({"error": "Se esperaba una lista de acciones"}), 400
+    if len(acciones) > LOTE_MAX:
+        return jsonify({"error": f"No se pueden enviar más de {LOTE_MAX} acciones"}), 400
+
+    por_accion = {accion: {} for accion in EVENTOS_LOTE}
+    orden = []
+    for item in acciones:
+        try:
+            id_cita = int(item.get("id"))
+        except (AttributeError, TypeError, ValueError):
+            return jsonify({"error": "Cada acción necesita un id numérico"}), 400
+        accion = item.get("accion")
+        if accion not in EVENTOS_LOTE:
+            return jsonify({"error": f"Acción inválida: {accion}"}), 400
+        if any(id_cita in ids for ids in por_accion.values()):
+            return jsonify({"error": f"La cita {id_cita} aparece más de una vez"}), 400
+        por_accion[accion][id_cita] = item.get("razon") or "Sin especificar"
+        orden.append((id_cita, accion))
+
+    try:
+        with get_db() as conn, conn.cursor() as cur:
+            cambiadas = {}  # id -> (accion, estilista, fecha, hora)
+            ocupadas = set()
+
+            if por_accion["eliminar"]:
+                cur.execute("""
+                    DELETE FROM citas
+                    WHERE id = ANY(%s)
+                    RETURNING id, estilista, fecha, hora
+                """, (list(por_accion["eliminar"]),))
+                for id_cita, *fila in cur.fetchall():
+                    cambiadas[id_cita] = ("eliminar", *fila)
+
+            if por_accion["rechazar"]:
+                cur.execute("""
+                    UPDATE citas c
+                    SET estado = 'Cancelada',
+                        notas = v.razon
+                    FROM unnest(%s::int[], %s::text[]) AS v(id, razon)
+                    WHERE c.id = v.id
+                    RETURNING c.id, c.estilista, c.fecha, c.hora
+                """, (list(por_accion["rechazar"]), list(por_accion["rechazar"].values())))
+                for id_cita, *fila in cur.fetchall():
+                    cambiadas[id_cita] = ("rechazar", *fila)
+
+            if por_accion["confirmar"]:
+                # Las activas no pueden chocar con nadie: ya ocupan su horario
+                cur.execute("""
+                    UPDATE citas
+                    SET estado = 'Confirmada'
+                    WHERE id = ANY(%s)
+                    AND estado IN ('Pendiente', 'Confirmada')
+                    RETURNING id, estilista, fecha, hora
+                """, (list(por_accion["confirmar"]),))
+                for id_cita, *fila in cur.fetchall():
+                    cambiadas[id_cita] = ("confirmar", *fila)
+
+                # Las canceladas se reactivan una a una para que un choque
+                # solo falle esa cita y no todo el lote
+                for id_cita in por_accion["confirmar"]:
+                    if id_cita in cambiadas:
+                        continue
+                    cur.execute("SAVEPOINT reactivar")
+                    try:
+                        cur.ejecutar_preparada("""
+                            UPDATE citas
+                            SET estado = 'Confirmada'
+                            WHERE id = %s
+                            RETURNING estilista, fecha, hora
+                        """, (id_cita,))
+                        fila = cur.fetchone()
+                    except (psycopg2.errors.UniqueViolation, psycopg2.errors.ExclusionViolation):
+                        cur.execute("ROLLBACK TO SAVEPOINT reactivar")
+                        ocupadas.add(id_cita)
+                        continue
+                    cur.execute("RELEASE SAVEPOINT reactivar")
+                    if fila:
+                        cambiadas[id_cita] = ("confirmar", *fila)
+
+            dias = sorted({(estilista, fecha) for _, estilista, fecha, _ in cambiadas.values()})
+            notificar_ocupaciones(cur, dias)
+            notificar_eventos(cur, [
+                evento(EVENTOS_LOTE[accion], estilista, [fecha], id=id_cita, hora=hora.strftime("%H:%M"))
+                for id_cita, (accion, estilista, fecha, hora) in cambiadas.items()
+            ])
+            conn.commit()
+
+        for estilista, fecha in dias:
+            indice_ocupacion.invalidar(estilista, fecha)
+
+        resultados = []
+        for id_cita, accion in orden:
+            resultado = {"id": id_cita, "accion": accion, "ok": id_cita in cambiadas}
+            if id_cita in ocupadas:
+                resultado["error"] = "Este horario ya está ocupado"
+            elif id_cita not in cambiadas:
+                resultado["error"] = "Cita no encontrada"
+            resultados.append(resultado)
+
+        return jsonify({"aplicadas": len(cambiadas), "resultados": resultados})
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -594,21 +1242,7 @@ def rechazar_cita(id):
 @app.route("/citas/hoy/count", methods=["GET"])
 def total_citas_hoy():
     try:
-        hoy = date.today()
-        conn = get_db()
-        cur = conn.cursor()
-
-        cur.execute("""
-            SELECT COUNT(*) 
-            FROM citas
-            WHERE fecha = %s AND estado = 'Confirmada'
-        """, (hoy,))
-
-        total = cur.fetchone()[0]
-        cur.close()
-        conn.close()
-
-        return jsonify({"total": total})
+        return jsonify({"total": resumen_dashboard()["total"]})
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -616,17 +1250,7 @@ def total_citas_hoy():
 @app.route("/citas/pendientes/count", methods=["GET"])
 def count_citas_pendientes():
     try:
-        conn = get_db()
-        cursor = conn.cursor()
-
-        query = "SELECT COUNT(*) FROM citas WHERE estado = 'Pendiente'"
-        cursor.execute(query)
-        total = cursor.fetchone()
-
-        if total is None:
-            return jsonify({"total_pendientes": 0}), 200
-
-        return jsonify({"total_pendientes": total[0]}), 200
+        return jsonify({"total_pendientes": resumen_dashboard()["total_pendientes"]}), 200
 
     except Exception as e:
         return jsonify({"error": "Error interno en el servidor"}), 500
@@ -636,54 +1260,376 @@ def count_citas_pendientes():
 # ================================
 @app.route("/horarios_ocupados/<int:id_estilista>/<fecha>", methods=["GET"])
 def obtener_horarios_ocupados(id_estilista, fecha):
-    conn = get_db()
-    cur = conn.cursor()
-
-    cur.execute("""
-        SELECT hora 
-        FROM citas
-        WHERE estilista = %s 
-        AND fecha = %s 
-        AND estado IN ('Pendiente', 'Confirmada')
-    """, (id_estilista, fecha))
+    dia = parsear_fecha(fecha)
+    if not dia:
+        return jsonify({"error": "Fecha inválida"}), 400
 
-    ocupados = [str(r[0])[:-3] for r in cur.fetchall()]
-    cur.close()
-    conn.close()
+    ocupados = ocupacion_rango(id_estilista, dia, dia)[dia]["ocupados"]
 
     return jsonify(ocupados)
 
 # ================================
-# CONTAR CITAS CONFIRMADAS DEL MES ACTUAL
+#   DISPONIBILIDAD DE UN ESTILISTA (DÍA O RANGO)
 # ================================
-@app.route("/citas/confirmadas/mes/count", methods=["GET"])
-def count_confirmed_month():
+def ocupacion_estilistas(ids_estilistas, desde, hasta):
+    """Devuelve {(estilista, fecha): entrada} de cada estilista y día del rango.
+
+    Se sirve del índice en memoria; los estilistas a los que les falte
+    cualquier día se consultan juntos en una sola query y se vuelve a
+    poblar el índice.
+    """
+    dias = [desde + timedelta(days=n) for n in range((hasta - desde).days + 1)]
+
+    resultado = {}
+    faltantes = []
+    for estilista in ids_estilistas:
+        for dia in dias:
+            entrada = indice_ocupacion.obtener(estilista, dia)
+            if entrada is None:
+                faltantes.append(estilista)
+                break
+            resultado[(estilista, dia)] = entrada
+    if not faltantes:
+        return resultado
+
+    generacion = indice_ocupacion.generacion()
+    with get_db() as conn, conn.cursor() as cur:
+        cur.ejecutar_preparada("""
+            SELECT e.id,
+                   d::date AS fecha,
+                   ARRAY(
+                       SELECT b.hora
+                       FROM horarios_bloqueados b
+                       WHERE b.id_estilista = e.id AND b.fecha = d::date
+                   ) AS bloqueos,
+                   ARRAY(
+                       SELECT ARRAY[
+                           EXTRACT(EPOCH FROM c.hora)::int / 60,
+                           EXTRACT(EPOCH FROM c.hora)::int / 60 + c.duracion_minutos
+                       ]
+                       FROM citas c
+                       WHERE c.estilista = e.id
+                       AND c.fecha = d::date
+                       AND c.estado IN ('Pendiente', 'Confirmada')
+                       ORDER BY c.hora
+                   ) AS citas,
+                   CASE WHEN EXISTS (SELECT 1 FROM horarios_estilista h WHERE h.estilista_id = e.id)
+                   THEN ARRAY(
+                       SELECT ARRAY[
+                           EXTRACT(EPOCH FROM h.inicio)::int / 60,
+                           EXTRACT(EPOCH FROM h.fin)::int / 60
+                       ]
+                       FROM horarios_estilista h
+                       WHERE h.estilista_id = e.id
+                       AND h.dia_semana = EXTRACT(ISODOW FROM d)
+                       ORDER BY h.inicio
+                   ) END AS jornada
+            FROM unnest(%(estilistas)s::int[]) AS e(id)
+            CROSS JOIN generate_series(%(desde)s::date, %(hasta)s::date, INTERVAL '1 day') AS d
+        """, {"estilistas": faltantes, "desde": desde, "hasta": hasta})
+        rows = cur.fetchall()
+
+    for estilista, fecha, bloqueos, citas, jornada in rows:
+        citas = tuple(tuple(c) for c in citas)
+        entrada = {
+            "bloqueos": tuple(str(h) for h in bloqueos),
+            "ocupados": tuple(agenda.a_hora(inicio) for inicio, _ in citas),
+            "citas": citas,
+            # Sin horario propio se usa el general
+            "jornada": agenda.JORNADA if jornada is None else tuple(tuple(j) for j in jornada)
+        }
+        indice_ocupacion.guardar(estilista, fecha, entrada, generacion)
+        resultado[(estilista, fecha)] = entrada
+
+    return resultado
+
+
+def ocupacion_rango(id_estilista, desde, hasta):
+    """Devuelve {fecha: entrada} de cada día del rango para un estilista"""
+    return {
+        fecha: entrada
+        for (_, fecha), entrada in ocupacion_estilistas([id_estilista], desde, hasta).items()
+    }
+
+
+def dia_agenda(entrada):
+    return agenda.DiaAgenda(entrada["jornada"], entrada["citas"], bloqueado=bool(entrada["bloqueos"]))
+
+
+def duracion_servicio(nombre):
+    """Minutos que dura un servicio del catálogo (DURACION_DEFAULT si no existe)"""
+    duraciones = cache_catalogo.obtener("duraciones")
+    if duraciones is None:
+        generacion = cache_catalogo.generacion()
+        with get_db() as conn, conn.cursor() as cur:
+            cur.execute("SELECT nombre, duracion_minutos FROM servicios")
+            duraciones = dict(cur.fetchall())
+        cache_catalogo.guardar("duraciones", duraciones, generacion)
+    return duraciones.get(nombre, agenda.DURACION_DEFAULT)
+
+
+def consultar_disponibilidad(id_estilista, desde, hasta, duracion=agenda.DURACION_DEFAULT):
+    """Calcula bloqueos, horarios ofrecidos, ocupados y libres de cada día del rango.
+
+    "horarios" son los inicios de la jornada para un servicio de duracion
+    minutos y "ocupados" los que se traslapan con otra cita.
+    """
+    dias = []
+    for fecha, ocupacion in sorted(ocupacion_rango(id_estilista, desde, hasta).items()):
+        dia = dia_agenda(ocupacion)
+        bloqueado = bool(ocupacion["bloqueos"])
+        horarios = [agenda.a_hora(m) for m in dia.horarios(duracion)]
+        disponibles = [agenda.a_hora(m) for m in dia.disponibles(duracion)]
+        libres = set(disponibles)
+        dias.append({
+            "fecha": fecha.strftime("%Y-%m-%d"),
+            "bloqueado": bloqueado,
+            "duracion": duracion,
+            "horarios": horarios,
+            "ocupados": [] if bloqueado else [h for h in horarios if h not in libres],
+            "disponibles": disponibles
+        })
+    return dias
+
+
+@app.route("/disponibilidad/<int:id_estilista>/<fecha>", methods=["GET"])
+def disponibilidad_dia(id_estilista, fecha):
+    """Disponibilidad de un día; ?servicio= ajusta los horarios a su duración"""
+    dia = parsear_fecha(fecha)
+    if not dia:
+        return jsonify({"error": "Fecha inválida"}), 400
+
     try:
-        conn = get_db()
-        cur = conn.cursor()
+        duracion = duracion_servicio(request.args.get("servicio"))
+        dias = consultar_disponibilidad(id_estilista, dia, dia, duracion)
 
-        today = date.today()
-        first_day = today.replace(day=1)
-        if today.month == 12:
-            next_month = today.replace(year=today.year+1, month=1, day=1)
-        else:
-            next_month = today.replace(month=today.month+1, day=1)
+        return jsonify(dias[0])
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        query = """
-            SELECT COUNT(*) 
-            FROM citas
-            WHERE estado = 'Confirmada'
-              AND fecha >= %s
-              AND fecha < %s
-        """
 
-        cur.execute(query, (first_day, next_month))
-        total = cur.fetchone()[0]
+@app.route("/disponibilidad/<int:id_estilista>", methods=["GET"])
+def disponibilidad_rango(id_estilista):
+    desde = parsear_fecha(request.args.get("desde"))
+    hasta = parsear_fecha(request.args.get("hasta"))
+
+    if not desde or not hasta or hasta < desde:
+        return jsonify({"error": "Rango de fechas inválido"}), 400
+
+    if (hasta - desde).days >= MAX_DIAS_DISPONIBILIDAD:
+        return jsonify({"error": f"El rango no puede superar {MAX_DIAS_DISPONIBILIDAD} días"}), 400
 
-        cur.close()
-        conn.close()
+    try:
+        duracion = duracion_servicio(request.args.get("servicio"))
+        dias = consultar_disponibilidad(id_estilista, desde, hasta, duracion)
+
+        return jsonify(dias)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# Horarios que se devuelven como máximo en /disponibilidad/servicio
+LIMITE_HORARIOS = 10
+LIMITE_HORARIOS_MAX = 100
+
+@app.route("/disponibilidad/servicio/<servicio_nombre>", methods=["GET"])
+def primeros_horarios(servicio_nombre):
+    """Los primeros horarios libres de un servicio con cualquier estilista que lo haga.
+
+    Parámetros: desde (hoy por defecto), dias (cuántos días revisar) y
+    limite (cuántos horarios devolver). Ordenados por fecha y hora.
+    """
+    hoy = date.today()
+    desde = parsear_fecha(request.args["desde"]) if request.args.get("desde") else hoy
+    if not desde:
+        return jsonify({"error": "Fecha inválida"}), 400
+    desde = max(desde, hoy)
+
+    try:
+        dias = int(request.args.get("dias", 14))
+        limite = min(int(request.args.get("limite", LIMITE_HORARIOS)), LIMITE_HORARIOS_MAX)
+    except ValueError:
+        return jsonify({"error": "dias y limite deben ser números"}), 400
+    if not 1 <= dias <= MAX_DIAS_DISPONIBILIDAD or limite < 1:
+        return jsonify({"error": f"dias debe estar entre 1 y {MAX_DIAS_DISPONIBILIDAD}"}), 400
+
+    def consultar():
+        with get_db() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT s.duracion_minutos,
+                       COALESCE(json_agg(json_build_object('id', e.id, 'nombre', e.nombre)
+                                ORDER BY e.nombre) FILTER (WHERE e.id IS NOT NULL), '[]')
+                FROM servicios s
+                LEFT JOIN estilista_servicios es ON es.servicio_id = s.id
+                LEFT JOIN estilistas e ON e.id = es.estilista_id
+                WHERE s.nombre = %s
+                GROUP BY s.id
+            """, (servicio_nombre,))
+            return cur.fetchone()
+
+    clave = ("calificados", servicio_nombre)
+    calificados = cache_catalogo.obtener(clave)
+    if calificados is None:
+        generacion = cache_catalogo.generacion()
+        calificados = consultar()
+        if calificados is not None:
+            cache_catalogo.guardar(clave, calificados, generacion)
+    if calificados is None:
+        return jsonify({"error": "Servicio no encontrado"}), 404
+
+    duracion, estilistas = calificados
+    hasta = desde + timedelta(days=dias - 1)
+    ocupacion = ocupacion_estilistas([e["id"] for e in estilistas], desde, hasta)
+
+    ahora = datetime.now()
+    horarios = []
+    for n in range(dias):
+        fecha = desde + timedelta(days=n)
+        # Hoy solo cuentan los horarios que todavía no pasan
+        minimo = ahora.hour * 60 + ahora.minute if fecha == hoy else 0
+        # Los inicios de todos los estilistas del día, mezclados en orden
+        libres = heapq.merge(*(
+            ((m, e["nombre"], e["id"]) for m in dia_agenda(ocupacion[(e["id"], fecha)]).disponibles(duracion, minimo))
+            for e in estilistas
+        ))
+        for inicio, nombre, estilista in itertools.islice(libres, limite - len(horarios)):
+            horarios.append({
+                "fecha": fecha.strftime("%Y-%m-%d"),
+                "hora": agenda.a_hora(inicio),
+                "fin": agenda.a_hora(inicio + duracion),
+                "id_estilista": estilista,
+                "estilista": nombre
+            })
+        if len(horarios) >= limite:
+            break
+
+    return jsonify(horarios)
+
+# ================================
+#   EVENTOS EN VIVO (SERVER-SENT EVENTS)
+# ================================
+@app.route("/eventos", methods=["GET"])
+def eventos():
+    """Stream de cambios en citas y bloqueos.
+
+    Filtros opcionales: estilista, fecha (un día) o desde/hasta.
+    """
+    filtro = {"estilista": None, "desde": None, "hasta": None}
+
+    if request.args.get("estilista"):
+        try:
+            filtro["estilista"] = int(request.args["estilista"])
+        except ValueError:
+            return jsonify({"error": "Estilista inválido"}), 400
+
+    if request.args.get("fecha"):
+        dia = parsear_fecha(request.args["fecha"])
+        if not dia:
+            return jsonify({"error": "Fecha inválida"}), 400
+        filtro["desde"] = filtro["hasta"] = dia
+    for campo in ("desde", "hasta"):
+        if request.args.get(campo):
+            filtro[campo] = parsear_fecha(request.args[campo])
+            if not filtro[campo]:
+                return jsonify({"error": "Fecha inválida"}), 400
+
+    if not difusor.disponible():
+        return jsonify({"error": "Eventos no disponibles"}), 503
+
+    suscripcion = difusor.suscribir(**filtro)
+    if suscripcion is None:
+        return respuesta_ocupado()
+
+    resp = Response(difusor.flujo(suscripcion), mimetype="text/event-stream")
+    # Por si el cliente corta antes de que empiece el stream
+    resp.call_on_close(lambda: difusor.cancelar(suscripcion))
+    resp.headers["Cache-Control"] = "no-cache"
+    # Que nginx/Render no acumulen el stream en un buffer
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
 
-        return jsonify({"total_confirmadas_mes": total})
+# ================================
+# DASHBOARD DEL ADMIN
+# ================================
+def resumen_dashboard():
+    """Todas las cifras del panel de admin en una sola consulta.
+
+    Lee de resumen_citas, que mantiene un trigger sobre citas con el total
+    por (fecha, estilista, estado), así el costo no crece con el historial.
+    """
+    hoy = date.today()
+    primer_dia = hoy.replace(day=1)
+    if hoy.month == 12:
+        mes_siguiente = hoy.replace(year=hoy.year+1, month=1, day=1)
+    else:
+        mes_siguiente = hoy.replace(month=hoy.month+1, day=1)
+
+    with get_db(lectura=True, posicion=posicion_lectura()) as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT
+                COALESCE(SUM(total) FILTER (WHERE fecha = %(hoy)s AND estado = 'Confirmada'), 0),
+                COALESCE(SUM(total) FILTER (WHERE estado = 'Pendiente'), 0),
+                COALESCE(SUM(total) FILTER (WHERE estado = 'Confirmada'
+                                              AND fecha >= %(primer_dia)s
+                                              AND fecha < %(mes_siguiente)s), 0),
+                COALESCE(SUM(total) FILTER (WHERE estado = 'Confirmada'
+                                              AND fecha >= %(hace_30)s), 0),
+                COALESCE(SUM(total) FILTER (WHERE fecha >= %(hace_30)s), 0),
+                (
+                    SELECT COALESCE(json_agg(json_build_object(
+                               'id_estilista', s.id,
+                               'nombre', s.nombre,
+                               'citas_hoy', s.citas_hoy
+                           ) ORDER BY s.nombre), '[]'::json)
+                    FROM (
+                        SELECT e.id, e.nombre, COALESCE(SUM(r.total), 0) AS citas_hoy
+                        FROM estilistas e
+                        LEFT JOIN resumen_citas r ON r.estilista = e.id AND r.fecha = %(hoy)s
+                        GROUP BY e.id, e.nombre
+                    ) s
+                )
+            FROM resumen_citas
+            WHERE fecha >= LEAST(%(hace_30)s, %(primer_dia)s)
+               OR (estado = 'Pendiente' AND total > 0)
+        """, {
+            "hoy": hoy,
+            "primer_dia": primer_dia,
+            "mes_siguiente": mes_siguiente,
+            "hace_30": hoy - timedelta(days=30)
+        })
+
+        hoy_conf, pendientes, mes_conf, conf_30, total_30, staff = cur.fetchone()
+
+    # Satisfacción basada en citas confirmadas vs el total de los últimos 30 días
+    if total_30 > 0:
+        satisfaccion = round((conf_30 / total_30) * 100, 1)
+    else:
+        satisfaccion = 100.0
+
+    return {
+        "total": hoy_conf,
+        "total_pendientes": pendientes,
+        "total_confirmadas_mes": mes_conf,
+        "satisfaccion": satisfaccion,
+        "staff": staff
+    }
+
+
+@app.route("/admin/dashboard", methods=["GET"])
+def dashboard():
+    try:
+        return jsonify(resumen_dashboard())
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# ================================
+# CONTAR CITAS CONFIRMADAS DEL MES ACTUAL
+# ================================
+@app.route("/citas/confirmadas/mes/count", methods=["GET"])
+def count_confirmed_month():
+    try:
+        return jsonify({"total_confirmadas_mes": resumen_dashboard()["total_confirmadas_mes"]})
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -694,36 +1640,98 @@ def count_confirmed_month():
 @app.route("/estadisticas/satisfaccion", methods=["GET"])
 def estadistica_satisfaccion():
     try:
-        conn = get_db()
-        cur = conn.cursor()
+        return jsonify({"satisfaccion": resumen_dashboard()["satisfaccion"]})
 
-        # Calcular satisfacción basada en citas confirmadas vs canceladas
-        cur.execute("""
-            SELECT 
-                COUNT(*) FILTER (WHERE estado = 'Confirmada') as confirmadas,
-                COUNT(*) FILTER (WHERE estado = 'Cancelada') as canceladas,
-                COUNT(*) as total
-            FROM citas
-            WHERE fecha >= CURRENT_DATE - INTERVAL '30 days'
-        """)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        resultado = cur.fetchone()
-        cur.close()
-        conn.close()
+# ================================
+# ESTADÍSTICAS POR MES Y ESTILISTA
+# ================================
+# Meses que se pueden pedir de una vez en /estadisticas/mensuales
+MAX_MESES_ESTADISTICAS = 60
 
-        if resultado[2] > 0:
-            satisfaccion = round((resultado[0] / resultado[2]) * 100, 1)
-        else:
-            satisfaccion = 100.0
+def parsear_mes(valor):
+    """Convierte 'YYYY-MM' al primer día de ese mes, o None si no es válido"""
+    try:
+        return datetime.strptime(valor, "%Y-%m").date()
+    except (TypeError, ValueError):
+        return None
 
-        return jsonify({"satisfaccion": satisfaccion})
+@app.route("/estadisticas/mensuales", methods=["GET"])
+def estadisticas_mensuales():
+    """Citas por mes y estilista entre desde y hasta ('YYYY-MM', los últimos 12 meses por defecto).
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    Lee de resumen_mensual, que mantiene un trigger sobre citas, así
+    que cubre también los meses archivados sin tocar sus filas.
+    """
+    hasta = parsear_mes(request.args["hasta"]) if request.args.get("hasta") else date.today().replace(day=1)
+    if not hasta:
+        return jsonify({"error": "Mes inválido"}), 400
+    if request.args.get("desde"):
+        desde = parsear_mes(request.args["desde"])
+    else:
+        # Once meses antes de hasta
+        indice = hasta.year * 12 + hasta.month - 1 - 11
+        desde = date(indice // 12, indice % 12 + 1, 1)
+    if not desde:
+        return jsonify({"error": "Mes inválido"}), 400
+    meses = (hasta.year - desde.year) * 12 + hasta.month - desde.month + 1
+    if not 1 <= meses <= MAX_MESES_ESTADISTICAS:
+        return jsonify({"error": f"El rango debe ser de 1 a {MAX_MESES_ESTADISTICAS} meses"}), 400
+
+    try:
+        estilista = int(request.args["estilista"]) if request.args.get("estilista") else None
+    except ValueError:
+        return jsonify({"error": "Estilista inválido"}), 400
+
+    filtro = "AND r.estilista = %(estilista)s" if estilista else ""
+    with get_db(lectura=True, posicion=posicion_lectura()) as conn, conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT COALESCE(json_agg(json_build_object(
+                       'mes', to_char(m.mes, 'YYYY-MM'),
+                       'id_estilista', m.estilista,
+                       'estilista', COALESCE(e.nombre, 'Sin asignar'),
+                       'confirmadas', m.confirmadas,
+                       'canceladas', m.canceladas,
+                       'pendientes', m.pendientes,
+                       'minutos_confirmados', m.minutos_confirmados,
+                       'satisfaccion', round(m.confirmadas * 100.0 / m.total, 1)
+                   ) ORDER BY m.mes, e.nombre), '[]')::text
+            FROM (
+                SELECT r.mes, r.estilista,
+                       SUM(r.total) AS total,
+                       COALESCE(SUM(r.total) FILTER (WHERE r.estado = 'Confirmada'), 0) AS confirmadas,
+                       COALESCE(SUM(r.total) FILTER (WHERE r.estado = 'Cancelada'), 0) AS canceladas,
+                       COALESCE(SUM(r.total) FILTER (WHERE r.estado = 'Pendiente'), 0) AS pendientes,
+                       COALESCE(SUM(r.minutos) FILTER (WHERE r.estado = 'Confirmada'), 0) AS minutos_confirmados
+                FROM resumen_mensual r
+                WHERE r.mes BETWEEN %(desde)s AND %(hasta)s {filtro}
+                GROUP BY r.mes, r.estilista
+                HAVING SUM(r.total) > 0
+            ) m
+            LEFT JOIN estilistas e ON e.id = m.estilista
+        """, {"desde": desde, "hasta": hasta, "estilista": estilista})
+        return respuesta_json(cur.fetchone()[0])
 
 @app.route("/health", methods=["GET"])
 def health():
-    return jsonify({"status": "ok"}), 200
+    bcrypt_stats = contrasenas.estadisticas
+    return jsonify({
+        "status": "ok",
+        "bcrypt": {
+            "en_curso": bcrypt_stats["en_curso"],
+            "total": bcrypt_stats["total"],
+            "rechazadas": bcrypt_stats["rechazadas"],
+            "latencia_promedio_ms": round(
+                bcrypt_stats["segundos_total"] / bcrypt_stats["total"] * 1000, 1
+            ) if bcrypt_stats["total"] else 0
+        }
+    }), 200
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(metricas.exportar(), mimetype="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     port = int(os.environ.get('PORT', 5000))
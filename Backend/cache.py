@@ -0,0 +1,159 @@
+import os
+import select
+import threading
+import time
+from collections import OrderedDict
+
+from db import conectar
+
+# Sincronizar las cachés de los workers con LISTEN/NOTIFY; si está apagado
+# cada caché solo expira por TTL
+CACHE_NOTIFY = os.environ.get('CACHE_NOTIFY', '1') == '1'
+
+
+class Escucha:
+    """Un hilo LISTEN por proceso que reparte las notificaciones por canal.
+
+    Los suscriptores se registran al importar los módulos; el hilo se
+    arranca la primera vez que alguien pregunta si está conectado, ya
+    dentro del worker (después del fork de gunicorn).
+    """
+
+    def __init__(self):
+        self._canales = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._conectado = False
+
+    def suscribir(self, canal, al_notificar, al_reconectar):
+        self._canales.setdefault(canal, []).append((al_notificar, al_reconectar))
+
+    def conectado(self):
+        self._iniciar()
+        return self._conectado
+
+    def _iniciar(self):
+        if not CACHE_NOTIFY or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._conectado = False
+        # Lo heredado del proceso padre no está cubierto por este listener
+        self._reconectados()
+        hilo = threading.Thread(target=self._escuchar, name="cache-listener", daemon=True)
+        hilo.start()
+
+    def _reconectados(self):
+        for suscriptores in self._canales.values():
+            for _, al_reconectar in suscriptores:
+                al_reconectar()
+
+    def _escuchar(self):
+        while True:
+            conn = None
+            try:
+                conn = conectar()
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    for canal in self._canales:
+                        cur.execute(f"LISTEN {canal}")
+                # Lo que haya en memoria pudo cambiar mientras no escuchábamos
+                self._reconectados()
+                self._conectado = True
+
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        n = conn.notifies.pop(0)
+                        for al_notificar, _ in self._canales.get(n.channel, []):
+                            al_notificar(n.payload)
+            except Exception:
+                self._conectado = False
+                self._reconectados()
+                time.sleep(5)
+            finally:
+                if conn is not None and not conn.closed:
+                    conn.close()
+
+
+escucha = Escucha()
+
+
+def notificar(cur, canal, payload=""):
+    """Envía un NOTIFY dentro de la transacción actual (se entrega al hacer commit)"""
+    if not CACHE_NOTIFY:
+        return
+    cur.execute("SELECT pg_notify(%s, %s)", (canal, payload))
+
+
+class CacheLRU:
+    """Caché LRU en memoria con TTL, invalidable por NOTIFY en un canal.
+
+    Cada invalidación incrementa una generación; un valor leído de la base
+    solo se guarda si no hubo invalidaciones mientras se consultaba, así una
+    lectura lenta no puede pisar un cambio más nuevo. Mientras el canal no
+    está conectado la caché no responde, porque podría estar desactualizada.
+    """
+
+    def __init__(self, canal=None, max_entradas=1000, ttl=300):
+        self.canal = canal
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        self._generacion = 0
+        if canal:
+            escucha.suscribir(canal, self.al_notificar, self.limpiar)
+
+    def obtener(self, clave):
+        if self.canal and CACHE_NOTIFY and not escucha.conectado():
+            return None
+
+        with self._lock:
+            item = self._datos.get(clave)
+            if item is None:
+                return None
+            guardado, valor = item
+            if time.monotonic() - guardado > self.ttl:
+                del self._datos[clave]
+                return None
+            self._datos.move_to_end(clave)
+            return valor
+
+    def generacion(self):
+        with self._lock:
+            return self._generacion
+
+    def guardar(self, clave, valor, generacion):
+        with self._lock:
+            if generacion != self._generacion:
+                return
+            self._datos[clave] = (time.monotonic(), valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def descartar(self, clave):
+        with self._lock:
+            self._generacion += 1
+            self._datos.pop(clave, None)
+
+    def descartar_si(self, condicion):
+        """Descarta todas las claves para las que condicion(clave) es verdadero"""
+        with self._lock:
+            self._generacion += 1
+            for clave in [c for c in self._datos if condicion(c)]:
+                del self._datos[clave]
+
+    def limpiar(self):
+        with self._lock:
+            self._generacion += 1
+            self._datos.clear()
+
+    def al_notificar(self, payload):
+        """Por defecto cualquier aviso en el canal vacía la caché"""
+        self.limpiar()
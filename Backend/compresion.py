@@ -0,0 +1,89 @@
+"""Compresión y GET condicional para las respuestas de la API.
+
+instalar(app) agrega un after_request que:
+
+- A los GET que responden 200 sin ETag propio les pone uno débil con un
+  hash del cuerpo. Si el cliente ya lo tiene (If-None-Match) se responde
+  304 sin cuerpo, así los listados que se consultan seguido (citas
+  pendientes, historial) no se vuelven a mandar si no cambiaron. Se
+  marcan private, no-cache: el navegador los guarda pero siempre
+  revalida.
+- Comprime con brotli (si el módulo está instalado) o gzip, según
+  Accept-Encoding, los cuerpos de más de COMPRESION_MINIMO bytes.
+
+Las respuestas en streaming (/eventos, /citas/exportar) se dejan igual.
+"""
+import gzip
+import hashlib
+import os
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bytes a partir de los que se comprime; por debajo no vale la pena
+COMPRESION_MINIMO = int(os.environ.get('COMPRESION_MINIMO', 1024))
+# Niveles pensados para comprimir en cada petición, no los máximos
+GZIP_NIVEL = int(os.environ.get('GZIP_NIVEL', 6))
+BROTLI_CALIDAD = int(os.environ.get('BROTLI_CALIDAD', 4))
+
+COMPRIMIBLES = ("application/json", "text/")
+
+
+def _etiquetar(resp):
+    """ETag débil del cuerpo y respuesta 304 si el cliente ya lo tiene"""
+    if request.method not in ("GET", "HEAD") or resp.status_code != 200 or resp.get_etag()[0]:
+        return resp
+    resp.set_etag(hashlib.sha1(resp.get_data()).hexdigest(), weak=True)
+    if not resp.headers.get("Cache-Control"):
+        resp.cache_control.private = True
+        resp.cache_control.no_cache = True
+    return resp.make_conditional(request)
+
+
+def _codificacion():
+    if brotli is not None and request.accept_encodings["br"]:
+        return "br"
+    if request.accept_encodings["gzip"]:
+        return "gzip"
+    return None
+
+
+def _comprimir(resp):
+    if ("Content-Encoding" in resp.headers or resp.status_code in (204, 206, 304)
+            or not (resp.mimetype or "").startswith(COMPRIMIBLES)):
+        return resp
+    resp.vary.add("Accept-Encoding")
+    cuerpo = resp.get_data()
+    if len(cuerpo) < COMPRESION_MINIMO:
+        return resp
+
+    codificacion = _codificacion()
+    if codificacion is None:
+        return resp
+    if codificacion == "br":
+        comprimido = brotli.compress(cuerpo, quality=BROTLI_CALIDAD)
+    else:
+        comprimido = gzip.compress(cuerpo, compresslevel=GZIP_NIVEL, mtime=0)
+
+    resp.set_data(comprimido)
+    resp.headers["Content-Encoding"] = codificacion
+    # Otra codificación es otra representación: un ETag fuerte pasa a débil
+    etag, debil = resp.get_etag()
+    if etag and not debil:
+        resp.set_etag(etag, weak=True)
+    return resp
+
+
+def _despues(resp):
+    if resp.is_streamed or resp.direct_passthrough:
+        return resp
+    return _comprimir(_etiquetar(resp))
+
+
+def instalar(app):
+    """Engancha el ETag automático y la compresión a la app"""
+    app.after_request(_despues)
@@ -0,0 +1,124 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+import bcrypt
+
+# Costo de bcrypt para contraseñas nuevas (las existentes usan el de su hash)
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+# Procesos dedicados a bcrypt por worker; 0 ejecuta en el mismo hilo
+BCRYPT_WORKERS = int(os.environ.get('BCRYPT_WORKERS', 1))
+# Hashes en curso + en espera por worker antes de responder 503
+BCRYPT_MAX_COLA = int(os.environ.get('BCRYPT_MAX_COLA', 4))
+# Segundos máximos esperando un resultado
+BCRYPT_TIMEOUT = float(os.environ.get('BCRYPT_TIMEOUT', 10))
+
+# Límites (segundos) del histograma de latencia
+BUCKETS_LATENCIA = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class ServidorOcupado(Exception):
+    """No hay lugar en la cola de bcrypt; el handler debe responder 503"""
+
+
+def _hashear(contrasena):
+    return bcrypt.hashpw(contrasena, bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
+
+
+def _verificar(contrasena, hashed):
+    return bcrypt.checkpw(contrasena, hashed)
+
+
+_executor = None
+_executor_pid = None
+_lock = threading.Lock()
+_cupos = threading.BoundedSemaphore(BCRYPT_MAX_COLA)
+
+estadisticas = {
+    "en_curso": 0,
+    "total": 0,
+    "rechazadas": 0,
+    "errores": 0,
+    "segundos_total": 0.0,
+    "buckets": [0] * (len(BUCKETS_LATENCIA) + 1),
+}
+
+
+def _get_executor():
+    """Un pool de procesos por worker, creado después del fork de gunicorn"""
+    global _executor, _executor_pid
+    if _executor is not None and _executor_pid == os.getpid():
+        return _executor
+    with _lock:
+        if _executor is None or _executor_pid != os.getpid():
+            # spawn: los hijos solo importan este módulo, no la app ni sus hilos
+            _executor = ProcessPoolExecutor(
+                max_workers=BCRYPT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            _executor_pid = os.getpid()
+    return _executor
+
+
+def _registrar(segundos, error):
+    with _lock:
+        estadisticas["en_curso"] -= 1
+        estadisticas["total"] += 1
+        estadisticas["segundos_total"] += segundos
+        if error:
+            estadisticas["errores"] += 1
+        for i, limite in enumerate(BUCKETS_LATENCIA):
+            if segundos <= limite:
+                estadisticas["buckets"][i] += 1
+                break
+        else:
+            estadisticas["buckets"][-1] += 1
+
+
+def _ejecutar(funcion, *args):
+    if not _cupos.acquire(blocking=False):
+        with _lock:
+            estadisticas["rechazadas"] += 1
+        raise ServidorOcupado()
+
+    with _lock:
+        estadisticas["en_curso"] += 1
+    inicio = time.perf_counter()
+    error = True
+    futuro = None
+    try:
+        if BCRYPT_WORKERS <= 0:
+            resultado = funcion(*args)
+        else:
+            futuro = _get_executor().submit(funcion, *args)
+            # El cupo se libera cuando la tarea termina o se cancela, no
+            # cuando se deja de esperarla: así la cola real no pasa de
+            # BCRYPT_MAX_COLA aunque haya timeouts
+            futuro.add_done_callback(lambda _: _cupos.release())
+            try:
+                resultado = futuro.result(timeout=BCRYPT_TIMEOUT)
+            except TimeoutError:
+                futuro.cancel()
+                raise ServidorOcupado()
+        error = False
+        return resultado
+    finally:
+        _registrar(time.perf_counter() - inicio, error)
+        if futuro is None:
+            _cupos.release()
+
+
+def hashear_contrasena(contrasena):
+    """Devuelve el hash bcrypt (str) de una contraseña nueva"""
+    return _ejecutar(_hashear, contrasena.encode("utf-8")).decode("utf-8")
+
+
+def verificar_contrasena(contrasena, hashed):
+    """Compara una contraseña con su hash guardado (bytes o str)"""
+    if isinstance(hashed, memoryview):
+        hashed = bytes(hashed)
+    if isinstance(hashed, str):
+        hashed = hashed.encode("utf-8")
+    return _ejecutar(_verificar, contrasena.encode("utf-8"), hashed)
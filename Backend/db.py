@@ -0,0 +1,416 @@
+import functools
+import hashlib
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+import psycopg2.pool
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+
+if DATABASE_URL and DATABASE_URL.startswith('postgres://'):
+    DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
+
+# Réplica de solo lectura opcional para las rutas que solo consultan
+DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+
+if DATABASE_REPLICA_URL and DATABASE_REPLICA_URL.startswith('postgres://'):
+    DATABASE_REPLICA_URL = DATABASE_REPLICA_URL.replace('postgres://', 'postgresql://', 1)
+
+# Segundos sin intentar la réplica después de que falle (se usa la primaria)
+REPLICA_REINTENTO = float(os.environ.get('REPLICA_REINTENTO', 30))
+
+# sslmode al conectar por DATABASE_URL (disable para un Postgres local)
+DB_SSLMODE = os.environ.get('DB_SSLMODE', 'require')
+
+# Conexiones del pool por proceso (cada worker de gunicorn tiene el suyo).
+# Se abren todas al crear el pool y se reutilizan, sin cerrarlas al devolverlas.
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', 5))
+# Segundos para abrir una conexión; sin esto una réplica inalcanzable
+# (paquetes descartados) bloquea hasta el timeout de TCP del sistema
+DB_CONNECT_TIMEOUT = int(os.environ.get('DB_CONNECT_TIMEOUT', 5))
+# Segundos que se espera por una conexión libre antes de fallar
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+# Conexiones inactivas más tiempo que esto se verifican con SELECT 1 al prestarse
+DB_POOL_CHECK_IDLE = float(os.environ.get('DB_POOL_CHECK_IDLE', 30))
+
+# Sentencias preparadas en el servidor para las consultas más frecuentes (ver
+# ejecutar_preparada). 0 las desactiva, por ejemplo detrás de un PgBouncer en
+# modo transacción, donde cada transacción puede caer en otra sesión
+DB_PREPARADAS = os.environ.get('DB_PREPARADAS', '1') != '0'
+
+
+_observadores = []
+
+
+def observar_consultas(funcion):
+    """Registra funcion(cursor, query, vars, segundos), que se llama después de cada execute.
+
+    Devuelve una función que quita el observador.
+    """
+    _observadores.append(funcion)
+    return lambda: _observadores.remove(funcion)
+
+
+_MARCADOR = re.compile(r"%\((\w+)\)s|%s|%%")
+
+
+@functools.lru_cache(maxsize=256)
+def _sentencia(query):
+    """(nombre, sql con $1..$n, claves de los parámetros en orden) de una consulta de psycopg2"""
+    claves = []
+
+    def reemplazar(m):
+        if m.group(0) == "%%":
+            return "%"
+        # %s toma el siguiente parámetro de la tupla; %(clave)s repetido reusa su $n
+        clave = len(claves) if m.group(1) is None else m.group(1)
+        if clave not in claves:
+            claves.append(clave)
+        return f"${claves.index(clave) + 1}"
+
+    sql = _MARCADOR.sub(reemplazar, query)
+    nombre = "p_" + hashlib.sha1(query.encode("utf-8")).hexdigest()[:16]
+    return nombre, sql, tuple(claves)
+
+
+class _CursorObservado:
+    def execute(self, query, vars=None):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            self._avisar(query, vars, inicio)
+
+    def ejecutar_preparada(self, query, vars=None):
+        """Como execute, pero con una sentencia preparada en el servidor.
+
+        La primera vez que una conexión ve la consulta hace PREPARE; desde
+        ahí solo manda EXECUTE con los valores, sin que Postgres vuelva a
+        analizarla y planearla. Las sentencias viven en la sesión, así que
+        se registran en la conexión y mueren con ella. Los observadores
+        reciben la consulta y los parámetros originales.
+        """
+        if not DB_PREPARADAS:
+            return self.execute(query, vars)
+
+        inicio = time.perf_counter()
+        conn = self.connection
+        al_inicio = conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        try:
+            try:
+                return self._ejecutar_preparada(query, vars)
+            except (psycopg2.errors.InvalidSqlStatementName,
+                    psycopg2.errors.DuplicatePreparedStatement,
+                    psycopg2.errors.FeatureNotSupported):
+                # La sesión ya no coincide con lo registrado (un pooler la
+                # reinició) o cambió el esquema ("cached plan must not change
+                # result type"). Si no había nada antes en la transacción se
+                # puede empezar de nuevo sin perder trabajo.
+                if not al_inicio:
+                    raise
+                conn.rollback()
+                conn.preparadas.clear()
+                super().execute("DEALLOCATE ALL")
+                return self._ejecutar_preparada(query, vars)
+        finally:
+            self._avisar(query, vars, inicio)
+
+    def _ejecutar_preparada(self, query, vars):
+        nombre, sql, claves = _sentencia(query)
+        preparadas = self.connection.preparadas
+        if nombre not in preparadas:
+            super().execute(f"PREPARE {nombre} AS {sql}")
+            preparadas.add(nombre)
+        if not claves:
+            return super().execute(f"EXECUTE {nombre}")
+        marcadores = ", ".join(["%s"] * len(claves))
+        return super().execute(f"EXECUTE {nombre} ({marcadores})", [vars[c] for c in claves])
+
+    def _avisar(self, query, vars, inicio):
+        if _observadores:
+            segundos = time.perf_counter() - inicio
+            for funcion in list(_observadores):
+                funcion(self, query, vars, segundos)
+
+
+_observadores_prestamo = []
+
+
+def observar_prestamos(funcion):
+    """Registra funcion(segundos), con lo que tardó get_db en entregar una conexión.
+
+    Incluye la espera por un lugar libre en el pool y, si hace falta, abrir
+    o validar la conexión. Devuelve una función que quita el observador.
+    """
+    _observadores_prestamo.append(funcion)
+    return lambda: _observadores_prestamo.remove(funcion)
+
+
+_observadores_escritura = []
+
+
+def observar_escrituras(funcion):
+    """Registra funcion(posicion), con la posición del WAL tras cada commit en la primaria.
+
+    Solo se llama si hay réplica (ver posicion_escritura). Devuelve una
+    función que quita el observador.
+    """
+    _observadores_escritura.append(funcion)
+    return lambda: _observadores_escritura.remove(funcion)
+
+
+_clases_observadas = {}
+
+
+def _observada(cursor_factory):
+    clase = _clases_observadas.get(cursor_factory)
+    if clase is None:
+        clase = type(cursor_factory.__name__ + "Observado", (_CursorObservado, cursor_factory), {})
+        _clases_observadas[cursor_factory] = clase
+    return clase
+
+
+class Conexion(psycopg2.extensions.connection):
+    """Conexión cuyos cursores (de cualquier cursor_factory) avisan a los observadores"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Nombres de las sentencias preparadas en esta sesión del servidor
+        self.preparadas = set()
+        # Si hubo un commit desde que get_db la prestó
+        self.confirmo = False
+        # time.monotonic() de la última vez que se devolvió al pool (o de
+        # cuando se abrió), para saber si hay que validarla al prestarla
+        self.ultimo_uso = time.monotonic()
+
+    def commit(self):
+        super().commit()
+        self.confirmo = True
+
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get("cursor_factory") or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs["cursor_factory"] = _observada(factory)
+        return super().cursor(*args, **kwargs)
+
+
+def _connect_kwargs(url=None):
+    url = url or DATABASE_URL
+    if url:
+        return {
+            "dsn": url,
+            "sslmode": DB_SSLMODE,
+            "client_encoding": "UTF8",
+            "connect_timeout": DB_CONNECT_TIMEOUT,
+            "connection_factory": Conexion,
+        }
+    return {
+        "host": "localhost",
+        "database": "beautyweb",
+        "user": "postgres",
+        "password": "1234",
+        "client_encoding": "UTF8",
+        "connect_timeout": DB_CONNECT_TIMEOUT,
+        "connection_factory": Conexion,
+    }
+
+
+def conectar():
+    """Abre una conexión directa, fuera del pool (para LISTEN y tareas largas)"""
+    return psycopg2.connect(**_connect_kwargs())
+
+
+class Pool:
+    """Pool de conexiones a un servidor, creado de forma perezosa una vez por proceso.
+
+    Las conexiones no se pueden compartir entre procesos, así que si el
+    proceso cambió (fork de gunicorn con --preload) se crea un pool nuevo
+    sin tocar los sockets heredados del padre.
+    """
+
+    def __init__(self, url=None):
+        self.url = url
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._slots = None
+
+    def _get_pool(self):
+        pid = os.getpid()
+        if self._pool is not None and self._pid == pid:
+            return self._pool
+
+        with self._lock:
+            if self._pool is None or self._pid != pid:
+                # minconn = maxconn: psycopg2 cierra al devolverla toda
+                # conexión por encima de minconn, y con carga cada petición
+                # abriría una nueva
+                self._pool = psycopg2.pool.ThreadedConnectionPool(
+                    DB_POOL_MAX, DB_POOL_MAX, **_connect_kwargs(self.url)
+                )
+                self._pid = pid
+                self._slots = threading.BoundedSemaphore(DB_POOL_MAX)
+        return self._pool
+
+    def _conexion_sana(self, conn):
+        """Valida una conexión antes de entregarla a un handler"""
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return False
+
+        if time.monotonic() - conn.ultimo_uso < DB_POOL_CHECK_IDLE:
+            return True
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def checkout(self):
+        pool = self._get_pool()
+        if not self._slots.acquire(timeout=DB_POOL_TIMEOUT):
+            raise psycopg2.pool.PoolError("No hay conexiones disponibles en el pool")
+
+        try:
+            # Reintentar hasta max veces para descartar conexiones muertas
+            for _ in range(DB_POOL_MAX + 1):
+                conn = pool.getconn()
+                if self._conexion_sana(conn):
+                    return conn
+                pool.putconn(conn, close=True)
+            raise psycopg2.OperationalError("No se pudo obtener una conexión sana")
+        except Exception:
+            self._slots.release()
+            raise
+
+    def checkin(self, conn):
+        pool = self._get_pool()
+        try:
+            if conn.closed:
+                pool.putconn(conn, close=True)
+                return
+
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                pool.putconn(conn, close=True)
+                return
+
+            conn.ultimo_uso = time.monotonic()
+            pool.putconn(conn)
+        finally:
+            self._slots.release()
+
+
+_primaria = Pool()
+_replica = Pool(DATABASE_REPLICA_URL) if DATABASE_REPLICA_URL else None
+# Hasta cuándo (time.monotonic) no se intenta la réplica tras un fallo
+_replica_caida_hasta = [0.0]
+
+
+def hay_replica():
+    return _replica is not None
+
+
+def _replica_al_dia(conn, posicion):
+    """True si la réplica ya reprodujo el WAL hasta posicion (ver posicion_escritura)"""
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_last_wal_replay_lsn() >= %s::pg_lsn", (posicion,))
+            al_dia = cur.fetchone()[0]
+        conn.rollback()
+        return bool(al_dia)
+    except psycopg2.Error:
+        conn.rollback()
+        return False
+
+
+def _checkout(lectura=False, posicion=None):
+    """Devuelve (pool, conexión): la réplica para lecturas si está disponible"""
+    if lectura and _replica is not None and time.monotonic() >= _replica_caida_hasta[0]:
+        try:
+            conn = _replica.checkout()
+        except (psycopg2.Error, psycopg2.pool.PoolError):
+            # Réplica caída o saturada: se sigue con la primaria un rato
+            _replica_caida_hasta[0] = time.monotonic() + REPLICA_REINTENTO
+        else:
+            if posicion is None or _replica_al_dia(conn, posicion):
+                return _replica, conn
+            _replica.checkin(conn)
+    return _primaria, _primaria.checkout()
+
+
+def posicion_escritura(conn):
+    """Posición actual del WAL en la primaria, como texto.
+
+    Se pide después del commit de una escritura; una lectura con esa
+    posición (get_db(lectura=True, posicion=...)) solo usa la réplica si
+    ya la alcanzó, así que ve la escritura. En autocommit es una sola ida
+    y vuelta, sin BEGIN ni ROLLBACK.
+    """
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_current_wal_lsn()::text")
+            return cur.fetchone()[0]
+    finally:
+        conn.autocommit = False
+
+
+def _avisar_escritura(conn):
+    if not _observadores_escritura or conn.closed:
+        return
+    try:
+        posicion = posicion_escritura(conn)
+    except psycopg2.Error:
+        # Sin la posición el cliente puede leer de una réplica atrasada,
+        # pero la escritura ya se hizo
+        return
+    for funcion in list(_observadores_escritura):
+        funcion(posicion)
+
+
+@contextmanager
+def get_db(lectura=False, posicion=None):
+    """Presta una conexión del pool y la devuelve al salir del bloque.
+
+    Con lectura=True la conexión puede venir de la réplica (si hay
+    DATABASE_REPLICA_URL y responde); el bloque no debe escribir. Si se da
+    posicion, la réplica solo se usa si ya reprodujo esa escritura.
+
+    Si el bloque lanza una excepción se hace rollback. Cualquier transacción
+    que quede abierta (por ejemplo por un return temprano) se descarta antes
+    de devolver la conexión, así que los handlers deben hacer commit
+    explícito de lo que quieran guardar.
+    """
+    inicio = time.perf_counter()
+    pool, conn = _checkout(lectura, posicion)
+    conn.confirmo = False
+    if _observadores_prestamo:
+        segundos = time.perf_counter() - inicio
+        for funcion in list(_observadores_prestamo):
+            funcion(segundos)
+    try:
+        yield conn
+    except Exception:
+        if not conn.closed:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                pass
+        raise
+    finally:
+        # En la misma conexión que escribió, antes de devolverla al pool
+        if conn.confirmo and pool is _primaria and _replica is not None:
+            _avisar_escritura(conn)
+        pool.checkin(conn)
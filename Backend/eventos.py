@@ -0,0 +1,177 @@
+"""Eventos de citas y bloqueos en vivo, por Server-Sent Events.
+
+Los handlers que escriben mandan un NOTIFY en el canal "eventos" dentro
+de su transacción; el listener de cache.Escucha lo recibe en cada worker
+y Difusor lo reparte a los streams abiertos que coinciden con su filtro
+(estilista y rango de fechas). Como los eventos viajan por LISTEN/NOTIFY,
+requieren CACHE_NOTIFY.
+
+Cada evento es un objeto JSON con "tipo" (cita_creada, cita_confirmada,
+cita_cancelada, cita_eliminada, bloqueo_creado o bloqueo_eliminado),
+"estilista" y "fechas" (lista de días afectados), más "id" y "hora" en
+las citas o "ids" en los bloqueos. No hay
+reenvío de eventos perdidos: al recibir "reconectado" o "desincronizado"
+el cliente debe volver a consultar lo que esté mostrando.
+"""
+import json
+import os
+import queue
+import threading
+import time
+from datetime import date
+
+from cache import CACHE_NOTIFY, escucha
+
+CANAL_EVENTOS = "eventos"
+
+# Streams abiertos a la vez por worker. Con los hilos del Procfile cada uno
+# ocupa un hilo durante EVENTOS_DURACION: el Procfile da 10 hilos, 2 para
+# los paneles de admin y 8 para las peticiones. asincrono.py lo sube a 200.
+EVENTOS_MAX_CLIENTES = int(os.environ.get('EVENTOS_MAX_CLIENTES', 2))
+# Segundos que dura un stream; después el navegador reconecta solo
+EVENTOS_DURACION = float(os.environ.get('EVENTOS_DURACION', 300))
+# Segundos entre comentarios de latido, para que los proxies no corten
+EVENTOS_LATIDO = 15
+# Eventos sin leer por cliente antes de darlo por desincronizado
+EVENTOS_COLA = 100
+# Milisegundos que espera EventSource antes de reconectar
+EVENTOS_REINTENTO_MS = 3000
+# Días por NOTIFY (el payload de pg_notify tiene un límite de 8000 bytes)
+FECHAS_POR_EVENTO = 100
+
+def evento(tipo, estilista, fechas, **datos):
+    """Arma el evento (dict serializable) de un cambio"""
+    return {
+        "tipo": tipo,
+        "estilista": int(estilista),
+        "fechas": [f.isoformat() if isinstance(f, date) else f for f in fechas],
+        **datos,
+    }
+
+
+def notificar_evento(cur, tipo, estilista, fechas, **datos):
+    """Publica un evento dentro de la transacción actual (se entrega al hacer commit).
+
+    Si hay muchos días se parte en varios eventos del mismo tipo.
+    """
+    fechas = sorted(fechas)
+    eventos = []
+    for i in range(0, len(fechas), FECHAS_POR_EVENTO):
+        extra = dict(datos)
+        if "ids" in extra:
+            extra["ids"] = extra["ids"][i:i + FECHAS_POR_EVENTO]
+        eventos.append(evento(tipo, estilista, fechas[i:i + FECHAS_POR_EVENTO], **extra))
+    notificar_eventos(cur, eventos)
+
+
+def notificar_eventos(cur, eventos):
+    """Publica varios eventos (ver evento) en una sola sentencia"""
+    if not CACHE_NOTIFY or not eventos:
+        return
+    cur.execute(
+        "SELECT pg_notify(%s, p) FROM unnest(%s::text[]) AS p",
+        (CANAL_EVENTOS, [json.dumps(ev) for ev in eventos])
+    )
+
+
+class Suscripcion:
+    """Un stream abierto, con su filtro y su cola de eventos pendientes"""
+
+    def __init__(self, estilista=None, desde=None, hasta=None):
+        self.estilista = estilista
+        self.desde = desde.isoformat() if desde else None
+        self.hasta = hasta.isoformat() if hasta else None
+        self.cola = queue.Queue(EVENTOS_COLA)
+        self.desincronizada = False
+
+    def acepta(self, ev):
+        if ev["tipo"] == "reconectado":
+            return True
+        if self.estilista is not None and ev["estilista"] != self.estilista:
+            return False
+        # Las fechas ISO se comparan bien como texto
+        return any(
+            (self.desde is None or f >= self.desde) and (self.hasta is None or f <= self.hasta)
+            for f in ev["fechas"]
+        )
+
+    def entregar(self, ev):
+        try:
+            self.cola.put_nowait(ev)
+        except queue.Full:
+            self.desincronizada = True
+
+
+class Difusor:
+    """Reparte los eventos del canal a las suscripciones de este proceso"""
+
+    def __init__(self):
+        self._suscripciones = set()
+        self._lock = threading.Lock()
+        escucha.suscribir(CANAL_EVENTOS, self.al_notificar, self.al_reconectar)
+
+    def disponible(self):
+        """Sin CACHE_NOTIFY no hay eventos; si no, arranca el listener si hace falta.
+
+        Un stream abierto antes de que el listener conecte recibe
+        "reconectado" en cuanto lo hace.
+        """
+        if not CACHE_NOTIFY:
+            return False
+        escucha.conectado()
+        return True
+
+    def suscribir(self, estilista=None, desde=None, hasta=None):
+        """Devuelve una Suscripcion, o None si ya hay demasiados streams abiertos"""
+        with self._lock:
+            if len(self._suscripciones) >= EVENTOS_MAX_CLIENTES:
+                return None
+            suscripcion = Suscripcion(estilista, desde, hasta)
+            self._suscripciones.add(suscripcion)
+            return suscripcion
+
+    def cancelar(self, suscripcion):
+        with self._lock:
+            self._suscripciones.discard(suscripcion)
+
+    def _repartir(self, ev):
+        with self._lock:
+            suscripciones = list(self._suscripciones)
+        for suscripcion in suscripciones:
+            if suscripcion.acepta(ev):
+                suscripcion.entregar(ev)
+
+    def al_notificar(self, payload):
+        try:
+            ev = json.loads(payload)
+        except ValueError:
+            return
+        self._repartir(ev)
+
+    def al_reconectar(self):
+        # Mientras el listener estuvo caído se pudieron perder eventos
+        self._repartir({"tipo": "reconectado"})
+
+    def flujo(self, suscripcion):
+        """Generador con el texto SSE de una suscripción; la cancela al terminar"""
+        try:
+            yield f"retry: {EVENTOS_REINTENTO_MS}\n\n"
+            fin = time.monotonic() + EVENTOS_DURACION
+            while True:
+                if suscripcion.desincronizada:
+                    yield "event: desincronizado\ndata: {}\n\n"
+                    return
+                restante = fin - time.monotonic()
+                if restante <= 0:
+                    return
+                try:
+                    ev = suscripcion.cola.get(timeout=min(EVENTOS_LATIDO, restante))
+                except queue.Empty:
+                    yield ": latido\n\n"
+                    continue
+                yield f"event: {ev['tipo']}\ndata: {json.dumps(ev, ensure_ascii=False)}\n\n"
+        finally:
+            self.cancelar(suscripcion)
+
+
+difusor = Difusor()
@@ -0,0 +1,144 @@
+"""Idempotency-Key para las rutas que crean cosas.
+
+Si el cliente manda el encabezado, la primera petición con esa clave
+reserva una fila en claves_idempotencia, se ejecuta normalmente y guarda
+su respuesta; los reintentos con la misma clave (y el mismo cuerpo)
+reciben esa respuesta con una sola consulta por llave primaria, sin
+volver a ejecutar la ruta. Las claves valen por ruta y por usuario de la
+sesión (si hay token), así que la misma clave desde otra sesión no repite
+la respuesta de otro usuario; duran IDEMPOTENCIA_TTL segundos. Las
+respuestas 5xx no se guardan: el reintento vuelve a ejecutar la ruta.
+"""
+import functools
+import hashlib
+import os
+import threading
+import time
+
+from flask import current_app, jsonify, request
+
+from db import get_db
+from sesiones import usuario_sesion
+
+ENCABEZADO = "Idempotency-Key"
+# Encabezado de las respuestas repetidas
+ENCABEZADO_REPETIDA = "Idempotent-Replayed"
+# Segundos que se guarda una respuesta
+IDEMPOTENCIA_TTL = int(os.environ.get('IDEMPOTENCIA_TTL', 24 * 3600))
+# Segundos tras los que una petición en curso se da por perdida (el worker
+# murió) y otro reintento puede tomar la clave
+EN_CURSO_MAX = 60
+CLAVE_MAX = 255
+# Cada cuántos segundos un proceso borra las claves vencidas
+PURGA_CADA = 3600
+
+_ultima_purga = [0.0]
+_lock_purga = threading.Lock()
+
+
+def _alcance(clave):
+    """Clave guardada: la del cliente, precedida por el usuario si hay sesión"""
+    sesion = usuario_sesion()
+    return f"usuario:{sesion['id']}:{clave}" if sesion else clave
+
+
+def _huella():
+    datos = request.method.encode() + b" " + request.path.encode() + b"\n" + request.get_data()
+    return hashlib.sha256(datos).hexdigest()
+
+
+def _reservar(clave, huella):
+    """Reserva la clave; devuelve (reservada, fila previa o None)"""
+    with get_db() as conn, conn.cursor() as cur:
+        # La consulta externa ve la tabla como estaba antes del INSERT
+        cur.execute("""
+            WITH reserva AS (
+                INSERT INTO claves_idempotencia (ruta, clave, huella)
+                VALUES (%(ruta)s, %(clave)s, %(huella)s)
+                ON CONFLICT (ruta, clave) DO UPDATE
+                SET huella = EXCLUDED.huella, estado = NULL, tipo = NULL, cuerpo = NULL, creada = now()
+                WHERE claves_idempotencia.creada < now() - make_interval(secs => %(ttl)s)
+                   OR (claves_idempotencia.estado IS NULL
+                       AND claves_idempotencia.creada < now() - make_interval(secs => %(en_curso)s))
+                RETURNING 1
+            )
+            SELECT EXISTS (SELECT 1 FROM reserva), c.huella, c.estado, c.tipo, c.cuerpo
+            FROM (SELECT 1) AS uno
+            LEFT JOIN claves_idempotencia c ON c.ruta = %(ruta)s AND c.clave = %(clave)s
+        """, {"ruta": request.path, "clave": clave, "huella": huella,
+              "ttl": IDEMPOTENCIA_TTL, "en_curso": EN_CURSO_MAX})
+        reservada, *previa = cur.fetchone()
+        conn.commit()
+    return reservada, previa
+
+
+def _guardar(clave, resp):
+    with get_db() as conn, conn.cursor() as cur:
+        cur.execute("""
+            UPDATE claves_idempotencia
+            SET estado = %s, tipo = %s, cuerpo = %s
+            WHERE ruta = %s AND clave = %s
+        """, (resp.status_code, resp.mimetype, resp.get_data(), request.path, clave))
+        conn.commit()
+
+
+def _liberar(clave):
+    with get_db() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM claves_idempotencia WHERE ruta = %s AND clave = %s", (request.path, clave))
+        conn.commit()
+
+
+def _purgar():
+    ahora = time.monotonic()
+    with _lock_purga:
+        if ahora - _ultima_purga[0] < PURGA_CADA:
+            return
+        _ultima_purga[0] = ahora
+    with get_db() as conn, conn.cursor() as cur:
+        cur.execute(
+            "DELETE FROM claves_idempotencia WHERE creada < now() - make_interval(secs => %s)",
+            (IDEMPOTENCIA_TTL,)
+        )
+        conn.commit()
+
+
+def idempotente(vista):
+    """Decorador de rutas: repite la respuesta guardada si se reintenta la clave"""
+    @functools.wraps(vista)
+    def envoltura(*args, **kwargs):
+        clave = request.headers.get(ENCABEZADO)
+        if not clave:
+            return vista(*args, **kwargs)
+        if len(clave) > CLAVE_MAX:
+            return jsonify({"error": f"{ENCABEZADO} no puede superar {CLAVE_MAX} caracteres"}), 400
+
+        clave = _alcance(clave)
+        huella = _huella()
+        reservada, (huella_previa, estado, tipo, cuerpo) = _reservar(clave, huella)
+
+        if not reservada:
+            if huella_previa != huella:
+                return jsonify({"error": f"{ENCABEZADO} ya se usó con otra petición"}), 422
+            if estado is None:
+                resp = jsonify({"error": "La petición original todavía se está procesando"})
+                resp.status_code = 409
+                resp.headers["Retry-After"] = "1"
+                return resp
+            resp = current_app.response_class(bytes(cuerpo), status=estado, mimetype=tipo)
+            resp.headers[ENCABEZADO_REPETIDA] = "true"
+            return resp
+
+        try:
+            resp = current_app.make_response(vista(*args, **kwargs))
+        except Exception:
+            _liberar(clave)
+            raise
+
+        if resp.status_code >= 500:
+            _liberar(clave)
+        else:
+            _guardar(clave, resp)
+        _purgar()
+        return resp
+
+    return envoltura
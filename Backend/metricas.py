@@ -0,0 +1,200 @@
+"""Métricas de la app en formato de texto de Prometheus.
+
+Por ruta se mide la latencia de cada petición, cuánto se esperó por una
+conexión del pool, cuántas consultas se hicieron, su tiempo y las filas
+que devolvieron o modificaron. También se exportan los tiempos de bcrypt
+de contrasenas.estadisticas.
+
+Los contadores viven en memoria de cada proceso: con varios workers de
+gunicorn cada uno responde /metrics con lo suyo (la etiqueta pid permite
+distinguirlos). Las consultas que corren fuera de una petición (como
+las del listener de caché) se cuentan con ruta="fuera_de_peticion".
+"""
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from flask import g, has_request_context, request
+
+import contrasenas
+import db
+
+# Registrar las consultas más lentas que esto (milisegundos); 0 lo apaga
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 0))
+
+# Límites (segundos) de los histogramas de peticiones y consultas
+BUCKETS_PETICION = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+BUCKETS_CONSULTA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+# Consultas por petición, para encontrar rutas con N+1
+BUCKETS_CONSULTAS_POR_PETICION = (0, 1, 2, 3, 5, 10, 20, 50)
+
+FUERA_DE_PETICION = "fuera_de_peticion"
+
+log_consultas = logging.getLogger("beautyweb.consultas_lentas")
+
+
+class Histograma:
+    """Histograma con etiquetas; los buckets se guardan sin acumular"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self._series = {}
+
+    def observar(self, etiquetas, valor):
+        serie = self._series.get(etiquetas)
+        if serie is None:
+            serie = self._series[etiquetas] = {"buckets": [0] * (len(self.buckets) + 1), "suma": 0.0}
+        serie["suma"] += valor
+        for i, limite in enumerate(self.buckets):
+            if valor <= limite:
+                serie["buckets"][i] += 1
+                break
+        else:
+            serie["buckets"][-1] += 1
+
+    def series(self):
+        return [(etiquetas, list(s["buckets"]), s["suma"]) for etiquetas, s in self._series.items()]
+
+
+_lock = threading.Lock()
+_peticiones = defaultdict(int)  # (ruta, metodo, estado) -> total
+_duracion = Histograma(BUCKETS_PETICION)  # (ruta, metodo)
+_prestamo = Histograma(BUCKETS_CONSULTA)  # (ruta,)
+_consultas = Histograma(BUCKETS_CONSULTA)  # (ruta,)
+_consultas_por_peticion = Histograma(BUCKETS_CONSULTAS_POR_PETICION)  # (ruta,)
+_filas = defaultdict(int)  # (ruta,) -> total
+_lentas = defaultdict(int)  # (ruta,) -> total
+
+
+def _ruta():
+    if not has_request_context():
+        return FUERA_DE_PETICION
+    # La regla y no la URL, para no crear una serie por cada id
+    return request.url_rule.rule if request.url_rule else "sin_ruta"
+
+
+def _al_prestar(segundos):
+    with _lock:
+        _prestamo.observar((_ruta(),), segundos)
+
+
+def _al_consultar(cur, query, vars, segundos):
+    ruta = _ruta()
+    filas = cur.rowcount if cur.rowcount > 0 else 0
+    lenta = SLOW_QUERY_MS and segundos * 1000 >= SLOW_QUERY_MS
+
+    with _lock:
+        _consultas.observar((ruta,), segundos)
+        _filas[(ruta,)] += filas
+        if lenta:
+            _lentas[(ruta,)] += 1
+
+    if has_request_context() and "metricas_consultas" in g:
+        g.metricas_consultas += 1
+
+    if lenta:
+        # Sin parámetros: pueden traer teléfonos o hashes de contraseñas
+        if isinstance(query, bytes):
+            query = query.decode("utf-8", "replace")
+        log_consultas.warning(
+            "%.1f ms en %s (%d filas): %s", segundos * 1000, ruta, filas, " ".join(str(query).split())
+        )
+
+
+def _antes():
+    g.metricas_inicio = time.perf_counter()
+    g.metricas_consultas = 0
+
+
+def _despues(resp):
+    g.metricas_estado = resp.status_code
+    return resp
+
+
+def _al_terminar(error):
+    inicio = g.pop("metricas_inicio", None)
+    if inicio is None:
+        return
+    segundos = time.perf_counter() - inicio
+    ruta = _ruta()
+    estado = g.pop("metricas_estado", 500)
+    consultas = g.pop("metricas_consultas", 0)
+    with _lock:
+        _peticiones[(ruta, request.method, str(estado))] += 1
+        _duracion.observar((ruta, request.method), segundos)
+        _consultas_por_peticion.observar((ruta,), consultas)
+
+
+def instalar(app):
+    """Engancha la medición de peticiones y consultas a la app"""
+    app.before_request(_antes)
+    app.after_request(_despues)
+    app.teardown_request(_al_terminar)
+    db.observar_prestamos(_al_prestar)
+    db.observar_consultas(_al_consultar)
+
+
+def _etiquetas(nombres, valores, extra=()):
+    pares = list(zip(nombres, valores)) + list(extra)
+    pares.append(("pid", str(os.getpid())))
+    texto = ",".join(
+        '{}="{}"'.format(n, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for n, v in pares
+    )
+    return "{" + texto + "}"
+
+
+def _contador(lineas, nombre, ayuda, nombres, datos):
+    lineas.append(f"# HELP {nombre} {ayuda}")
+    lineas.append(f"# TYPE {nombre} counter")
+    for valores, total in sorted(datos.items()):
+        lineas.append(f"{nombre}{_etiquetas(nombres, valores)} {total}")
+
+
+def _histograma(lineas, nombre, ayuda, nombres, limites, series):
+    lineas.append(f"# HELP {nombre} {ayuda}")
+    lineas.append(f"# TYPE {nombre} histogram")
+    for valores, buckets, suma in sorted(series, key=lambda s: s[0]):
+        acumulado = 0
+        for limite, n in zip(list(limites) + ["+Inf"], buckets):
+            acumulado += n
+            lineas.append(f"{nombre}_bucket{_etiquetas(nombres, valores, [('le', limite)])} {acumulado}")
+        lineas.append(f"{nombre}_sum{_etiquetas(nombres, valores)} {suma}")
+        lineas.append(f"{nombre}_count{_etiquetas(nombres, valores)} {acumulado}")
+
+
+def exportar():
+    """Devuelve todas las métricas del proceso en formato de texto de Prometheus"""
+    lineas = []
+    with _lock:
+        _contador(lineas, "beautyweb_peticiones_total", "Peticiones atendidas",
+                  ("ruta", "metodo", "estado"), _peticiones)
+        _histograma(lineas, "beautyweb_peticion_segundos", "Duración de las peticiones",
+                    ("ruta", "metodo"), BUCKETS_PETICION, _duracion.series())
+        _histograma(lineas, "beautyweb_db_prestamo_segundos",
+                    "Espera por una conexión del pool (incluye abrirla o validarla)",
+                    ("ruta",), BUCKETS_CONSULTA, _prestamo.series())
+        _histograma(lineas, "beautyweb_db_consulta_segundos", "Duración de cada consulta",
+                    ("ruta",), BUCKETS_CONSULTA, _consultas.series())
+        _histograma(lineas, "beautyweb_db_consultas_por_peticion", "Consultas hechas en una petición",
+                    ("ruta",), BUCKETS_CONSULTAS_POR_PETICION, _consultas_por_peticion.series())
+        _contador(lineas, "beautyweb_db_filas_total", "Filas devueltas o modificadas por las consultas",
+                  ("ruta",), _filas)
+        _contador(lineas, "beautyweb_db_consultas_lentas_total",
+                  "Consultas más lentas que SLOW_QUERY_MS", ("ruta",), _lentas)
+
+    bcrypt = contrasenas.estadisticas
+    _histograma(lineas, "beautyweb_bcrypt_segundos", "Duración de hashear o verificar contraseñas",
+                (), contrasenas.BUCKETS_LATENCIA,
+                [((), list(bcrypt["buckets"]), bcrypt["segundos_total"])])
+    _contador(lineas, "beautyweb_bcrypt_rechazadas_total", "Operaciones rechazadas con 503 por cola llena",
+              (), {(): bcrypt["rechazadas"]})
+    _contador(lineas, "beautyweb_bcrypt_errores_total", "Operaciones de bcrypt que fallaron",
+              (), {(): bcrypt["errores"]})
+    lineas.append("# HELP beautyweb_bcrypt_en_curso Operaciones de bcrypt en curso o en cola")
+    lineas.append("# TYPE beautyweb_bcrypt_en_curso gauge")
+    lineas.append(f"beautyweb_bcrypt_en_curso{_etiquetas((), ())} {bcrypt['en_curso']}")
+
+    return "\n".join(lineas) + "\n"
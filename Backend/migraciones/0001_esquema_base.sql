@@ -0,0 +1,119 @@
+-- Esquema base de beautyweb. Usa IF NOT EXISTS para poder aplicarse
+-- también sobre bases creadas antes con script.sql.
+
+CREATE TABLE IF NOT EXISTS estilistas (
+    id SERIAL PRIMARY KEY,
+    nombre VARCHAR(100) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS servicios (
+    id SERIAL PRIMARY KEY,
+    nombre VARCHAR(100) NOT NULL,
+    precio NUMERIC(10,2)
+);
+
+CREATE TABLE IF NOT EXISTS usuarios (
+    id SERIAL PRIMARY KEY,
+    nombre VARCHAR(100),
+    telefono VARCHAR(20) UNIQUE,
+    contrasena BYTEA
+);
+
+CREATE TABLE IF NOT EXISTS citas (
+    id SERIAL PRIMARY KEY,
+    usuario_id INTEGER REFERENCES usuarios(id),
+    servicio VARCHAR(100) NOT NULL,
+    estilista int NOT NULL,
+    fecha DATE NOT NULL,
+    hora TIME NOT NULL,
+    notas TEXT,
+    estado VARCHAR(20) DEFAULT 'Pendiente'
+);
+
+CREATE TABLE IF NOT EXISTS estilista_servicios (
+    estilista_id INTEGER NOT NULL REFERENCES estilistas(id) ON DELETE CASCADE,
+    servicio_id INTEGER NOT NULL REFERENCES servicios(id) ON DELETE CASCADE,
+    PRIMARY KEY (estilista_id, servicio_id)
+);
+
+CREATE TABLE IF NOT EXISTS horarios_bloqueados (
+    id SERIAL PRIMARY KEY,
+    id_estilista INTEGER NOT NULL REFERENCES estilistas(id) ON DELETE CASCADE,
+    fecha DATE NOT NULL,
+    motivo TEXT
+);
+
+-- /horarios_bloqueados devuelve esta columna; los bloqueos de día completo la dejan en NULL
+ALTER TABLE horarios_bloqueados ADD COLUMN IF NOT EXISTS hora TIME;
+
+-- Las bases viejas pueden tener el mismo horario reservado dos veces, y
+-- con eso el índice de abajo no se podría crear. Se conserva la primera
+-- reserva (el id menor) y las demás se rechazan con un motivo que el
+-- cliente ve en su historial.
+DO $$
+DECLARE
+    duplicada RECORD;
+BEGIN
+    FOR duplicada IN
+        UPDATE citas c
+        SET estado = 'Cancelada',
+            notas = 'Horario reservado dos veces; se conservó la primera reserva'
+        FROM (
+            SELECT id, row_number() OVER (PARTITION BY estilista, fecha, hora ORDER BY id) AS orden
+            FROM citas
+            WHERE estado IN ('Pendiente', 'Confirmada')
+        ) d
+        WHERE c.id = d.id AND d.orden > 1
+        RETURNING c.id, c.estilista, c.fecha, c.hora
+    LOOP
+        RAISE WARNING 'Cita % rechazada: estilista % ya tenía cita el % a las %',
+            duplicada.id, duplicada.estilista, duplicada.fecha, duplicada.hora;
+    END LOOP;
+END;
+$$;
+
+-- Un horario solo puede tener una cita activa por estilista
+CREATE UNIQUE INDEX IF NOT EXISTS citas_horario_activo_uniq
+    ON citas (estilista, fecha, hora)
+    WHERE estado IN ('Pendiente', 'Confirmada');
+
+-- Total de citas por día, estilista y estado; lo mantiene un trigger y lo
+-- usa el dashboard del admin para no recorrer toda la tabla citas
+CREATE TABLE IF NOT EXISTS resumen_citas (
+    fecha DATE NOT NULL,
+    estilista INTEGER NOT NULL,
+    estado VARCHAR(20) NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (fecha, estilista, estado)
+);
+
+CREATE OR REPLACE FUNCTION actualizar_resumen_citas() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE resumen_citas
+        SET total = total - 1
+        WHERE fecha = OLD.fecha AND estilista = OLD.estilista AND estado = OLD.estado;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO resumen_citas (fecha, estilista, estado, total)
+        VALUES (NEW.fecha, NEW.estilista, NEW.estado, 1)
+        ON CONFLICT (fecha, estilista, estado)
+        DO UPDATE SET total = resumen_citas.total + 1;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS citas_resumen ON citas;
+CREATE TRIGGER citas_resumen
+    AFTER INSERT OR UPDATE OF fecha, estilista, estado OR DELETE ON citas
+    FOR EACH ROW EXECUTE FUNCTION actualizar_resumen_citas();
+
+-- Recalcular el resumen desde cero (las bases viejas no lo tenían)
+TRUNCATE resumen_citas;
+INSERT INTO resumen_citas (fecha, estilista, estado, total)
+SELECT fecha, estilista, estado, COUNT(*)
+FROM citas
+GROUP BY fecha, estilista, estado;
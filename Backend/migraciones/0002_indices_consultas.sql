@@ -0,0 +1,32 @@
+-- Índices para los accesos de las rutas más usadas. La ocupación por
+-- (estilista, fecha) ya la cubre citas_horario_activo_uniq.
+
+-- /citas/pendientes: estado activo, ORDER BY fecha, hora, id (paginación por cursor)
+CREATE INDEX IF NOT EXISTS citas_activas_fecha_idx
+    ON citas (fecha, hora, id)
+    WHERE estado IN ('Pendiente', 'Confirmada');
+
+-- /citas_usuario: historial de un cliente, ORDER BY fecha DESC, hora DESC, id DESC
+CREATE INDEX IF NOT EXISTS citas_usuario_fecha_idx
+    ON citas (usuario_id, fecha DESC, hora DESC, id DESC);
+
+-- Bloqueos por estilista y día (/disponibilidad, /agendar, /bloquear)
+CREATE INDEX IF NOT EXISTS horarios_bloqueados_estilista_fecha_idx
+    ON horarios_bloqueados (id_estilista, fecha);
+
+-- /estilistas/por-servicio: de servicio a estilistas
+CREATE INDEX IF NOT EXISTS estilista_servicios_servicio_idx
+    ON estilista_servicios (servicio_id);
+
+-- /admin/staff y el dashboard: resumen del día por estilista
+CREATE INDEX IF NOT EXISTS resumen_citas_estilista_fecha_idx
+    ON resumen_citas (estilista, fecha);
+
+-- Dashboard: pendientes de cualquier fecha sin recorrer todo el resumen
+CREATE INDEX IF NOT EXISTS resumen_citas_pendientes_idx
+    ON resumen_citas (fecha)
+    WHERE estado = 'Pendiente' AND total > 0;
+
+ANALYZE citas;
+ANALYZE horarios_bloqueados;
+ANALYZE resumen_citas;
@@ -0,0 +1,47 @@
+-- Duración de cada servicio y horario de trabajo de cada estilista, para
+-- calcular la disponibilidad por intervalos en lugar de horas fijas.
+
+ALTER TABLE servicios
+    ADD COLUMN duracion_minutos INTEGER NOT NULL DEFAULT 60
+    CHECK (duracion_minutos > 0);
+
+UPDATE servicios s
+SET duracion_minutos = v.minutos
+FROM (VALUES
+    ('Maquillaje y peinado social', 90),
+    ('Extensiones de pestaña', 120),
+    ('Extensiones de cabello', 180),
+    ('Depilación facial (ceja, bozo)', 30),
+    ('Botox curly', 180),
+    ('Alaciados progresivos', 180),
+    ('Acripie', 90),
+    ('Baño de acrílico', 90),
+    ('Uñas acrílicas', 120)
+) AS v(nombre, minutos)
+-- Algunos nombres del catálogo traen espacios duros (U+00A0) o al final
+WHERE trim(translate(s.nombre, chr(160), ' ')) = v.nombre;
+
+-- La duración se guarda en la cita: cambiar la del servicio no mueve las
+-- ya agendadas. Las existentes se agendaron como bloques de una hora.
+ALTER TABLE citas
+    ADD COLUMN duracion_minutos INTEGER NOT NULL DEFAULT 60
+    CHECK (duracion_minutos > 0);
+
+-- Dos citas activas del mismo estilista no pueden traslaparse. El rango
+-- int4 de un solo valor hace de igualdad sin necesitar btree_gist.
+ALTER TABLE citas
+    ADD CONSTRAINT citas_sin_traslape EXCLUDE USING gist (
+        int4range(estilista, estilista, '[]') WITH &&,
+        tsrange(fecha + hora, fecha + hora + make_interval(mins => duracion_minutos)) WITH &&
+    ) WHERE (estado IN ('Pendiente', 'Confirmada'));
+
+-- Turnos de trabajo por día de la semana (ISO: 1 = lunes). Un estilista
+-- sin filas usa el horario general (JORNADA); con filas, los días sin
+-- turno no trabaja.
+CREATE TABLE horarios_estilista (
+    estilista_id INTEGER NOT NULL REFERENCES estilistas(id) ON DELETE CASCADE,
+    dia_semana SMALLINT NOT NULL CHECK (dia_semana BETWEEN 1 AND 7),
+    inicio TIME NOT NULL,
+    fin TIME NOT NULL CHECK (fin > inicio),
+    PRIMARY KEY (estilista_id, dia_semana, inicio)
+);
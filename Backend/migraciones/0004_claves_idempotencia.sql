@@ -0,0 +1,16 @@
+-- Respuestas guardadas por Idempotency-Key, para que los reintentos de
+-- un cliente repitan la respuesta original sin volver a ejecutar la ruta.
+-- Una fila con estado NULL es una petición que todavía está en curso.
+CREATE TABLE claves_idempotencia (
+    ruta TEXT NOT NULL,
+    clave TEXT NOT NULL,
+    huella TEXT NOT NULL,
+    estado SMALLINT,
+    tipo TEXT,
+    cuerpo BYTEA,
+    creada TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (ruta, clave)
+);
+
+-- Purga de las vencidas
+CREATE INDEX claves_idempotencia_creada_idx ON claves_idempotencia (creada);
@@ -0,0 +1,163 @@
+-- citas particionada por mes (RANGE sobre fecha), con un resumen mensual
+-- por estilista para las estadísticas históricas. Las particiones se
+-- llaman citas_AAAA_MM; lo que cae fuera de ellas va a citas_sin_mes
+-- hasta que archivar.py cree la del mes.
+
+ALTER TABLE citas RENAME TO citas_anterior;
+
+CREATE TABLE citas (
+    id INTEGER NOT NULL DEFAULT nextval('citas_id_seq'),
+    usuario_id INTEGER CONSTRAINT citas_usuario_id_fkey REFERENCES usuarios(id),
+    servicio VARCHAR(100) NOT NULL,
+    estilista INT NOT NULL,
+    fecha DATE NOT NULL,
+    hora TIME NOT NULL,
+    notas TEXT,
+    estado VARCHAR(20) DEFAULT 'Pendiente',
+    duracion_minutos INTEGER NOT NULL DEFAULT 60
+        CONSTRAINT citas_duracion_minutos_check CHECK (duracion_minutos > 0)
+) PARTITION BY RANGE (fecha);
+
+-- Postgres no admite restricciones de exclusión en la tabla particionada,
+-- así que citas_sin_traslape se crea en cada partición. Una cita no cruza
+-- la medianoche, así que nunca se traslapa con una de otra partición.
+CREATE OR REPLACE FUNCTION agregar_sin_traslape(particion TEXT) RETURNS void AS $$
+BEGIN
+    EXECUTE format($sql$
+        ALTER TABLE %I ADD CONSTRAINT %I EXCLUDE USING gist (
+            int4range(estilista, estilista, '[]') WITH &&,
+            tsrange(fecha + hora, fecha + hora + make_interval(mins => duracion_minutos)) WITH &&
+        ) WHERE (estado IN ('Pendiente', 'Confirmada'))
+    $sql$, particion, particion || '_sin_traslape');
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TABLE citas_sin_mes PARTITION OF citas DEFAULT;
+SELECT agregar_sin_traslape('citas_sin_mes');
+
+-- Crea la partición del mes de la fecha dada si no existe y le pasa las
+-- citas de ese mes que estuvieran en citas_sin_mes. Devuelve si la creó.
+CREATE OR REPLACE FUNCTION crear_particion_citas(mes DATE) RETURNS boolean AS $$
+DECLARE
+    inicio DATE := date_trunc('month', mes)::date;
+    fin DATE := (date_trunc('month', mes) + INTERVAL '1 month')::date;
+    nombre TEXT := 'citas_' || to_char(mes, 'YYYY_MM');
+BEGIN
+    IF to_regclass(nombre) IS NOT NULL THEN
+        RETURN false;
+    END IF;
+
+    -- Mover filas entre particiones no cambia ningún total del resumen
+    PERFORM set_config('beautyweb.sin_resumen', 'on', true);
+    CREATE TEMP TABLE citas_por_mover (LIKE citas) ON COMMIT DROP;
+    WITH movidas AS (
+        DELETE FROM citas_sin_mes WHERE fecha >= inicio AND fecha < fin RETURNING *
+    )
+    INSERT INTO citas_por_mover SELECT * FROM movidas;
+
+    EXECUTE format('CREATE TABLE %I PARTITION OF citas FOR VALUES FROM (%L) TO (%L)', nombre, inicio, fin);
+    PERFORM agregar_sin_traslape(nombre);
+
+    INSERT INTO citas SELECT * FROM citas_por_mover;
+    DROP TABLE citas_por_mover;
+    PERFORM set_config('beautyweb.sin_resumen', 'off', true);
+    RETURN true;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Del primer mes con citas hasta un año adelante; lo más lejano queda en
+-- citas_sin_mes
+SELECT crear_particion_citas(mes::date)
+FROM generate_series(
+    COALESCE((SELECT date_trunc('month', MIN(fecha)) FROM citas_anterior), date_trunc('month', CURRENT_DATE)),
+    date_trunc('month', CURRENT_DATE) + INTERVAL '12 months',
+    INTERVAL '1 month'
+) AS mes;
+
+INSERT INTO citas (id, usuario_id, servicio, estilista, fecha, hora, notas, estado, duracion_minutos)
+SELECT id, usuario_id, servicio, estilista, fecha, hora, notas, estado, duracion_minutos
+FROM citas_anterior;
+
+ALTER SEQUENCE citas_id_seq OWNED BY NONE;
+DROP TABLE citas_anterior;
+ALTER SEQUENCE citas_id_seq OWNED BY citas.id;
+
+-- La llave de una tabla particionada debe incluir la columna de partición
+ALTER TABLE citas ADD PRIMARY KEY (id, fecha);
+
+CREATE UNIQUE INDEX citas_horario_activo_uniq
+    ON citas (estilista, fecha, hora)
+    WHERE estado IN ('Pendiente', 'Confirmada');
+
+CREATE INDEX citas_activas_fecha_idx
+    ON citas (fecha, hora, id)
+    WHERE estado IN ('Pendiente', 'Confirmada');
+
+CREATE INDEX citas_usuario_fecha_idx
+    ON citas (usuario_id, fecha DESC, hora DESC, id DESC);
+
+-- Total y minutos por mes, estilista y estado; lo mantiene el mismo
+-- trigger que resumen_citas y sobrevive al archivado de los meses viejos
+CREATE TABLE resumen_mensual (
+    mes DATE NOT NULL,
+    estilista INTEGER NOT NULL,
+    estado VARCHAR(20) NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    minutos INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (mes, estilista, estado)
+);
+
+CREATE INDEX resumen_mensual_estilista_mes_idx
+    ON resumen_mensual (estilista, mes);
+
+INSERT INTO resumen_mensual (mes, estilista, estado, total, minutos)
+SELECT date_trunc('month', fecha)::date, estilista, estado, COUNT(*), SUM(duracion_minutos)
+FROM citas
+GROUP BY 1, estilista, estado;
+
+CREATE OR REPLACE FUNCTION actualizar_resumen_citas() RETURNS trigger AS $$
+BEGIN
+    IF current_setting('beautyweb.sin_resumen', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE resumen_citas
+        SET total = total - 1
+        WHERE fecha = OLD.fecha AND estilista = OLD.estilista AND estado = OLD.estado;
+
+        UPDATE resumen_mensual
+        SET total = total - 1, minutos = minutos - OLD.duracion_minutos
+        WHERE mes = date_trunc('month', OLD.fecha)::date AND estilista = OLD.estilista AND estado = OLD.estado;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO resumen_citas (fecha, estilista, estado, total)
+        VALUES (NEW.fecha, NEW.estilista, NEW.estado, 1)
+        ON CONFLICT (fecha, estilista, estado)
+        DO UPDATE SET total = resumen_citas.total + 1;
+
+        INSERT INTO resumen_mensual (mes, estilista, estado, total, minutos)
+        VALUES (date_trunc('month', NEW.fecha)::date, NEW.estilista, NEW.estado, 1, NEW.duracion_minutos)
+        ON CONFLICT (mes, estilista, estado)
+        DO UPDATE SET total = resumen_mensual.total + 1,
+                      minutos = resumen_mensual.minutos + EXCLUDED.minutos;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER citas_resumen
+    AFTER INSERT OR UPDATE OF fecha, estilista, estado, duracion_minutos OR DELETE ON citas
+    FOR EACH ROW EXECUTE FUNCTION actualizar_resumen_citas();
+
+-- Meses cerrados que archivar.py ya congeló
+CREATE TABLE citas_meses_archivados (
+    mes DATE PRIMARY KEY,
+    filas INTEGER NOT NULL,
+    archivado_en TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+ANALYZE citas;
+ANALYZE resumen_mensual;
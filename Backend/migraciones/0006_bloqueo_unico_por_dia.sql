@@ -0,0 +1,17 @@
+-- Un estilista solo puede tener un bloqueo de día completo por fecha, para
+-- que /bloquear pueda omitir los repetidos con ON CONFLICT aunque lleguen
+-- dos peticiones a la vez. Los repetidos que ya existan se borran,
+-- conservando el primero (el id menor).
+DELETE FROM horarios_bloqueados b
+USING horarios_bloqueados primero
+WHERE b.hora IS NULL
+AND primero.hora IS NULL
+AND primero.id_estilista = b.id_estilista
+AND primero.fecha = b.fecha
+AND primero.id < b.id;
+
+CREATE UNIQUE INDEX horarios_bloqueados_dia_uniq
+    ON horarios_bloqueados (id_estilista, fecha)
+    WHERE hora IS NULL;
+
+ANALYZE horarios_bloqueados;
@@ -0,0 +1,120 @@
+"""Aplica las migraciones de Backend/migraciones en orden.
+
+Uso:
+    python migrar.py            aplica las pendientes
+    python migrar.py --estado   muestra cuáles están aplicadas
+
+Cada archivo NNNN_nombre.sql se ejecuta en su propia transacción y queda
+registrado en schema_migraciones con su checksum. Un candado advisory
+evita que dos deploys migren a la vez.
+"""
+import hashlib
+import re
+import sys
+from pathlib import Path
+
+from db import conectar
+
+DIRECTORIO = Path(__file__).resolve().parent / "migraciones"
+# Identificador arbitrario del candado advisory de migraciones
+CANDADO_MIGRACIONES = 4242001
+
+
+class MigracionModificada(Exception):
+    """Una migración ya aplicada cambió de contenido"""
+
+
+def listar_migraciones():
+    """Devuelve [(version, nombre, sql, checksum)] ordenadas por versión"""
+    migraciones = []
+    for archivo in sorted(DIRECTORIO.glob("*.sql")):
+        coincidencia = re.match(r"^(\d+)_(.+)\.sql$", archivo.name)
+        if not coincidencia:
+            continue
+        sql = archivo.read_text(encoding="utf-8")
+        checksum = hashlib.sha256(sql.encode("utf-8")).hexdigest()
+        migraciones.append((int(coincidencia.group(1)), coincidencia.group(2), sql, checksum))
+    return migraciones
+
+
+def _aplicadas(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migraciones (
+            version INTEGER PRIMARY KEY,
+            nombre TEXT NOT NULL,
+            checksum TEXT NOT NULL,
+            aplicada_en TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    """)
+    cur.execute("SELECT version, checksum FROM schema_migraciones")
+    return dict(cur.fetchall())
+
+
+def aplicar_migraciones(salida=print):
+    """Aplica las migraciones pendientes y devuelve las versiones aplicadas"""
+    conn = conectar()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (CANDADO_MIGRACIONES,))
+            aplicadas = _aplicadas(cur)
+            conn.commit()
+
+            nuevas = []
+            for version, nombre, sql, checksum in listar_migraciones():
+                if version in aplicadas:
+                    if aplicadas[version] != checksum:
+                        raise MigracionModificada(
+                            f"La migración {version:04d}_{nombre} cambió después de aplicarse"
+                        )
+                    continue
+
+                salida(f"Aplicando {version:04d}_{nombre}...")
+                cur.execute(sql)
+                # Los RAISE WARNING de la migración (p. ej. filas que tuvo que corregir)
+                for aviso in conn.notices:
+                    if aviso.startswith("WARNING"):
+                        salida("  " + aviso.strip())
+                del conn.notices[:]
+                cur.execute("""
+                    INSERT INTO schema_migraciones (version, nombre, checksum)
+                    VALUES (%s, %s, %s)
+                """, (version, nombre, checksum))
+                conn.commit()
+                nuevas.append(version)
+
+            cur.execute("SELECT pg_advisory_unlock(%s)", (CANDADO_MIGRACIONES,))
+            conn.commit()
+
+        if not nuevas:
+            salida("La base ya está al día")
+        return nuevas
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def estado(salida=print):
+    conn = conectar()
+    try:
+        with conn.cursor() as cur:
+            aplicadas = _aplicadas(cur)
+            conn.commit()
+        for version, nombre, _, checksum in listar_migraciones():
+            if version not in aplicadas:
+                marca = "pendiente"
+            elif aplicadas[version] != checksum:
+                marca = "MODIFICADA"
+            else:
+                marca = "aplicada"
+            salida(f"{version:04d}_{nombre}: {marca}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    if "--estado" in sys.argv:
+        estado()
+    else:
+        aplicar_migraciones()
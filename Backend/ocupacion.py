@@ -0,0 +1,85 @@
+import os
+from datetime import date
+
+from cache import CACHE_NOTIFY, CacheLRU
+
+# Entradas (estilista, fecha) que se guardan como máximo por proceso
+OCUPACION_MAX = int(os.environ.get('OCUPACION_MAX', 5000))
+# Segundos que vive una entrada aunque no llegue ninguna invalidación
+OCUPACION_TTL = float(os.environ.get('OCUPACION_TTL', 300))
+
+CANAL = "ocupacion"
+
+
+def _clave(estilista, fecha):
+    if isinstance(fecha, date):
+        fecha = fecha.isoformat()
+    return (int(estilista), fecha)
+
+
+class IndiceOcupacion(CacheLRU):
+    """Índice en memoria con los bloqueos, citas y jornada por (estilista, fecha).
+
+    Las entradas son inmutables: {"bloqueos": tuple, "ocupados": tuple de
+    'HH:MM', "citas": tuple de (inicio, fin) y "jornada": tuple de
+    (inicio, fin)}, con inicio y fin en minutos desde la medianoche.
+    """
+
+    def __init__(self):
+        super().__init__(canal=CANAL, max_entradas=OCUPACION_MAX, ttl=OCUPACION_TTL)
+
+    def obtener(self, estilista, fecha):
+        return super().obtener(_clave(estilista, fecha))
+
+    def guardar(self, estilista, fecha, entrada, generacion):
+        super().guardar(_clave(estilista, fecha), entrada, generacion)
+
+    def invalidar(self, estilista, fecha=None):
+        """Descarta un día de un estilista, o todos sus días si fecha es None"""
+        if fecha is not None:
+            self.descartar(_clave(estilista, fecha))
+        else:
+            estilista = int(estilista)
+            self.descartar_si(lambda clave: clave[0] == estilista)
+
+    def al_notificar(self, payload):
+        estilista, _, fecha = payload.partition(":")
+        if fecha == "*":
+            self.invalidar(estilista)
+        else:
+            self.invalidar(estilista, fecha)
+
+
+indice_ocupacion = IndiceOcupacion()
+
+
+def payload_ocupacion(estilista, fecha=None):
+    """Mensaje de NOTIFY para un día de un estilista, o '*' para todos sus días"""
+    if isinstance(fecha, date):
+        fecha = fecha.isoformat()
+    return f"{int(estilista)}:{fecha or '*'}"
+
+
+def notificar_ocupacion(cur, estilista, fecha=None):
+    """Avisa a los demás workers, dentro de la transacción actual, que un día cambió.
+
+    Postgres solo entrega el NOTIFY si la transacción hace commit.
+    """
+    if not CACHE_NOTIFY:
+        return
+    cur.execute("SELECT pg_notify(%s, %s)", (CANAL, payload_ocupacion(estilista, fecha)))
+
+
+def notificar_ocupacion_dias(cur, estilista, fechas):
+    """Igual que notificar_ocupacion, para varios días en una sola sentencia"""
+    notificar_ocupaciones(cur, [(estilista, f) for f in fechas])
+
+
+def notificar_ocupaciones(cur, dias):
+    """Igual que notificar_ocupacion_dias, con pares (estilista, fecha) de varios estilistas"""
+    if not CACHE_NOTIFY or not dias:
+        return
+    cur.execute(
+        "SELECT pg_notify(%s, p) FROM unnest(%s::text[]) AS p",
+        (CANAL, [payload_ocupacion(e, f) for e, f in dias])
+    )
@@ -0,0 +1,207 @@
+"""Registra el plan (EXPLAIN) de cada consulta que ejecutan las rutas.
+
+Uso:
+    python planes.py [--salida planes_consultas.json]
+
+Recorre las rutas de back.py con el cliente de pruebas de Flask contra la
+base configurada (DATABASE_URL o la local), sin hacer commit de nada, y
+captura cada sentencia. Luego corre EXPLAIN de cada una con
+enable_seqscan = off: si aun así el plan hace Seq Scan sobre una tabla
+grande es que ninguna índice sirve para esa consulta. En ese caso
+termina con código 1, para usarlo como chequeo en CI.
+"""
+import json
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+os.environ.setdefault("BCRYPT_WORKERS", "0")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("SESION_SECRETO", "planes")
+
+import back  # noqa: E402
+import db  # noqa: E402
+from sesiones import emitir_token  # noqa: E402
+
+# Solo estas sentencias admiten EXPLAIN
+EXPLICABLES = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+# Tablas que crecen con el uso; un Seq Scan sobre ellas es una regresión
+TABLAS_VIGILADAS = {"citas", "horarios_bloqueados", "usuarios", "resumen_citas", "estilista_servicios",
+                    "horarios_estilista", "resumen_mensual"}
+
+
+class _SinCommit:
+    """Envuelve una conexión para que commit() deshaga en lugar de guardar"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def commit(self):
+        self._conn.rollback()
+
+    def __getattr__(self, nombre):
+        return getattr(self._conn, nombre)
+
+
+@contextmanager
+def _get_db_sin_commit(**kwargs):
+    with db.get_db(**kwargs) as conn:
+        yield _SinCommit(conn)
+
+
+def _muestras():
+    """Ids y valores reales de la base para que las rutas encuentren datos"""
+    with db.get_db() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT (SELECT MIN(id) FROM estilistas),
+                   (SELECT MIN(telefono) FROM usuarios),
+                   (SELECT MIN(id) FROM usuarios),
+                   (SELECT MAX(id) FROM citas),
+                   (SELECT MAX(id) FROM horarios_bloqueados),
+                   (SELECT MIN(nombre) FROM servicios)
+        """)
+        estilista, telefono, usuario, cita, bloqueo, servicio = cur.fetchone()
+    return {
+        "estilista": estilista or 1,
+        "telefono": telefono or "5500000000",
+        "usuario": usuario or 1,
+        "cita": cita or 1,
+        "bloqueo": bloqueo or 1,
+        "servicio": servicio or "Corte de cabello",
+    }
+
+
+def _rutas(m):
+    manana = (date.today() + timedelta(days=1)).isoformat()
+    semana = (date.today() + timedelta(days=7)).isoformat()
+    e, t = m["estilista"], m["telefono"]
+    return [
+        ("POST", "/registro", {"nombre": "Plan", "telefono": "5500000001", "contrasena": "planes1"}),
+        ("POST", "/login", {"telefono": t, "contrasena": "x"}),
+        ("GET", f"/citas_usuario/{t}?limite=1", None),
+        ("GET", f"/citas_usuario/{t}?limite=1&desde={manana}&estilista={e}", None),
+        ("GET", "/mis_citas?limite=1", None),
+        ("GET", "/estilistas", None),
+        ("GET", f"/estilistas/por-servicio/{m['servicio']}", None),
+        ("GET", "/servicios", None),
+        ("GET", f"/horarios_bloqueados/{e}/{manana}", None),
+        ("GET", f"/bloqueos/{e}", None),
+        ("DELETE", f"/bloqueos/{m['bloqueo']}", None),
+        ("POST", "/agendar", {"usuario_id": m["usuario"], "servicio": m["servicio"], "estilista": e,
+                              "fecha": manana, "hora": "09:00"}),
+        ("POST", "/bloquear", {"id_estilista": e, "desde": manana, "hasta": semana}),
+        ("DELETE", f"/citas/{m['cita']}", None),
+        ("GET", "/admin/staff", None),
+        ("POST", "/admin/stylists/add", {"nombre": "Plan", "servicios": [1]}),
+        ("GET", f"/admin/stylists/{e}/horario", None),
+        ("PUT", f"/admin/stylists/{e}/horario", [{"dia_semana": 1, "inicio": "10:00", "fin": "18:00"}]),
+        ("POST", "/admin/stylists/delete", {"id": e}),
+        ("GET", "/citas/pendientes?limite=1", None),
+        ("GET", f"/citas/pendientes?limite=1&desde={manana}&hasta={semana}", None),
+        ("GET", f"/citas/exportar?desde={manana}&estado=Confirmada&despues_de=1", None),
+        ("PUT", f"/citas/confirmar/{m['cita']}", None),
+        ("PUT", f"/citas/rechazar/{m['cita']}", {"razon": "plan"}),
+        ("POST", "/citas/lote", {"acciones": [{"id": m["cita"], "accion": "confirmar"},
+                                              {"id": m["cita"] + 1, "accion": "rechazar", "razon": "plan"},
+                                              {"id": m["cita"] + 2, "accion": "eliminar"}]}),
+        ("GET", "/citas/hoy/count", None),
+        ("GET", "/citas/pendientes/count", None),
+        ("GET", f"/horarios_ocupados/{e}/{manana}", None),
+        ("GET", f"/disponibilidad/{e}/{manana}", None),
+        ("GET", f"/disponibilidad/{e}?desde={manana}&hasta={semana}&servicio={m['servicio']}", None),
+        ("GET", f"/disponibilidad/servicio/{m['servicio']}?desde={manana}&dias=7", None),
+        ("GET", "/admin/dashboard", None),
+        ("GET", "/citas/confirmadas/mes/count", None),
+        ("GET", "/estadisticas/satisfaccion", None),
+        ("GET", f"/estadisticas/mensuales?estilista={e}", None),
+    ]
+
+
+def capturar_consultas():
+    """Devuelve [(ruta, sql)] de todo lo que ejecutan las rutas"""
+    capturadas = []
+    ruta_actual = [None]
+    hilo_principal = threading.get_ident()
+
+    def observador(cur, query, vars, segundos):
+        # El hilo del listener de caché también ejecuta consultas
+        if threading.get_ident() != hilo_principal:
+            return
+        sql = cur.mogrify(query, vars).decode("utf-8").strip()
+        if sql.upper().startswith(EXPLICABLES) and sql != "SELECT 1":
+            capturadas.append((ruta_actual[0], sql))
+
+    muestras = _muestras()
+    # Todas las rutas van con la sesión del usuario de muestra
+    sesion = {"Authorization": "Bearer " + emitir_token(muestras["usuario"], "Plan", muestras["telefono"])}
+    original = back.get_db
+    back.get_db = _get_db_sin_commit
+    quitar = db.observar_consultas(observador)
+    try:
+        cliente = back.app.test_client()
+        for metodo, ruta, cuerpo in _rutas(muestras):
+            ruta_actual[0] = f"{metodo} {ruta}"
+            # Sin cachés, para que toda ruta llegue a la base
+            back.cache_catalogo.limpiar()
+            back.indice_ocupacion.limpiar()
+            resp = cliente.open(ruta, method=metodo, json=cuerpo, headers=sesion)
+            resp.get_data()
+    finally:
+        quitar()
+        back.get_db = original
+    return capturadas
+
+
+def _seq_scans(nodo, encontrados, padres):
+    # Las particiones (citas_2025_01...) cuentan como su tabla
+    tabla = padres.get(nodo.get("Relation Name"), nodo.get("Relation Name"))
+    if nodo.get("Node Type") == "Seq Scan" and tabla in TABLAS_VIGILADAS:
+        encontrados.append(nodo["Relation Name"])
+    for hijo in nodo.get("Plans", []):
+        _seq_scans(hijo, encontrados, padres)
+    return encontrados
+
+
+def explicar(capturadas):
+    resultados = []
+    conn = db.conectar()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT inhrelid::regclass::text, inhparent::regclass::text FROM pg_inherits")
+            padres = dict(cur.fetchall())
+            for ruta, sql in capturadas:
+                cur.execute("SET LOCAL enable_seqscan = off")
+                cur.execute("EXPLAIN (FORMAT JSON) " + sql)
+                plan = cur.fetchone()[0][0]["Plan"]
+                conn.rollback()
+                resultados.append({
+                    "ruta": ruta,
+                    "sql": " ".join(sql.split()),
+                    "seq_scans": _seq_scans(plan, [], padres),
+                    "plan": plan,
+                })
+    finally:
+        conn.close()
+    return resultados
+
+
+def main():
+    salida = "planes_consultas.json"
+    if "--salida" in sys.argv:
+        salida = sys.argv[sys.argv.index("--salida") + 1]
+
+    resultados = explicar(capturar_consultas())
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(resultados, f, ensure_ascii=False, indent=2, default=str)
+
+    malos = [r for r in resultados if r["seq_scans"]]
+    print(f"{len(resultados)} consultas revisadas, planes en {salida}")
+    for r in malos:
+        print(f"  Seq Scan en {', '.join(r['seq_scans'])}: {r['ruta']}\n    {r['sql'][:160]}")
+    return 1 if malos else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""Tokens de sesión firmados, sin estado en el servidor.
+
+/login entrega un token con el id, nombre y teléfono del usuario firmados
+con HMAC (itsdangerous, que ya viene con Flask). El cliente lo manda en
+"Authorization: Bearer <token>" y las rutas lo verifican sin consultar la
+base, así que bcrypt solo corre una vez por sesión y las rutas del
+cliente tienen el usuario_id sin buscarlo por teléfono.
+
+Todos los workers deben firmar con el mismo secreto (SESION_SECRETO), y
+debe ser el mismo entre reinicios o se cierran todas las sesiones. Con
+DATABASE_URL definido (producción) la app no arranca sin él; en
+desarrollo, contra la base local, se usa uno aleatorio por proceso.
+"""
+import functools
+import logging
+import os
+import secrets
+
+from flask import g, jsonify, request
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+# Segundos que dura una sesión desde el login
+SESION_DURACION = int(os.environ.get('SESION_DURACION', 30 * 24 * 3600))
+
+log = logging.getLogger("beautyweb.sesiones")
+
+SESION_SECRETO = os.environ.get('SESION_SECRETO')
+if not SESION_SECRETO:
+    if os.environ.get('DATABASE_URL'):
+        raise RuntimeError(
+            "Falta SESION_SECRETO: sin un secreto común cada worker firmaría con el suyo "
+            "y los tokens fallarían al azar (ver .env.example)"
+        )
+    log.warning("SESION_SECRETO no está definido; las sesiones solo valen en este proceso")
+    SESION_SECRETO = secrets.token_hex(32)
+
+_firmador = URLSafeTimedSerializer(SESION_SECRETO, salt="sesion")
+
+
+def emitir_token(usuario_id, nombre, telefono):
+    return _firmador.dumps({"id": usuario_id, "nombre": nombre, "telefono": telefono})
+
+
+def leer_token(token):
+    """Datos del usuario si el token es válido y no expiró, o None"""
+    try:
+        return _firmador.loads(token, max_age=SESION_DURACION)
+    except (BadSignature, SignatureExpired):
+        return None
+
+
+def usuario_sesion():
+    """Usuario del token de la petición actual, o None (se verifica una vez por petición)"""
+    if "sesion" not in g:
+        encabezado = request.headers.get("Authorization", "")
+        esquema, _, token = encabezado.partition(" ")
+        g.sesion = leer_token(token.strip()) if esquema.lower() == "bearer" and token else None
+    return g.sesion
+
+
+def requiere_sesion(funcion):
+    """Responde 401 si la petición no trae un token válido"""
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        if usuario_sesion() is None:
+            return jsonify({"error": "Sesión inválida o expirada"}), 401
+        return funcion(*args, **kwargs)
+    return envoltura
@@ -0,0 +1,99 @@
+"""Configuración común de las pruebas (correr con python -m pytest desde Backend).
+
+Las pruebas de los módulos puros no usan base. Las de las rutas corren
+contra el Postgres de PRUEBAS_DSN, al que se le aplican las migraciones y
+se le crean y borran filas (nunca debe ser la base real); sin PRUEBAS_DSN,
+o si no responde, se saltan.
+"""
+import os
+import sys
+import uuid
+from datetime import date, timedelta
+from pathlib import Path
+
+import pytest
+
+# Los módulos del backend se importan por nombre, como en back.py
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Los módulos leen la configuración al importarse. Ninguna prueba debe
+# llegar a la base de DATABASE_URL, solo a la de PRUEBAS_DSN
+PRUEBAS_DSN = os.environ.get("PRUEBAS_DSN")
+os.environ.pop("DATABASE_URL", None)
+if PRUEBAS_DSN:
+    os.environ["DATABASE_URL"] = PRUEBAS_DSN
+    os.environ.setdefault("DB_SSLMODE", "disable")
+os.environ.setdefault("SESION_SECRETO", "secreto-de-pruebas")
+
+
+@pytest.fixture(scope="session")
+def base():
+    """Base de PRUEBAS_DSN con las migraciones al día"""
+    if not PRUEBAS_DSN:
+        pytest.skip("PRUEBAS_DSN no está definido")
+    import psycopg2
+    import migrar
+    try:
+        migrar.aplicar_migraciones(salida=lambda *_: None)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"PRUEBAS_DSN no responde: {e}")
+
+
+@pytest.fixture
+def api(base):
+    import back
+    back.app.config["TESTING"] = True
+    return back.app.test_client()
+
+
+@pytest.fixture
+def salon(base):
+    """Un estilista, un servicio de 90 minutos y dos usuarios propios de la prueba.
+
+    marca va en los nombres y en las Idempotency-Key de la prueba para
+    poder borrar todo lo que dejó al terminar.
+    """
+    import back
+    from db import conectar
+
+    marca = uuid.uuid4().hex[:12]
+    conn = conectar()
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO estilistas (nombre) VALUES (%s) RETURNING id", (f"Prueba {marca}",))
+        estilista = cur.fetchone()[0]
+        cur.execute(
+            "INSERT INTO servicios (nombre, precio, duracion_minutos) VALUES (%s, 100, 90)",
+            (f"Servicio {marca}",)
+        )
+        usuarios = []
+        for prefijo in ("98", "99"):
+            cur.execute(
+                "INSERT INTO usuarios (nombre, telefono) VALUES (%s, %s) RETURNING id",
+                ("Prueba", prefijo + str(int(marca, 16) % 10**8).zfill(8))
+            )
+            usuarios.append(cur.fetchone()[0])
+    conn.commit()
+    # La duración del servicio nuevo no está en la caché del catálogo
+    back.cache_catalogo.limpiar()
+
+    try:
+        yield {
+            "marca": marca,
+            "estilista": estilista,
+            "servicio": f"Servicio {marca}",
+            "usuario": usuarios[0],
+            "otro_usuario": usuarios[1],
+            # Lejos de las citas de cualquier otra prueba
+            "fecha": date.today() + timedelta(days=90),
+        }
+    finally:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM claves_idempotencia WHERE clave LIKE %s", (f"%{marca}%",))
+            cur.execute("DELETE FROM citas WHERE estilista = %s OR usuario_id = ANY(%s)", (estilista, usuarios))
+            cur.execute("DELETE FROM resumen_citas WHERE estilista = %s", (estilista,))
+            cur.execute("DELETE FROM resumen_mensual WHERE estilista = %s", (estilista,))
+            cur.execute("DELETE FROM estilistas WHERE id = %s", (estilista,))
+            cur.execute("DELETE FROM servicios WHERE nombre = %s", (f"Servicio {marca}",))
+            cur.execute("DELETE FROM usuarios WHERE id = ANY(%s)", (usuarios,))
+        conn.commit()
+        conn.close()
@@ -0,0 +1,83 @@
+from datetime import time
+
+import pytest
+
+import agenda
+from agenda import DiaAgenda, a_hora, a_minutos, fusionar, inicios, restar
+
+
+def test_a_minutos_y_a_hora():
+    assert a_minutos("09:30") == 570
+    assert a_minutos("09:30:00") == 570
+    assert a_minutos(time(18, 15)) == 1095
+    assert a_hora(570) == "09:30"
+    assert a_hora(0) == "00:00"
+
+
+def test_parsear_jornada_con_turnos():
+    assert agenda._parsear_jornada("09:00-13:00, 15:00-19:00") == ((540, 780), (900, 1140))
+
+
+@pytest.mark.parametrize("intervalos, esperado", [
+    ([], []),
+    ([(60, 120), (0, 30)], [(0, 30), (60, 120)]),
+    ([(0, 60), (30, 90)], [(0, 90)]),
+    # Los que se tocan también se unen
+    ([(0, 60), (60, 90)], [(0, 90)]),
+    # Uno contenido en otro no lo acorta
+    ([(0, 120), (30, 60)], [(0, 120)]),
+])
+def test_fusionar(intervalos, esperado):
+    assert fusionar(intervalos) == esperado
+
+
+@pytest.mark.parametrize("base, quitar, esperado", [
+    ([(0, 100)], [], [(0, 100)]),
+    ([(0, 100)], [(20, 40)], [(0, 20), (40, 100)]),
+    ([(0, 100)], [(0, 100)], []),
+    ([(0, 100)], [(-10, 10), (90, 110)], [(10, 90)]),
+    ([(0, 50), (60, 100)], [(40, 70)], [(0, 40), (70, 100)]),
+    ([(0, 50), (60, 100)], [(10, 20), (30, 40), (200, 300)], [(0, 10), (20, 30), (40, 50), (60, 100)]),
+])
+def test_restar(base, quitar, esperado):
+    assert restar(base, quitar) == esperado
+
+
+def test_inicios_alineados_al_paso():
+    # 09:10-11:00 con paso 30: el primer inicio es 09:30 y el último que cabe 10:00
+    assert list(inicios([(550, 660)], 60, paso=30)) == [570, 600]
+    assert list(inicios([(540, 580)], 60, paso=30)) == []
+    assert list(inicios([(540, 600), (660, 720)], 60, paso=30)) == [540, 660]
+
+
+def test_dia_agenda_cabe_y_disponibles(monkeypatch):
+    monkeypatch.setattr(agenda, "AGENDA_PASO_MINUTOS", 30)
+    dia = DiaAgenda([(540, 1140)], [(600, 660), (720, 810)])
+    assert dia.libres == [(540, 600), (660, 720), (810, 1140)]
+    assert dia.cabe(540, 60)
+    assert not dia.cabe(570, 60)
+    assert not dia.cabe(600, 30)
+    assert dia.cabe(660, 60)
+    assert not dia.cabe(690, 60)
+    # Antes de la jornada no hay intervalo libre
+    assert not dia.cabe(480, 30)
+    assert list(dia.disponibles(60, desde=800))[:2] == [810, 840]
+    assert 570 not in dia.disponibles(60)
+
+
+def test_dia_agenda_en_jornada_con_turnos():
+    dia = DiaAgenda([(540, 780), (900, 1140)], [])
+    assert dia.en_jornada(540, 240)
+    assert not dia.en_jornada(720, 120)
+    assert not dia.en_jornada(1110, 60)
+    # Turnos que se tocan cuentan como uno solo
+    assert DiaAgenda([(540, 780), (780, 900)], []).en_jornada(750, 60)
+
+
+def test_dia_agenda_bloqueado_no_tiene_libres(monkeypatch):
+    monkeypatch.setattr(agenda, "AGENDA_PASO_MINUTOS", 30)
+    dia = DiaAgenda([(540, 1140)], [], bloqueado=True)
+    assert dia.libres == []
+    assert not dia.cabe(600, 60)
+    # Los horarios ofrecidos siguen siendo los de la jornada
+    assert next(iter(dia.horarios(60))) == 540
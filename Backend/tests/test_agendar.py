@@ -0,0 +1,88 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from db import conectar
+
+
+def agendar(api, salon, hora, **extra):
+    return api.post("/agendar", json={
+        "usuario_id": salon["usuario"],
+        "servicio": salon["servicio"],
+        "estilista": salon["estilista"],
+        "fecha": salon["fecha"].isoformat(),
+        "hora": hora,
+    }, **extra)
+
+
+def ejecutar(sql, params):
+    conn = conectar()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def test_agendar_y_traslapes(api, salon):
+    resp = agendar(api, salon, "10:00")
+    assert resp.status_code == 200, resp.get_json()
+    assert resp.get_json()["id"]
+
+    # El servicio dura 90 minutos: ocupa hasta las 11:30
+    for hora in ("10:00", "09:00", "11:00"):
+        resp = agendar(api, salon, hora)
+        assert resp.status_code == 400
+        assert resp.get_json() == {"error": "Este horario ya está ocupado"}
+
+    assert agendar(api, salon, "11:30").status_code == 200
+
+
+def test_fuera_de_la_jornada_general(api, salon):
+    # Con la JORNADA por omisión (09:00-19:00) el servicio de 90 minutos no cabe
+    resp = agendar(api, salon, "18:00")
+    assert resp.status_code == 400
+    assert resp.get_json() == {"error": "El horario está fuera del horario de atención"}
+
+
+def test_reservas_simultaneas_entra_una(api, salon):
+    with ThreadPoolExecutor(max_workers=8) as hilos:
+        respuestas = list(hilos.map(lambda _: agendar(api, salon, "15:00"), range(8)))
+
+    codigos = sorted(r.status_code for r in respuestas)
+    assert codigos == [200] + [400] * 7
+    assert all(
+        r.get_json() == {"error": "Este horario ya está ocupado"}
+        for r in respuestas if r.status_code == 400
+    )
+
+
+def test_dia_bloqueado(api, salon):
+    ejecutar(
+        "INSERT INTO horarios_bloqueados (id_estilista, fecha) VALUES (%s, %s)",
+        (salon["estilista"], salon["fecha"])
+    )
+    resp = agendar(api, salon, "10:00")
+    assert resp.status_code == 400
+    assert resp.get_json() == {"error": "El estilista no está disponible en esta fecha"}
+
+
+@pytest.mark.parametrize("hora, codigo", [
+    ("09:00", 200),
+    # Cruza de un turno al siguiente, que empieza justo donde acaba el primero
+    ("12:30", 200),
+    # 15:30 + 90 minutos se sale del turno de la tarde
+    ("15:30", 400),
+    ("08:00", 400),
+])
+def test_jornada_propia_del_estilista(api, salon, hora, codigo):
+    ejecutar("""
+        INSERT INTO horarios_estilista (estilista_id, dia_semana, inicio, fin)
+        VALUES (%(e)s, %(d)s, '09:00', '13:00'), (%(e)s, %(d)s, '13:00', '16:00')
+    """, {"e": salon["estilista"], "d": salon["fecha"].isoweekday()})
+
+    resp = agendar(api, salon, hora)
+    assert resp.status_code == codigo, resp.get_json()
+    if codigo == 400:
+        assert resp.get_json() == {"error": "El horario está fuera del horario de atención"}
@@ -0,0 +1,79 @@
+from types import SimpleNamespace
+
+import pytest
+
+import cache
+from cache import CacheLRU
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    """Reloj falso para cache.time.monotonic; se avanza con reloj.ahora += s"""
+    reloj = SimpleNamespace(ahora=1000.0)
+    monkeypatch.setattr(cache, "time", SimpleNamespace(monotonic=lambda: reloj.ahora))
+    return reloj
+
+
+def test_guardar_y_obtener():
+    c = CacheLRU()
+    assert c.obtener("a") is None
+    c.guardar("a", 1, c.generacion())
+    assert c.obtener("a") == 1
+
+
+def test_expulsa_la_menos_usada():
+    c = CacheLRU(max_entradas=2)
+    c.guardar("a", 1, c.generacion())
+    c.guardar("b", 2, c.generacion())
+    # Leer "a" la vuelve la más reciente: al llenarse sale "b"
+    assert c.obtener("a") == 1
+    c.guardar("c", 3, c.generacion())
+    assert c.obtener("b") is None
+    assert c.obtener("a") == 1
+    assert c.obtener("c") == 3
+
+
+def test_ttl(reloj):
+    c = CacheLRU(ttl=60)
+    c.guardar("a", 1, c.generacion())
+    reloj.ahora += 60
+    assert c.obtener("a") == 1
+    reloj.ahora += 1
+    assert c.obtener("a") is None
+
+
+def test_lectura_lenta_no_pisa_una_invalidacion():
+    c = CacheLRU()
+    generacion = c.generacion()
+    # Mientras se consultaba la base, otra petición cambió el dato
+    c.descartar("a")
+    c.guardar("a", "viejo", generacion)
+    assert c.obtener("a") is None
+    c.guardar("a", "nuevo", c.generacion())
+    assert c.obtener("a") == "nuevo"
+
+
+def test_descartar_si():
+    c = CacheLRU()
+    for clave in [(1, "lunes"), (1, "martes"), (2, "lunes")]:
+        c.guardar(clave, clave, c.generacion())
+    c.descartar_si(lambda clave: clave[0] == 1)
+    assert c.obtener((1, "lunes")) is None
+    assert c.obtener((1, "martes")) is None
+    assert c.obtener((2, "lunes")) == (2, "lunes")
+
+
+def test_aviso_en_el_canal_vacia_la_cache(monkeypatch):
+    monkeypatch.setattr(cache.escucha, "conectado", lambda: True)
+    c = CacheLRU(canal="pruebas_cache")
+    c.guardar("a", 1, c.generacion())
+    c.al_notificar("")
+    assert c.obtener("a") is None
+
+
+def test_sin_escucha_conectada_no_responde(monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_NOTIFY", True)
+    monkeypatch.setattr(cache.escucha, "conectado", lambda: False)
+    c = CacheLRU(canal="pruebas_cache")
+    c.guardar("a", 1, c.generacion())
+    assert c.obtener("a") is None
@@ -0,0 +1,104 @@
+import gzip
+
+import pytest
+from flask import Flask, Response, jsonify
+
+import compresion
+
+GRANDE = {"citas": [{"id": i, "servicio": "Corte de cabello"} for i in range(200)]}
+
+
+@pytest.fixture
+def cliente():
+    app = Flask(__name__)
+    compresion.instalar(app)
+
+    @app.route("/grande", methods=["GET", "POST"])
+    def grande():
+        return jsonify(GRANDE)
+
+    @app.route("/chica")
+    def chica():
+        return jsonify({"ok": True})
+
+    @app.route("/con_etag")
+    def con_etag():
+        resp = jsonify(GRANDE)
+        resp.set_etag("v1")
+        return resp
+
+    @app.route("/stream")
+    def stream():
+        return Response((b"x" * 2048 for _ in range(2)), mimetype="text/plain")
+
+    @app.route("/error")
+    def error():
+        return jsonify({"error": "x" * 2048}), 400
+
+    return app.test_client()
+
+
+def _json(cliente, datos):
+    """Cuerpo sin comprimir que la app manda para datos"""
+    with cliente.application.app_context():
+        return jsonify(datos).get_data()
+
+
+def test_gzip(cliente):
+    resp = cliente.get("/grande", headers={"Accept-Encoding": "gzip"})
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in resp.headers["Vary"]
+    assert gzip.decompress(resp.data) == _json(cliente, GRANDE)
+
+
+def test_brotli_si_se_acepta(cliente):
+    brotli = pytest.importorskip("brotli")
+    resp = cliente.get("/grande", headers={"Accept-Encoding": "gzip, br"})
+    assert resp.headers["Content-Encoding"] == "br"
+    assert brotli.decompress(resp.data) == _json(cliente, GRANDE)
+
+
+def test_sin_accept_encoding_no_comprime(cliente):
+    resp = cliente.get("/grande")
+    assert "Content-Encoding" not in resp.headers
+    assert "Accept-Encoding" in resp.headers["Vary"]
+
+
+def test_cuerpo_chico_no_se_comprime(cliente):
+    resp = cliente.get("/chica", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in resp.headers
+    assert resp.get_json() == {"ok": True}
+
+
+def test_streaming_se_deja_igual(cliente):
+    resp = cliente.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in resp.headers
+    assert "ETag" not in resp.headers
+    assert resp.data == b"x" * 4096
+
+
+def test_etag_debil_y_304(cliente):
+    resp = cliente.get("/grande")
+    etag = resp.headers["ETag"]
+    assert etag.startswith('W/"')
+    assert resp.cache_control.private and resp.cache_control.no_cache
+
+    resp = cliente.get("/grande", headers={"If-None-Match": etag, "Accept-Encoding": "gzip"})
+    assert resp.status_code == 304
+    assert resp.data == b""
+    assert "Content-Encoding" not in resp.headers
+
+
+def test_solo_get_200_lleva_etag(cliente):
+    assert "ETag" not in cliente.post("/grande").headers
+    resp = cliente.get("/error", headers={"Accept-Encoding": "gzip"})
+    assert "ETag" not in resp.headers
+    # Los errores grandes sí se comprimen
+    assert resp.headers["Content-Encoding"] == "gzip"
+
+
+def test_etag_fuerte_pasa_a_debil_al_comprimir(cliente):
+    resp = cliente.get("/con_etag")
+    assert resp.headers["ETag"] == '"v1"'
+    resp = cliente.get("/con_etag", headers={"Accept-Encoding": "gzip"})
+    assert resp.headers["ETag"] == 'W/"v1"'
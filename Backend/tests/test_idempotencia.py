@@ -0,0 +1,103 @@
+import hashlib
+import json
+
+from db import conectar
+from idempotencia import ENCABEZADO, ENCABEZADO_REPETIDA
+from sesiones import emitir_token
+
+
+def cuerpo(salon, hora):
+    return {
+        "usuario_id": salon["usuario"],
+        "servicio": salon["servicio"],
+        "estilista": salon["estilista"],
+        "fecha": salon["fecha"].isoformat(),
+        "hora": hora,
+    }
+
+
+def citas_del_estilista(salon):
+    conn = conectar()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT count(*) FROM citas WHERE estilista = %s", (salon["estilista"],))
+            return cur.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_reintento_repite_la_respuesta(api, salon):
+    clave = {ENCABEZADO: f"reserva-{salon['marca']}"}
+    primera = api.post("/agendar", json=cuerpo(salon, "10:00"), headers=clave)
+    assert primera.status_code == 200, primera.get_json()
+    assert ENCABEZADO_REPETIDA not in primera.headers
+
+    repetida = api.post("/agendar", json=cuerpo(salon, "10:00"), headers=clave)
+    assert repetida.status_code == 200
+    assert repetida.headers[ENCABEZADO_REPETIDA] == "true"
+    assert repetida.get_json() == primera.get_json()
+    assert citas_del_estilista(salon) == 1
+
+    # Sin la clave la misma petición sí se ejecuta (y el horario ya está ocupado)
+    sin_clave = api.post("/agendar", json=cuerpo(salon, "10:00"))
+    assert sin_clave.status_code == 400
+
+
+def test_errores_del_cliente_tambien_se_repiten(api, salon):
+    clave = {ENCABEZADO: f"pasada-{salon['marca']}"}
+    datos = dict(cuerpo(salon, "10:00"), fecha="2000-01-01")
+    primera = api.post("/agendar", json=datos, headers=clave)
+    assert primera.status_code == 400
+    repetida = api.post("/agendar", json=datos, headers=clave)
+    assert repetida.status_code == 400
+    assert repetida.headers[ENCABEZADO_REPETIDA] == "true"
+
+
+def test_misma_clave_con_otro_cuerpo(api, salon):
+    clave = {ENCABEZADO: f"reserva-{salon['marca']}"}
+    assert api.post("/agendar", json=cuerpo(salon, "10:00"), headers=clave).status_code == 200
+    resp = api.post("/agendar", json=cuerpo(salon, "12:00"), headers=clave)
+    assert resp.status_code == 422
+    assert citas_del_estilista(salon) == 1
+
+
+def test_peticion_en_curso(api, salon):
+    clave = f"en-curso-{salon['marca']}"
+    datos = json.dumps(cuerpo(salon, "10:00")).encode()
+    huella = hashlib.sha256(b"POST /agendar\n" + datos).hexdigest()
+    conn = conectar()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO claves_idempotencia (ruta, clave, huella) VALUES ('/agendar', %s, %s)",
+                (clave, huella)
+            )
+        conn.commit()
+    finally:
+        conn.close()
+
+    resp = api.post("/agendar", data=datos, content_type="application/json", headers={ENCABEZADO: clave})
+    assert resp.status_code == 409
+    assert resp.headers["Retry-After"] == "1"
+    assert citas_del_estilista(salon) == 0
+
+
+def test_la_clave_vale_por_usuario(api, salon):
+    clave = f"reserva-{salon['marca']}"
+    datos = dict(cuerpo(salon, "10:00"), usuario_id=None)
+
+    def reservar(usuario, hora):
+        token = emitir_token(usuario, "Prueba", "")
+        return api.post("/agendar", json=dict(datos, hora=hora), headers={
+            ENCABEZADO: clave, "Authorization": f"Bearer {token}"
+        })
+
+    primera = reservar(salon["usuario"], "10:00")
+    assert primera.status_code == 200, primera.get_json()
+    # Otro usuario con la misma clave y el mismo cuerpo no recibe la cita del primero
+    otra = reservar(salon["otro_usuario"], "10:00")
+    assert ENCABEZADO_REPETIDA not in otra.headers
+    assert otra.status_code == 400
+    assert reservar(salon["otro_usuario"], "12:00").status_code == 422
+
+    assert reservar(salon["usuario"], "10:00").headers[ENCABEZADO_REPETIDA] == "true"
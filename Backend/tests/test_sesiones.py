@@ -0,0 +1,66 @@
+import pytest
+from flask import Flask, jsonify
+
+import sesiones
+from sesiones import emitir_token, leer_token, requiere_sesion, usuario_sesion
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+
+    @app.route("/privada")
+    @requiere_sesion
+    def privada():
+        return jsonify(usuario_sesion())
+
+    return app
+
+
+def test_token_ida_y_vuelta():
+    token = emitir_token(7, "Ana", "5512345678")
+    assert leer_token(token) == {"id": 7, "nombre": "Ana", "telefono": "5512345678"}
+
+
+def test_token_alterado_no_vale():
+    token = emitir_token(7, "Ana", "5512345678")
+    assert leer_token(token.rsplit(".", 1)[0] + ".firmafalsa") is None
+    assert leer_token("") is None
+    assert leer_token("basura") is None
+
+
+def test_token_de_otro_secreto_no_vale():
+    from itsdangerous import URLSafeTimedSerializer
+    ajeno = URLSafeTimedSerializer("otro-secreto", salt="sesion").dumps({"id": 1})
+    assert leer_token(ajeno) is None
+
+
+def test_token_expirado(monkeypatch):
+    token = emitir_token(7, "Ana", "5512345678")
+    monkeypatch.setattr(sesiones, "SESION_DURACION", -1)
+    assert leer_token(token) is None
+
+
+@pytest.mark.parametrize("encabezado", [None, "", "Bearer", "Bearer ", "Basic abc", "Bearer no-es-un-token"])
+def test_usuario_sesion_sin_token_valido(app, encabezado):
+    headers = {"Authorization": encabezado} if encabezado is not None else {}
+    with app.test_request_context(headers=headers):
+        assert usuario_sesion() is None
+
+
+def test_usuario_sesion_lee_bearer(app):
+    token = emitir_token(7, "Ana", "5512345678")
+    with app.test_request_context(headers={"Authorization": f"bearer  {token}"}):
+        assert usuario_sesion()["id"] == 7
+
+
+def test_requiere_sesion(app):
+    cliente = app.test_client()
+    resp = cliente.get("/privada")
+    assert resp.status_code == 401
+    assert resp.get_json() == {"error": "Sesión inválida o expirada"}
+
+    token = emitir_token(7, "Ana", "5512345678")
+    resp = cliente.get("/privada", headers={"Authorization": f"Bearer {token}"})
+    assert resp.status_code == 200
+    assert resp.get_json()["nombre"] == "Ana"
@@ -18,10 +18,7 @@ function showAdminView(view) {
     }
 
     if (view === "inicio") {
-        loadTodayCount();
-        loadPendingCount();
-        loadConfirmedMonthCount();
-        loadSatisfaccion();
+        loadDashboard();
     }
 
     if (view === "proximas") {
@@ -36,6 +33,22 @@ let appointments = JSON.parse(localStorage.getItem("appointments")) || [];
 /* ==========================
    PENDING + CONFIRMED APPOINTMENTS CON INFO DESPLEGABLE Y RANGO DE FECHAS
 ========================== */
+// Recorre todas las páginas de un listado paginado por cursor
+async function fetchTodasLasPaginas(url) {
+    const separador = url.includes("?") ? "&" : "?";
+    let items = [];
+    let cursor = null;
+
+    do {
+        const response = await fetchApi(url + separador + "limite=200" + (cursor ? `&cursor=${cursor}` : ""));
+        if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+        items = items.concat(await response.json());
+        cursor = response.headers.get("X-Siguiente-Cursor");
+    } while (cursor);
+
+    return items;
+}
+
 async function loadPendingAppointments() {
     const pendingContainer = document.getElementById("pending-list");
     const confirmedContainer = document.getElementById("confirmed-list");
@@ -44,9 +57,10 @@ async function loadPendingAppointments() {
     confirmedContainer.innerHTML = "<p>Cargando...</p>";
 
     try {
-        const response = await fetch(`${window.API_URL}/citas/pendientes`);
-        if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
-        const citas = await response.json();
+        // Solo citas desde hoy; el backend filtra y pagina
+        const desde = new Date();
+        const desdeStr = `${desde.getFullYear()}-${String(desde.getMonth() + 1).padStart(2, "0")}-${String(desde.getDate()).padStart(2, "0")}`;
+        const citas = await fetchTodasLasPaginas(`${window.API_URL}/citas/pendientes?desde=${desdeStr}`);
 
         pendingContainer.innerHTML = "";
         confirmedContainer.innerHTML = "";
@@ -70,6 +84,10 @@ async function loadPendingAppointments() {
         const confirmadas = citasFuturas.filter(c => c.estado === "Confirmada");
 
         // ===== PENDIENTES CON TRIÁNGULO DESPLEGABLE =====
+        if (pendientes.length > 0) {
+            pendingContainer.appendChild(crearBarraLote());
+        }
+
         const pendientesPorMes = {};
         pendientes.forEach(cita => {
             const fecha = new Date(cita.fecha);
@@ -91,6 +109,7 @@ async function loadPendingAppointments() {
 
                 card.innerHTML = `
                     <div class="card-summary" style="display: flex; align-items: center; gap: 10px;">
+                        <input type="checkbox" class="seleccion-lote" value="${cita.id}">
                         <span class="triangle" style="font-size: 18px; transition: transform 0.3s;">▶</span>
                         <div>
                             <strong>${cita.servicio}</strong><br>
@@ -109,6 +128,8 @@ async function loadPendingAppointments() {
                 const details = card.querySelector(".card-details");
                 const triangle = card.querySelector(".triangle");
 
+                card.querySelector(".seleccion-lote").addEventListener("click", e => e.stopPropagation());
+
                 summary.addEventListener("click", () => {
                     const isHidden = details.style.display === "none";
                     details.style.display = isHidden ? "block" : "none";
@@ -296,7 +317,7 @@ async function loadPendingAppointments() {
 
 async function confirmarCita(id) {
     try {
-        const response = await fetch(`${window.API_URL}/citas/confirmar/${id}`, {
+        const response = await fetchApi(`${window.API_URL}/citas/confirmar/${id}`, {
             method: "PUT",
             headers: { "Content-Type": "application/json" }
         });
@@ -306,9 +327,7 @@ async function confirmarCita(id) {
         if (response.ok) {
             alert("✓ Cita confirmada");
             loadPendingAppointments();
-            loadPendingCount();
-            loadTodayCount();
-            loadConfirmedMonthCount();
+            loadDashboard();
         } else {
             alert("Error: " + (data.error || "No se pudo confirmar"));
         }
@@ -321,7 +340,7 @@ async function confirmarCita(id) {
 
 async function rechazarCita(id, motivo) {
     try {
-        const response = await fetch(`${window.API_URL}/citas/rechazar/${id}`, {
+        const response = await fetchApi(`${window.API_URL}/citas/rechazar/${id}`, {
             method: "PUT",
             headers: { "Content-Type": "application/json" },
             body: JSON.stringify({ razon: motivo })
@@ -332,7 +351,7 @@ async function rechazarCita(id, motivo) {
         if (response.ok) {
             alert("✓ Cita rechazada");
             loadPendingAppointments();
-            loadPendingCount();
+            loadDashboard();
         } else {
             alert("Error: " + (data.error || "No se pudo rechazar"));
         }
@@ -343,12 +362,75 @@ async function rechazarCita(id, motivo) {
     }
 }
 
+// Confirmar o rechazar todas las pendientes marcadas en una sola petición
+function crearBarraLote() {
+    const barra = document.createElement("div");
+    barra.style.display = "flex";
+    barra.style.gap = "10px";
+    barra.style.alignItems = "center";
+    barra.style.marginBottom = "10px";
+
+    barra.innerHTML = `
+        <label><input type="checkbox" id="seleccionar-todas"> Todas</label>
+        <button class="btn-confirmar" id="confirmar-lote">Confirmar seleccionadas</button>
+        <button class="btn-rechazar" id="rechazar-lote">Rechazar seleccionadas</button>
+    `;
+
+    barra.querySelector("#seleccionar-todas").addEventListener("change", e => {
+        document.querySelectorAll(".seleccion-lote").forEach(c => c.checked = e.target.checked);
+    });
+    barra.querySelector("#confirmar-lote").onclick = () => aplicarLote("confirmar");
+    barra.querySelector("#rechazar-lote").onclick = () => {
+        const motivo = prompt("Motivo del rechazo:");
+        if (motivo) aplicarLote("rechazar", motivo);
+    };
+
+    return barra;
+}
+
+async function aplicarLote(accion, razon) {
+    const ids = [...document.querySelectorAll(".seleccion-lote:checked")].map(c => Number(c.value));
+    if (ids.length === 0) {
+        alert("Selecciona al menos una cita");
+        return;
+    }
+
+    try {
+        const response = await fetchApi(`${window.API_URL}/citas/lote`, {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ acciones: ids.map(id => ({ id, accion, razon })) })
+        });
+
+        const data = await response.json();
+
+        if (!response.ok) {
+            alert("Error: " + (data.error || "No se pudieron aplicar los cambios"));
+            return;
+        }
+
+        const fallidas = data.resultados.filter(r => !r.ok);
+        if (fallidas.length === 0) {
+            alert(`✓ ${data.aplicadas} citas actualizadas`);
+        } else {
+            alert(`✓ ${data.aplicadas} citas actualizadas\n` +
+                  fallidas.map(r => `Cita ${r.id}: ${r.error}`).join("\n"));
+        }
+        loadPendingAppointments();
+        loadDashboard();
+
+    } catch (error) {
+        console.error("Error al aplicar el lote:", error);
+        alert("Error de conexión: " + error.message);
+    }
+}
+
 /* ==========================
    STAFF LIST
 ========================== */
 async function loadStaff() {
     try {
-        const response = await fetch(`${window.API_URL}/admin/staff`);
+        const response = await fetchApi(`${window.API_URL}/admin/staff`);
 
         if (!response.ok) throw new Error("Error en backend");
 
@@ -389,7 +471,7 @@ async function addStylist() {
     if (servicios.length === 0) return alert("Selecciona al menos un servicio");
 
     try {
-        const response = await fetch(`${window.API_URL}/admin/stylists/add`, {
+        const response = await fetchApi(`${window.API_URL}/admin/stylists/add`, {
             method: "POST",
             headers: { "Content-Type": "application/json" },
             body: JSON.stringify({ nombre: name, servicios: servicios })
@@ -414,7 +496,7 @@ async function addStylist() {
 ========================== */
 async function cargarEstilistas() {
     try {
-        const response = await fetch(`${window.API_URL}/admin/staff`);
+        const response = await fetchApi(`${window.API_URL}/admin/staff`);
         if (!response.ok) throw new Error("Error en backend");
 
         const staff = await response.json();
@@ -452,7 +534,7 @@ async function deleteStylist() {
     if (!confirm("¿Seguro que deseas eliminar este estilista?")) return;
 
     try {
-        const response = await fetch(`${window.API_URL}/admin/stylists/delete`, {
+        const response = await fetchApi(`${window.API_URL}/admin/stylists/delete`, {
             method: "POST",
             headers: { "Content-Type": "application/json" },
             body: JSON.stringify({ id: parseInt(id) })
@@ -475,7 +557,7 @@ async function deleteStylist() {
 =================================================== */
 async function loadBlockStylists() {
     try {
-        const response = await fetch(`${window.API_URL}/admin/staff`);
+        const response = await fetchApi(`${window.API_URL}/admin/staff`);
         const staff = await response.json();
         generateBlockCards(staff);
     } catch (error) {
@@ -550,7 +632,7 @@ function generateBlockCards(stylists) {
 
 async function mostrarBloqueos(estilistaId, container) {
     try {
-        const response = await fetch(`${window.API_URL}/bloqueos/${estilistaId}`);
+        const response = await fetchApi(`${window.API_URL}/bloqueos/${estilistaId}`);
         const bloqueos = await response.json();
 
         container.innerHTML = "";
@@ -601,7 +683,7 @@ async function mostrarBloqueos(estilistaId, container) {
 
 async function eliminarBloqueo(bloqueoId, estilistaId, container) {
     try {
-        const response = await fetch(`${window.API_URL}/bloqueos/${bloqueoId}`, {
+        const response = await fetchApi(`${window.API_URL}/bloqueos/${bloqueoId}`, {
             method: "DELETE"
         });
 
@@ -641,34 +723,22 @@ document.addEventListener("click", async (e) => {
     boton.textContent = "Guardando...";
 
     try {
-        if (day) {
-            await fetch(`${window.API_URL}/bloquear`, {
-                method: "POST",
-                headers: { "Content-Type": "application/json" },
-                body: JSON.stringify({
-                    id_estilista: parseInt(estilistaId),
-                    fecha: day,
-                    motivo: reason
-                })
-            });
-        }
+        // Un solo POST con el día suelto y/o el rango completo
+        const response = await fetchApi(`${window.API_URL}/bloquear`, {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({
+                id_estilista: parseInt(estilistaId),
+                fechas: day ? [day] : [],
+                desde: from && to ? from : null,
+                hasta: from && to ? to : null,
+                motivo: reason
+            })
+        });
 
-        if (from && to) {
-            const d1 = new Date(from);
-            const d2 = new Date(to);
-
-            for (let d = new Date(d1); d <= d2; d.setDate(d.getDate() + 1)) {
-                const fecha = d.toISOString().split("T")[0];
-                await fetch(`${window.API_URL}/bloquear`, {
-                    method: "POST",
-                    headers: { "Content-Type": "application/json" },
-                    body: JSON.stringify({
-                        id_estilista: parseInt(estilistaId),
-                        fecha,
-                        motivo: reason
-                    })
-                });
-            }
+        if (!response.ok) {
+            const data = await response.json();
+            throw new Error(data.error || "Error al bloquear");
         }
 
         alert("Bloqueo guardado ✓");
@@ -682,62 +752,70 @@ document.addEventListener("click", async (e) => {
     boton.textContent = "Bloquear";
 });
 
-loadTodayCount();
-
-async function loadTodayCount() {
+/* ==========================
+   DASHBOARD (TODAS LAS CIFRAS EN UNA PETICIÓN)
+========================== */
+async function loadDashboard() {
     try {
-        const res = await fetch(`${window.API_URL}/citas/hoy/count`);
+        const res = await fetchApi(`${window.API_URL}/admin/dashboard`);
         const data = await res.json();
 
-        const box = document.getElementById("today-count");
-
-        if (!box) {
-            console.error("No existe el contenedor #today-count");
-            return;
-        }
+        if (!res.ok) throw new Error(data.error || "Error en backend");
 
-        box.textContent = data.total;
+        document.getElementById("today-count").textContent = data.total;
+        document.getElementById("pendientes-count").textContent = data.total_pendientes;
+        document.getElementById("month-confirmed-count").textContent = data.total_confirmadas_mes;
+        document.getElementById("stat-sat").textContent = data.satisfaccion + "%";
 
     } catch (err) {
-        console.error("Error al cargar el total de citas hoy:", err);
+        console.error("Error al cargar el dashboard:", err);
     }
 }
 
-function loadPendingCount() {
-    fetch(`${window.API_URL}/citas/pendientes/count`)
-        .then(response => response.json())
-        .then(data => {
-            document.getElementById("pendientes-count").textContent = data.total_pendientes;
-        })
-        .catch(err => console.error("Error al cargar citas pendientes:", err));
+/* ==========================
+   CAMBIOS EN VIVO (SERVER-SENT EVENTS)
+========================== */
+const TIPOS_EVENTO = [
+    "cita_creada", "cita_confirmada", "cita_cancelada", "cita_eliminada",
+    "bloqueo_creado", "bloqueo_eliminado", "reconectado", "desincronizado"
+];
+let refrescoProgramado = null;
+
+// Varios eventos seguidos (un bloqueo de muchos días) se agrupan en un solo refresco
+function refrescarVistaActiva() {
+    clearTimeout(refrescoProgramado);
+    refrescoProgramado = setTimeout(() => {
+        if (document.getElementById("inicio").classList.contains("active")) {
+            loadDashboard();
+        }
+        if (document.getElementById("proximas").classList.contains("active")) {
+            loadPendingAppointments();
+        }
+    }, 500);
 }
 
-async function loadConfirmedMonthCount() {
-    try {
-        const res = await fetch(`${window.API_URL}/citas/confirmadas/mes/count`);
-        const data = await res.json();
-        document.getElementById("month-confirmed-count").textContent = data.total_confirmadas_mes;
-    } catch (err) {
-        console.error("Error al cargar citas confirmadas del mes:", err);
-    }
-}
+function escucharEventos() {
+    if (!window.EventSource) return;
 
-async function loadSatisfaccion() {
-    try {
-        const res = await fetch(`${window.API_URL}/estadisticas/satisfaccion`);
-        const data = await res.json();
-        document.getElementById("stat-sat").textContent = data.satisfaccion + "%";
-    } catch (err) {
-        console.error("Error al cargar satisfacción:", err);
-    }
+    const fuente = new EventSource(`${window.API_URL}/eventos`);
+    TIPOS_EVENTO.forEach(tipo => fuente.addEventListener(tipo, refrescarVistaActiva));
+
+    // Si el servidor no acepta más streams, se reintenta más tarde
+    fuente.onerror = () => {
+        if (fuente.readyState === EventSource.CLOSED) {
+            setTimeout(escucharEventos, 30000);
+        }
+    };
 }
 
+escucharEventos();
+
 /* ==========================
    CARGAR SERVICIOS PARA AÑADIR ESTILISTA
 ========================== */
 async function cargarServiciosParaEstilista() {
     try {
-        const response = await fetch(`${window.API_URL}/servicios`);
+        const response = await fetchApi(`${window.API_URL}/servicios`);
         const servicios = await response.json();
 
         const container = document.getElementById("servicios-estilista");
@@ -116,7 +116,7 @@ loginSubmit.addEventListener("click", () => {
         return;
     }
 
-    fetch(`${window.API_URL}/login`, {
+    fetchApi(`${window.API_URL}/login`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ telefono, contrasena })
@@ -133,6 +133,7 @@ loginSubmit.addEventListener("click", () => {
             name: data.nombre,
             phone: data.telefono
         };
+        guardarSesion(data.token);
 
         updateUserUI();
         loginModal.classList.remove("show");
@@ -178,12 +179,15 @@ registerSubmit.addEventListener("click", () => {
         return;
     }
 
-    fetch(`${window.API_URL}/registro`, {
+    fetchApi(`${window.API_URL}/registro`, {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: { "Content-Type": "application/json", "Idempotency-Key": claveIdempotencia("registro") },
         body: JSON.stringify({ nombre, telefono, contrasena })
     })
-    .then(res => res.json())
+    .then(res => {
+        descartarClave("registro");
+        return res.json();
+    })
     .then(data => {
         if (data.error) {
             alert("❌ " + data.error);
@@ -204,6 +208,7 @@ registerSubmit.addEventListener("click", () => {
 
 logoutBtn.addEventListener("click", () => {
     currentUser = null;
+    guardarSesion(null);
     updateUserUI();
     document.getElementById("admin-btn").style.display = "none";
     alert("✅ Sesión cerrada");
@@ -231,7 +236,7 @@ const servicioSelect = document.getElementById("servicio1");
 const estilistaSelect = document.getElementById("estilista");
 
 async function cargarServicios() {
-    const res = await fetch(`${window.API_URL}/servicios`);
+    const res = await fetchApi(`${window.API_URL}/servicios`);
     const servicios = await res.json();
 
     servicioSelect.innerHTML = "<option value=''>Selecciona un servicio...</option>";
@@ -249,7 +254,7 @@ servicioSelect.addEventListener("change", async () => {
     if (!servicioElegido) return;
 
     try {
-        const res = await fetch(`${window.API_URL}/estilistas/por-servicio/${encodeURIComponent(servicioElegido)}`);
+        const res = await fetchApi(`${window.API_URL}/estilistas/por-servicio/${encodeURIComponent(servicioElegido)}`);
         const estilistas = await res.json();
 
         if (estilistas.length === 0) {
@@ -265,6 +270,24 @@ servicioSelect.addEventListener("change", async () => {
     }
 });
 
+// Idempotency-Key por formulario: si el envío no obtuvo respuesta (red
+// caída, timeout) el siguiente intento reusa la clave y el servidor
+// devuelve la respuesta original en lugar de crear otra cita o usuario
+const clavesIdempotencia = {};
+
+function claveIdempotencia(formulario) {
+    if (!clavesIdempotencia[formulario]) {
+        clavesIdempotencia[formulario] = window.crypto && crypto.randomUUID
+            ? crypto.randomUUID()
+            : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+    }
+    return clavesIdempotencia[formulario];
+}
+
+function descartarClave(formulario) {
+    delete clavesIdempotencia[formulario];
+}
+
 /* ============================================
    AGENDAR CITA CON VALIDACIONES
 ============================================ */
@@ -298,11 +321,12 @@ async function bookAppointment(event) {
         notas: document.getElementById("book-notes").value,
     };
 
-    const res = await fetch(`${window.API_URL}/agendar`, {
+    const res = await fetchApi(`${window.API_URL}/agendar`, {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: conSesion({ "Content-Type": "application/json", "Idempotency-Key": claveIdempotencia("agendar") }),
         body: JSON.stringify(cita)
     });
+    descartarClave("agendar");
 
     const data = await res.json();
 
@@ -311,6 +335,8 @@ async function bookAppointment(event) {
         return;
     }
 
+    disponibilidadCache.clear();
+
     alert("✅ Cita agendada correctamente. Espera confirmación del salón.");
     showView("appointments");
     cargarCitas();
@@ -319,11 +345,11 @@ async function bookAppointment(event) {
 /* ============================================
    RENDERIZAR CITAS
 ============================================ */
-function renderAppointments(telefono, appointments) {
+function renderAppointments(telefono, appointments, agregar = false) {
     const container = document.getElementById("appointments-list");
-    container.innerHTML = "";
+    if (!agregar) container.innerHTML = "";
 
-    if (!Array.isArray(appointments) || appointments.length === 0) {
+    if (!agregar && (!Array.isArray(appointments) || appointments.length === 0)) {
         container.innerHTML = "<p>No tienes citas agendadas.</p>";
         return;
     }
@@ -368,8 +394,54 @@ function establecerFechaMinima() {
     }
 }
 
+function formatearFecha(d) {
+    const yyyy = d.getFullYear();
+    const mm = String(d.getMonth() + 1).padStart(2, '0');
+    const dd = String(d.getDate()).padStart(2, '0');
+    return `${yyyy}-${mm}-${dd}`;
+}
+
+// Disponibilidad precargada por estilista, servicio (los horarios dependen
+// de su duración) y fecha; se pide una semana a la vez
+const DIAS_PRECARGA = 7;
+const DISPONIBILIDAD_TTL_MS = 60 * 1000;
+const disponibilidadCache = new Map();
+
+async function obtenerDisponibilidad(estilista, servicio, fecha) {
+    const clave = `${estilista}|${servicio}|${fecha}`;
+    const guardado = disponibilidadCache.get(clave);
+    if (guardado && Date.now() - guardado.t < DISPONIBILIDAD_TTL_MS) {
+        return guardado.dia;
+    }
+
+    const hasta = new Date(`${fecha}T00:00:00`);
+    hasta.setDate(hasta.getDate() + DIAS_PRECARGA - 1);
+
+    const res = await fetchApi(`${window.API_URL}/disponibilidad/${estilista}?desde=${fecha}&hasta=${formatearFecha(hasta)}&servicio=${encodeURIComponent(servicio)}`);
+    const dias = await res.json();
+
+    if (!Array.isArray(dias)) {
+        throw new Error(dias.error || "Respuesta inválida");
+    }
+
+    const t = Date.now();
+    dias.forEach(dia => disponibilidadCache.set(`${estilista}|${servicio}|${dia.fecha}`, { dia, t }));
+
+    return dias[0];
+}
+
+// Al volver a la pestaña se descarta lo guardado y se vuelve a pedir el día
+// que se está mostrando, por si alguien reservó mientras tanto. No se abre
+// un stream de /eventos por cliente: cada uno ocuparía un hilo del servidor.
+document.addEventListener("visibilitychange", () => {
+    if (document.visibilityState !== "visible") return;
+    disponibilidadCache.clear();
+    cargarHorariosDisponibles();
+});
+
 async function cargarHorariosDisponibles() {
     const estilista = document.getElementById("estilista").value;
+    const servicio = document.getElementById("servicio1").value;
     const fecha = document.getElementById("book-date").value;
     const selectHora = document.getElementById("book-time");
     const inputFecha = document.getElementById("book-date");
@@ -380,12 +452,11 @@ async function cargarHorariosDisponibles() {
     }
 
     try {
-        // Obtener horarios bloqueados
-        const resBloqueados = await fetch(`${window.API_URL}/horarios_bloqueados/${estilista}/${fecha}`);
-        const bloqueados = await resBloqueados.json();
+        // Bloqueos, horarios ocupados y libres en una sola petición
+        const disponibilidad = await obtenerDisponibilidad(estilista, servicio, fecha);
 
         // Verificar si el día está completamente bloqueado
-        if (bloqueados.length > 0) {
+        if (disponibilidad.bloqueado) {
             selectHora.innerHTML = '<option value="">Este día no está disponible</option>';
             selectHora.disabled = true;
             
@@ -404,20 +475,12 @@ async function cargarHorariosDisponibles() {
             }
         }
 
-        // Obtener horarios ocupados
-        const resOcupados = await fetch(`${window.API_URL}/horarios_ocupados/${estilista}/${fecha}`);
-        const ocupados = await resOcupados.json();
-
-        const todosHorarios = [
-            "09:00", "10:00", "11:00", "12:00", 
-            "13:00", "14:00", "15:00", "16:00", 
-            "17:00", "18:00"
-        ];
+        const ocupados = disponibilidad.ocupados;
 
         selectHora.innerHTML = '<option value="">Selecciona un horario</option>';
         selectHora.disabled = false;
 
-        todosHorarios.forEach(hora => {
+        disponibilidad.horarios.forEach(hora => {
             const horaFormato12 = convertirA12Horas(hora);
             const estaOcupado = ocupados.includes(hora);
             
@@ -582,7 +645,7 @@ createShapes();
 
 cargarServicios();
 
-async function cargarCitas() {
+async function cargarCitas(cursor = null) {
     if (!currentUser || !currentUser.phone) {
         console.warn("No hay usuario logeado");
         return;
@@ -591,7 +654,12 @@ async function cargarCitas() {
     const telefono = currentUser.phone;
     
     try {
-        const resp = await fetch(`${window.API_URL}/citas_usuario/${telefono}`);
+        const url = `${window.API_URL}/mis_citas` + (cursor ? `?cursor=${cursor}` : "");
+        const resp = await fetchApi(url, { headers: conSesion() });
+        if (resp.status === 401) {
+            cerrarSesionExpirada();
+            return;
+        }
         const data = await resp.json();
         
         if (!Array.isArray(data)) {
@@ -599,7 +667,18 @@ async function cargarCitas() {
             return;
         }
         
-        renderAppointments(telefono, data);
+        document.getElementById("ver-mas-citas")?.remove();
+        renderAppointments(telefono, data, cursor !== null);
+
+        // El historial llega por páginas; ofrecer la siguiente si existe
+        const siguiente = resp.headers.get("X-Siguiente-Cursor");
+        if (siguiente) {
+            const boton = document.createElement("button");
+            boton.id = "ver-mas-citas";
+            boton.textContent = "Ver más";
+            boton.addEventListener("click", () => cargarCitas(siguiente));
+            document.getElementById("appointments-list").appendChild(boton);
+        }
     } catch (err) {
         console.error("Error cargando citas:", err);
     }
@@ -686,6 +765,34 @@ function toggleAdminNavbar(phone) {
     }
 }
 
+function cerrarSesionExpirada() {
+    currentUser = null;
+    guardarSesion(null);
+    updateUserUI();
+    toggleAdminNavbar(null);
+    alert("Tu sesión expiró, inicia sesión de nuevo");
+}
+
+// Retoma la sesión guardada sin volver a pedir la contraseña
+async function restaurarSesion() {
+    if (!conSesion().Authorization) return;
+    try {
+        const resp = await fetchApi(`${window.API_URL}/sesion`, { headers: conSesion() });
+        if (!resp.ok) {
+            guardarSesion(null);
+            return;
+        }
+        const data = await resp.json();
+        currentUser = { id: data.id, name: data.nombre, phone: data.telefono };
+        updateUserUI();
+        toggleAdminNavbar(data.telefono);
+        cargarCitas();
+    } catch (err) {
+        console.error("Error retomando la sesión:", err);
+    }
+}
+
 window.onload = () => {
     updateUserUI();
+    restaurarSesion();
 };
@@ -3,3 +3,50 @@
 const API_URL = "https://beautyweb-3.onrender.com";
 
 window.API_URL = API_URL;
+
+// Posición de la última escritura que hizo esta página (X-Posicion-Escritura).
+// Las lecturas de lo propio la mandan como ?posicion= para que el backend no
+// las sirva desde una réplica que todavía no tiene ese cambio. El catálogo
+// (/servicios, /estilistas, /disponibilidad) no la lleva: es público y se
+// cachea por URL.
+let posicionEscritura = null;
+const RUTAS_CON_POSICION = ["/mis_citas", "/citas_usuario/", "/citas/", "/bloqueos/", "/admin/", "/estadisticas/"];
+
+function leeLoPropio(url) {
+    const ruta = new URL(url, window.location.href).pathname;
+    return RUTAS_CON_POSICION.some(prefijo => ruta.startsWith(prefijo));
+}
+
+async function fetchApi(url, opciones = {}) {
+    const metodo = (opciones.method || "GET").toUpperCase();
+    if (metodo === "GET" && posicionEscritura && leeLoPropio(url)) {
+        url += (url.includes("?") ? "&" : "?") + `posicion=${encodeURIComponent(posicionEscritura)}`;
+    }
+
+    const respuesta = await fetch(url, opciones);
+
+    const posicion = respuesta.headers.get("X-Posicion-Escritura");
+    if (posicion) posicionEscritura = posicion;
+
+    return respuesta;
+}
+
+window.fetchApi = fetchApi;
+
+// Token de sesión firmado que entrega /login. Se guarda para no repetir el
+// login (bcrypt) al recargar y solo se manda a las rutas que lo usan, para
+// no agregar un preflight de CORS a todas las demás.
+let tokenSesion = localStorage.getItem("tokenSesion");
+
+function guardarSesion(token) {
+    tokenSesion = token;
+    if (token) localStorage.setItem("tokenSesion", token);
+    else localStorage.removeItem("tokenSesion");
+}
+
+function conSesion(headers = {}) {
+    return tokenSesion ? { ...headers, Authorization: `Bearer ${tokenSesion}` } : headers;
+}
+
+window.guardarSesion = guardarSesion;
+window.conSesion = conSesion;
@@ -0,0 +1,231 @@
+"""Arma Frontend/dist para servir el sitio estático.
+
+Uso:
+    pip install -r requirements.txt
+    python construir.py                  genera dist/
+    python construir.py --salida /ruta   en otro directorio
+
+Las imágenes de imagenes/ se reducen a varios anchos en AVIF, WebP y un
+respaldo (JPEG, o PNG si tienen transparencia). Los <img> de los HTML se
+reescriben a <picture> con srcset, tamaño intrínseco y carga diferida:
+el atributo sizes del <img> original indica el ancho con el que se
+muestra y loading="eager" marca las que van arriba en la página.
+
+Imágenes, CSS y JS quedan en assets/ con el hash del contenido en el
+nombre, así que se pueden cachear un año (ver el _headers generado, con
+el formato de Netlify / Cloudflare Pages); los HTML conservan su nombre
+y se revalidan siempre. Junto a cada archivo de texto se deja su versión
+.gz y, si está instalado el módulo brotli, .br.
+"""
+import argparse
+import gzip
+import hashlib
+import html
+import io
+import re
+import shutil
+import sys
+import unicodedata
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from PIL import Image, features
+
+RAIZ = Path(__file__).resolve().parent
+IMAGENES = "imagenes"
+HTML = ("index.html", "admin.html", "admin1.html")
+# En orden: los que se reescriben primero pueden ser referenciados por los siguientes
+TEXTOS = ("styles.css", "stylesAdmin.css", "config.js", "app.js", "admin.js")
+
+# Anchos (px) que se generan de cada imagen; nunca más que el original
+ANCHOS = (320, 640, 960)
+CALIDAD = {"AVIF": 50, "WEBP": 75, "JPEG": 80}
+SIZES_DEFAULT = "100vw"
+COMPRIMIBLES = (".html", ".css", ".js", ".svg", ".json")
+
+CABECERAS = """\
+/assets/*
+  Cache-Control: public, max-age=31536000, immutable
+
+/*.html
+  Cache-Control: no-cache
+
+/
+  Cache-Control: no-cache
+"""
+
+
+def _slug(nombre):
+    """Nombre de archivo ASCII (uñas -> unas) para no depender de cómo se codifique la URL"""
+    ascii_ = unicodedata.normalize("NFKD", nombre).encode("ascii", "ignore").decode()
+    return re.sub(r"[^A-Za-z0-9_-]+", "-", ascii_).strip("-").lower()
+
+
+def _con_hash(salida, nombre, extension, contenido):
+    """Escribe contenido en assets/nombre.<hash>.extension y devuelve su URL relativa"""
+    huella = hashlib.sha256(contenido).hexdigest()[:10]
+    ruta = f"assets/{nombre}.{huella}.{extension}"
+    destino = salida / ruta
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    destino.write_bytes(contenido)
+    return ruta
+
+
+def _tiene_transparencia(imagen):
+    if imagen.mode in ("RGBA", "LA"):
+        return imagen.getchannel("A").getextrema()[0] < 255
+    return imagen.mode == "P" and "transparency" in imagen.info
+
+
+def _codificar(imagen, formato):
+    buffer = io.BytesIO()
+    opciones = {"quality": CALIDAD[formato]} if formato in CALIDAD else {"optimize": True}
+    if formato == "JPEG":
+        opciones.update(optimize=True, progressive=True)
+    imagen.save(buffer, formato, **opciones)
+    return buffer.getvalue()
+
+
+def procesar_imagenes(salida):
+    """Genera las variantes y devuelve {ruta original: datos para el <picture>}"""
+    formatos = ["WEBP"]
+    if features.check("avif"):
+        formatos.insert(0, "AVIF")
+    else:
+        print("Aviso: esta instalación de Pillow no soporta AVIF; solo se genera WebP", file=sys.stderr)
+
+    variantes = {}
+    for archivo in sorted((RAIZ / IMAGENES).iterdir()):
+        if archivo.suffix.lower() not in (".png", ".jpg", ".jpeg", ".webp"):
+            continue
+        with Image.open(archivo) as original:
+            original.load()
+        transparente = _tiene_transparencia(original)
+        original = original.convert("RGBA" if transparente else "RGB")
+        respaldo = "PNG" if transparente else "JPEG"
+
+        ancho, alto = original.size
+        anchos = sorted({a for a in ANCHOS if a < ancho} | {min(ancho, ANCHOS[-1])})
+        nombre = _slug(archivo.stem)
+
+        fuentes = {formato: [] for formato in formatos + [respaldo]}
+        for a in anchos:
+            reducida = original if a == ancho else original.resize(
+                (a, round(alto * a / ancho)), Image.Resampling.LANCZOS
+            )
+            for formato in fuentes:
+                extension = {"JPEG": "jpg"}.get(formato, formato.lower())
+                url = _con_hash(salida, f"{nombre}-{a}", extension, _codificar(reducida, formato))
+                fuentes[formato].append((a, url))
+
+        variantes[f"{IMAGENES}/{archivo.name}"] = {
+            "fuentes": {f: fuentes[f] for f in formatos},
+            "respaldo": fuentes[respaldo],
+            "ancho": anchos[-1],
+            "alto": round(alto * anchos[-1] / ancho),
+            "bytes_original": archivo.stat().st_size,
+        }
+    return variantes
+
+
+def _srcset(fuentes):
+    return ", ".join(f"{url} {a}w" for a, url in fuentes)
+
+
+_ATRIBUTO = re.compile(r'([\w-]+)(?:\s*=\s*"([^"]*)")?')
+
+
+def _picture(etiqueta, variantes):
+    """Reescribe un <img> a <picture>; lo deja igual si no es de imagenes/"""
+    atributos = dict(_ATRIBUTO.findall(etiqueta[len("<img"):].rstrip("/>")))
+    datos = variantes.get(html.unescape(atributos.get("src", "")))
+    if datos is None:
+        return etiqueta
+
+    sizes = atributos.pop("sizes", SIZES_DEFAULT)
+    atributos.pop("src")
+    atributos.setdefault("loading", "lazy")
+    atributos.setdefault("decoding", "async")
+    atributos.setdefault("width", str(datos["ancho"]))
+    atributos.setdefault("height", str(datos["alto"]))
+
+    tipos = {"AVIF": "image/avif", "WEBP": "image/webp"}
+    fuentes = "".join(
+        f'<source type="{tipos[formato]}" srcset="{_srcset(lista)}" sizes="{sizes}">'
+        for formato, lista in datos["fuentes"].items()
+    )
+    resto = " ".join(f'{k}="{v}"' for k, v in atributos.items())
+    img = (f'<img src="{datos["respaldo"][-1][1]}" srcset="{_srcset(datos["respaldo"])}" '
+           f'sizes="{sizes}" {resto}>')
+    return f"<picture>{fuentes}{img}</picture>"
+
+
+def _reemplazar_rutas(texto, rutas):
+    for original, nueva in rutas.items():
+        texto = re.sub(rf'(["\'(]){re.escape(original)}(["\')])', rf"\g<1>{nueva}\g<2>", texto)
+    return texto
+
+
+def precomprimir(salida):
+    if brotli is None:
+        print("Aviso: el módulo brotli no está instalado; solo se genera .gz", file=sys.stderr)
+    for archivo in sorted(salida.rglob("*")):
+        if archivo.suffix not in COMPRIMIBLES:
+            continue
+        datos = archivo.read_bytes()
+        comprimidos = {".gz": gzip.compress(datos, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            comprimidos[".br"] = brotli.compress(datos, quality=11)
+        for extension, contenido in comprimidos.items():
+            if len(contenido) < len(datos):
+                archivo.with_name(archivo.name + extension).write_bytes(contenido)
+
+
+def construir(salida):
+    if salida.exists():
+        shutil.rmtree(salida)
+    salida.mkdir(parents=True)
+
+    variantes = procesar_imagenes(salida)
+    # Las referencias sueltas (CSS, JS) no tienen srcset: van al respaldo más
+    # chico, que alcanza para el único caso que hay (el avatar de ~50 px)
+    rutas = {original: datos["respaldo"][0][1] for original, datos in variantes.items()}
+
+    for nombre in TEXTOS:
+        archivo = RAIZ / nombre
+        texto = _reemplazar_rutas(archivo.read_text(encoding="utf-8"), rutas)
+        rutas[nombre] = _con_hash(salida, archivo.stem, archivo.suffix[1:], texto.encode("utf-8"))
+
+    for nombre in HTML:
+        texto = (RAIZ / nombre).read_text(encoding="utf-8")
+        texto = re.sub(r"<img\b[^>]*>", lambda m: _picture(m.group(0), variantes), texto)
+        texto = _reemplazar_rutas(texto, rutas)
+        (salida / nombre).write_text(texto, encoding="utf-8")
+
+    (salida / "_headers").write_text(CABECERAS, encoding="utf-8")
+    precomprimir(salida)
+
+    antes = sum(d["bytes_original"] for d in variantes.values())
+    for formato in ("AVIF", "WEBP"):
+        tamanos = [
+            (salida / datos["fuentes"][formato][-1][1]).stat().st_size
+            for datos in variantes.values() if formato in datos["fuentes"]
+        ]
+        if tamanos:
+            print(f"{formato}: {antes / 1024:.0f} KB -> {sum(tamanos) / 1024:.0f} KB (ancho mayor de cada imagen)")
+    print(f"Sitio generado en {salida}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Arma el sitio estático optimizado")
+    parser.add_argument("--salida", type=Path, default=RAIZ / "dist")
+    args = parser.parse_args()
+    construir(args.salida.resolve())
+
+
+if __name__ == "__main__":
+    main()